@@ -6,6 +6,16 @@ class Settings(BaseSettings):
     # Não manter credenciais hardcoded no repositório.
     DATABASE_URL: str | None = None
     DATABASE_PUBLIC_URL: str | None = None
+    # Réplica de leitura opcional (métricas/relatórios). Sem ela, leituras usam o primário em modo READ ONLY.
+    DATABASE_REPLICA_URL: str | None = None
+    # Conexões por processo (cada worker tem os seus pools): primário + pool de leitura devem caber,
+    # multiplicados pelo número de workers, no max_connections do Postgres hospedado.
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 5
+    DB_READONLY_POOL_SIZE: int = 3
+    DB_READONLY_MAX_OVERFLOW: int = 2
+    # Conexões abertas no startup (não o pool inteiro)
+    DB_POOL_WARM: int = 2
     JWT_SECRET: str = "a_very_secret_key_that_should_be_changed"
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
@@ -46,4 +56,12 @@ class Settings(BaseSettings):
         else:
             self.DATABASE_URL = db_url
 
+        replica_url = os.getenv("DATABASE_REPLICA_URL") or self.DATABASE_REPLICA_URL
+        if replica_url:
+            if replica_url.startswith("postgresql://"):
+                replica_url = replica_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+            elif replica_url.startswith("postgres://"):
+                replica_url = replica_url.replace("postgres://", "postgresql+asyncpg://", 1)
+        self.DATABASE_REPLICA_URL = replica_url or self.DATABASE_URL
+
 settings = Settings()
@@ -9,7 +9,8 @@ from sqlalchemy import select
 
 from app.core.config import settings
 from app.core.security import verify_password
-from app.db.database import get_db_session
+from app.core.tenant_cache import TenantInfo, get_tenant_by_id, get_tenant_by_slug
+from app.db.database import get_db_session, get_readonly_db_session
 from app.db.models import User, Tenant
 
 
@@ -25,6 +26,19 @@ async def get_current_user(
     db: AsyncSession = Depends(get_db_session),
 ) -> User:
     """Decodifica o JWT e retorna o usuário atual (admin ou funcionário)."""
+    return await _usuario_do_token(token, db)
+
+
+async def get_current_user_readonly(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    db: AsyncSession = Depends(get_readonly_db_session),
+) -> User:
+    """Como get_current_user, mas pela sessão somente leitura (a mesma do endpoint de métricas):
+    a requisição não segura uma conexão do pool primário."""
+    return await _usuario_do_token(token, db)
+
+
+async def _usuario_do_token(token: str, db: AsyncSession) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -92,6 +106,23 @@ async def get_tenant_id(
 
     Fase 1 (compatível): se header não vier ou for inválido, cai para o primeiro tenant do banco.
     """
+    return await _resolver_tenant_id(db, x_tenant_id, x_tenant_slug)
+
+
+async def get_tenant_id_readonly(
+    db: AsyncSession = Depends(get_readonly_db_session),
+    x_tenant_id: str | None = Header(default=None, alias="X-Tenant-Id"),
+    x_tenant_slug: str | None = Header(default=None, alias="X-Tenant-Slug"),
+) -> uuid.UUID:
+    """Como get_tenant_id, mas pela sessão somente leitura (endpoints de métricas)."""
+    return await _resolver_tenant_id(db, x_tenant_id, x_tenant_slug)
+
+
+async def _resolver_tenant_id(
+    db: AsyncSession,
+    x_tenant_id: str | None,
+    x_tenant_slug: str | None,
+) -> uuid.UUID:
     if x_tenant_id:
         try:
             tid = uuid.UUID(x_tenant_id)
@@ -103,8 +134,7 @@ async def get_tenant_id(
     if x_tenant_slug:
         slug = (x_tenant_slug or "").strip().lower()
         if slug:
-            result_slug = await db.execute(select(Tenant).where(Tenant.slug == slug, Tenant.ativo == True))
-            tenant_slug_obj = result_slug.scalars().first()
+            tenant_slug_obj = await get_tenant_by_slug(db, slug)
             if tenant_slug_obj and tenant_slug_obj.id != DEFAULT_TECH_TENANT_ID:
                 return tenant_slug_obj.id
 
@@ -122,3 +152,17 @@ async def get_tenant_id(
         raise HTTPException(status_code=500, detail="Nenhum tenant configurado")
 
     return tenant.id
+
+
+async def get_tenant(
+    db: AsyncSession = Depends(get_db_session),
+    tenant_id: uuid.UUID = Depends(get_tenant_id),
+) -> TenantInfo:
+    """Tenant atual (id, tipo_negocio, ativo) pelo cache de tenants: sem SELECT enquanto em cache.
+
+    Um X-Tenant-Id sem tenant no banco resolve como mercearia, como o menu público já fazia.
+    """
+    tenant = await get_tenant_by_id(db, tenant_id)
+    if tenant is None:
+        return TenantInfo(id=tenant_id, tipo_negocio="mercearia", ativo=True)
+    return tenant
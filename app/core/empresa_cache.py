@@ -0,0 +1,31 @@
+import uuid
+from time import monotonic
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import EmpresaConfig
+
+# Cabeçalho dos relatórios (nome, NUIT, contactos) por tenant: muda raramente e cada PDF o consultava.
+# O PUT /api/config/empresa chama empresa_cache_invalidate(tenant_id).
+_EMPRESA_CACHE_TTL_SECONDS = 60.0
+_EMPRESA_CACHE: dict[uuid.UUID, tuple[float, Optional[EmpresaConfig]]] = {}
+
+
+async def get_empresa_config_cached(db: AsyncSession, tenant_id: uuid.UUID) -> Optional[EmpresaConfig]:
+    """EmpresaConfig do tenant (ou None se ainda não configurada), com TTL curto.
+
+    A instância fica desanexada da sessão; os relatórios só leem colunas já carregadas.
+    """
+    entry = _EMPRESA_CACHE.get(tenant_id)
+    if entry and entry[0] > monotonic():
+        return entry[1]
+    res = await db.execute(select(EmpresaConfig).where(EmpresaConfig.tenant_id == tenant_id).limit(1))
+    empresa = res.scalar_one_or_none()
+    _EMPRESA_CACHE[tenant_id] = (monotonic() + _EMPRESA_CACHE_TTL_SECONDS, empresa)
+    return empresa
+
+
+def empresa_cache_invalidate(tenant_id: uuid.UUID) -> None:
+    _EMPRESA_CACHE.pop(tenant_id, None)
@@ -0,0 +1,38 @@
+import os
+import uuid
+from functools import lru_cache
+
+# Buffer de bytes aleatórios compartilhado: um os.urandom(4096) serve 256 UUIDs
+# em vez de uma chamada ao sistema por uuid4().
+_URANDOM_BUF_SIZE = 4096
+_urandom_buf = bytearray()
+
+
+def new_uuid() -> uuid.UUID:
+    """UUID versão 4 equivalente a uuid.uuid4(), com a entropia lida em lotes."""
+    global _urandom_buf
+    if len(_urandom_buf) < 16:
+        _urandom_buf = bytearray(os.urandom(_URANDOM_BUF_SIZE))
+    b = bytes(_urandom_buf[-16:])
+    del _urandom_buf[-16:]
+    return uuid.UUID(bytes=b, version=4)
+
+
+@lru_cache(maxsize=4096)
+def parse_uuid(value: str) -> uuid.UUID:
+    """uuid.UUID(value) com cache: o PDV faz polling e sync repetidos dos mesmos ids.
+
+    O driver (asyncpg) já devolve uuid.UUID nativo; o custo que sobra é o parse das strings
+    recebidas nas rotas. Levanta ValueError para valores inválidos, como uuid.UUID.
+    """
+    return uuid.UUID(value)
+
+
+def _reset_buffer() -> None:
+    global _urandom_buf
+    _urandom_buf = bytearray()
+
+
+# Workers (gunicorn) não podem herdar o mesmo buffer do processo pai: geraria UUIDs repetidos.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_buffer)
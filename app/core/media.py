@@ -0,0 +1,40 @@
+import asyncio
+import os
+from time import monotonic
+
+# Listagem de diretórios de mídia em cache: o menu público testa a existência da imagem de cada
+# produto, e um os.listdir por diretório (a cada poucos segundos) substitui um stat por arquivo.
+_DIR_CACHE: dict[str, tuple[float, frozenset[str]]] = {}
+_DIR_CACHE_TTL_SECONDS = 10.0
+
+
+def listar_arquivos(abs_dir: str) -> frozenset[str]:
+    """Nomes dos arquivos em `abs_dir` (vazio se o diretório não existir), com TTL curto."""
+    entry = _DIR_CACHE.get(abs_dir)
+    agora = monotonic()
+    if entry and entry[0] > agora:
+        return entry[1]
+    try:
+        nomes = frozenset(os.listdir(abs_dir))
+    except OSError:
+        nomes = frozenset()
+    _DIR_CACHE[abs_dir] = (agora + _DIR_CACHE_TTL_SECONDS, nomes)
+    return nomes
+
+
+async def carregar_listagens(dirs) -> None:
+    """Garante em cache a listagem de cada diretório; os.listdir roda em thread, fora do event loop
+    (o volume de mídia pode ser um disco de rede)."""
+    agora = monotonic()
+    pendentes = [d for d in set(dirs) if not ((e := _DIR_CACHE.get(d)) and e[0] > agora)]
+    if pendentes:
+        await asyncio.gather(*(asyncio.to_thread(listar_arquivos, d) for d in pendentes))
+
+
+def arquivo_existe(abs_path: str) -> bool:
+    d, nome = os.path.split(abs_path)
+    return nome in listar_arquivos(d)
+
+
+def invalidar_listagem(abs_dir: str) -> None:
+    _DIR_CACHE.pop(abs_dir, None)
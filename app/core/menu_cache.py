@@ -0,0 +1,45 @@
+import hashlib
+import uuid
+from time import monotonic
+from typing import Optional
+
+# Menu público já serializado (bytes JSON) por (tenant, versão, termo de busca). Toda mutação de
+# produto (routers/produtos.py) ou de tenant chama menu_cache_invalidate(); vendas alteram estoque
+# sem invalidar, então o TTL curto limita por quanto tempo o estoque exibido pode ficar defasado.
+# Cada entrada guarda também o ETag do corpo, calculado uma vez na gravação.
+_MENU_CACHE: dict[tuple, tuple[float, bytes, str]] = {}
+_MENU_CACHE_VER: dict[uuid.UUID, int] = {}
+_MENU_CACHE_TTL_SECONDS = 15.0
+_MENU_CACHE_MAX = 512
+
+
+def menu_cache_key(tenant_id: uuid.UUID, q: Optional[str]) -> tuple:
+    return (tenant_id, _MENU_CACHE_VER.get(tenant_id, 0), (q or "").strip())
+
+
+def _menu_etag(body: bytes) -> str:
+    return 'W/"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+
+def menu_cache_get(key: tuple) -> Optional[tuple[bytes, str]]:
+    """(corpo, etag) em cache para a chave, ou None."""
+    entry = _MENU_CACHE.get(key)
+    if entry and entry[0] > monotonic():
+        return entry[1], entry[2]
+    return None
+
+
+def menu_cache_set(key: tuple, body: bytes) -> str:
+    if len(_MENU_CACHE) >= _MENU_CACHE_MAX:
+        agora = monotonic()
+        for k in [k for k, (exp, _, _) in _MENU_CACHE.items() if exp <= agora]:
+            _MENU_CACHE.pop(k, None)
+        if len(_MENU_CACHE) >= _MENU_CACHE_MAX:
+            _MENU_CACHE.clear()
+    etag = _menu_etag(body)
+    _MENU_CACHE[key] = (monotonic() + _MENU_CACHE_TTL_SECONDS, body, etag)
+    return etag
+
+
+def menu_cache_invalidate(tenant_id: uuid.UUID) -> None:
+    _MENU_CACHE_VER[tenant_id] = _MENU_CACHE_VER.get(tenant_id, 0) + 1
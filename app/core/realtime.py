@@ -1,12 +1,19 @@
-from typing import Dict, Set, Any
+from typing import Dict, Set, Any, List, Optional
 from fastapi import WebSocket
 from asyncio import Lock
+import asyncio
 import json
 
+# Máximo de eventos drenados da fila por rodada do pump
+_BATCH_MAX = 128
+
+
 class ConnectionManager:
     def __init__(self) -> None:
         self.active_connections: Set[WebSocket] = set()
         self._lock = Lock()
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._pump_task: Optional[asyncio.Task] = None
 
     async def connect(self, websocket: WebSocket) -> None:
         await websocket.accept()
@@ -18,19 +25,53 @@ class ConnectionManager:
             if websocket in self.active_connections:
                 self.active_connections.remove(websocket)
 
-    async def broadcast(self, event_type: str, payload: Dict[str, Any]) -> None:
-        message = json.dumps({
+    @staticmethod
+    def _encode(event_type: str, payload: Dict[str, Any]) -> str:
+        return json.dumps({
             "type": event_type,
             "ts": payload.get("ts"),
             "data": payload.get("data", payload),
             "source": "server",
             "version": 1,
         }, ensure_ascii=False)
+
+    async def broadcast(self, event_type: str, payload: Dict[str, Any]) -> None:
+        await self._send_many([self._encode(event_type, payload)])
+
+    def enqueue(self, event_type: str, payload: Dict[str, Any]) -> None:
+        """Agenda o broadcast sem bloquear a requisição; o pump envia em lotes em segundo plano."""
+        self._queue.put_nowait(self._encode(event_type, payload))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.get_running_loop().create_task(self._pump())
+
+    async def stop(self) -> None:
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            try:
+                await self._pump_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._pump_task = None
+
+    async def _pump(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < _BATCH_MAX and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._send_many(batch)
+            except Exception:
+                pass
+
+    async def _send_many(self, messages: List[str]) -> None:
+        # Um frame por evento (o protocolo dos clientes não muda); o lock e a varredura das
+        # conexões são pagos uma vez por lote.
         dead: Set[WebSocket] = set()
         async with self._lock:
             for ws in self.active_connections:
                 try:
-                    await ws.send_text(message)
+                    for message in messages:
+                        await ws.send_text(message)
                 except Exception:
                     dead.add(ws)
             for ws in dead:
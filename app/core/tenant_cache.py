@@ -0,0 +1,65 @@
+import uuid
+from time import monotonic
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import Tenant
+
+# Tenants mudam raramente e o menu público consulta o tenant a cada page view: cache curto por
+# slug e por id. Alterações feitas pelo /api/tenants chamam tenant_cache_invalidate().
+_TENANT_CACHE_TTL_SECONDS = 60.0
+
+
+class TenantInfo(NamedTuple):
+    id: uuid.UUID
+    tipo_negocio: str
+    ativo: bool
+
+
+_TENANT_BY_SLUG: dict[str, tuple[float, TenantInfo]] = {}
+_TENANT_BY_ID: dict[uuid.UUID, tuple[float, TenantInfo]] = {}
+
+
+def _info(tenant: Tenant) -> TenantInfo:
+    return TenantInfo(
+        id=tenant.id,
+        tipo_negocio=getattr(tenant, "tipo_negocio", None) or "mercearia",
+        ativo=bool(tenant.ativo),
+    )
+
+
+async def get_tenant_by_slug(db: AsyncSession, slug: str) -> Optional[TenantInfo]:
+    """Tenant ativo com o slug informado (já normalizado), ou None."""
+    entry = _TENANT_BY_SLUG.get(slug)
+    if entry and entry[0] > monotonic():
+        return entry[1]
+    res = await db.execute(select(Tenant).where(Tenant.slug == slug, Tenant.ativo == True))
+    tenant = res.scalar_one_or_none()
+    if not tenant:
+        return None
+    info = _info(tenant)
+    expira = monotonic() + _TENANT_CACHE_TTL_SECONDS
+    _TENANT_BY_SLUG[slug] = (expira, info)
+    _TENANT_BY_ID[info.id] = (expira, info)
+    return info
+
+
+async def get_tenant_by_id(db: AsyncSession, tenant_id: uuid.UUID) -> Optional[TenantInfo]:
+    entry = _TENANT_BY_ID.get(tenant_id)
+    if entry and entry[0] > monotonic():
+        return entry[1]
+    res = await db.execute(select(Tenant).where(Tenant.id == tenant_id))
+    tenant = res.scalar_one_or_none()
+    if not tenant:
+        return None
+    info = _info(tenant)
+    _TENANT_BY_ID[tenant_id] = (monotonic() + _TENANT_CACHE_TTL_SECONDS, info)
+    return info
+
+
+def tenant_cache_invalidate(tenant_id: uuid.UUID) -> None:
+    _TENANT_BY_ID.pop(tenant_id, None)
+    for slug in [s for s, (_, info) in _TENANT_BY_SLUG.items() if info.id == tenant_id]:
+        _TENANT_BY_SLUG.pop(slug, None)
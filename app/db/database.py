@@ -2,7 +2,7 @@
 Database session management for dependency injection.
 """
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.db.session import async_session
+from app.db.session import async_session, ReadOnlySessionLocal
 
 async def get_db_session() -> AsyncSession:
     """
@@ -13,3 +13,14 @@ async def get_db_session() -> AsyncSession:
             yield session
         finally:
             await session.close()
+
+
+async def get_readonly_db_session() -> AsyncSession:
+    """
+    Dependency for read-only endpoints (métricas): réplica se configurada, transações READ ONLY.
+    """
+    async with ReadOnlySessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
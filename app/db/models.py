@@ -1,14 +1,34 @@
-from sqlalchemy import Column, String, Boolean, Integer, Float, Text, DateTime, ForeignKey, Time
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import Column, String, Boolean, Integer, Float, Text, DateTime, ForeignKey, Time, Computed, Index, case, literal, literal_column
+from sqlalchemy.orm import Mapped, mapped_column, relationship, validates
 from sqlalchemy.sql import func
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from app.db.base import DeclarativeBase
 from datetime import datetime, time
 from typing import Optional
+import sys
 import uuid
 
 PDV_SCHEMA = "pdv"
 
+
+# Poucos valores distintos de status circulam (aberto, pago, cancelado...): normalizamos cada um
+# uma vez e reutilizamos a string internada.
+_STATUS_NORM_CACHE: dict[str, str] = {}
+_STATUS_NORM_CACHE_MAX = 256
+
+
+def normalizar_status_pedido(status: Optional[str]) -> Optional[str]:
+    """status_pedido é sempre gravado em minúsculas (filtros comparam por igualdade simples)."""
+    if status is None:
+        return None
+    norm = _STATUS_NORM_CACHE.get(status)
+    if norm is None:
+        norm = sys.intern(str(status).strip().lower())
+        if len(_STATUS_NORM_CACHE) < _STATUS_NORM_CACHE_MAX:
+            _STATUS_NORM_CACHE[status] = norm
+    return norm
+
 class Tenant(DeclarativeBase):
     __tablename__ = "tenants"
 
@@ -39,7 +59,15 @@ class User(DeclarativeBase):
 
 class Produto(DeclarativeBase):
     __tablename__ = "produtos"
-    __table_args__ = {"schema": PDV_SCHEMA}
+    __table_args__ = (
+        # Caminhos quentes filtram por tenant + updated_at (sync) / ativo+nome (listagem). Busca por
+        # código já usa o índice único global de codigo.
+        Index("ix_pdv_produtos_tenant_updated", "tenant_id", "updated_at"),
+        Index("ix_pdv_produtos_tenant_ativo_nome", "tenant_id", "ativo", "nome"),
+        # Menu público: só produtos ativos, já na ordem de nome (índice parcial, menor que o acima)
+        Index("ix_pdv_produtos_tenant_nome_ativos", "tenant_id", "nome", postgresql_where=literal_column("ativo")),
+        {"schema": PDV_SCHEMA},
+    )
 
     tenant_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=True, index=True)
     codigo: Mapped[str] = mapped_column(String(50), unique=True, index=True, nullable=False)
@@ -57,6 +85,9 @@ class Produto(DeclarativeBase):
     taxa_iva: Mapped[float] = mapped_column(Float, default=0.0)
     codigo_imposto: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
     imagem_path: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    # Hora da edição (do cliente no sync, do servidor nas edições via API): só para a regra "última
+    # escrita vence". updated_at é sempre hora do servidor, porque o sync/pull filtra por ela.
+    edited_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
 
 
 class Cliente(DeclarativeBase):
@@ -100,6 +131,31 @@ class Venda(DeclarativeBase):
     cliente: Mapped[Optional["Cliente"]] = relationship("Cliente", back_populates="vendas")
     itens: Mapped[list["ItemVenda"]] = relationship("ItemVenda", back_populates="venda")
 
+    @validates("status_pedido")
+    def _validate_status_pedido(self, key, value):
+        return normalizar_status_pedido(value)
+
+    @hybrid_property
+    def status_resolvido(self) -> str:
+        """Status exibido do pedido: status_pedido explícito, senão derivado de cancelada/forma_pagamento."""
+        if self.status_pedido:
+            return self.status_pedido
+        if self.cancelada:
+            return "cancelado"
+        if (self.forma_pagamento or "").strip().upper() == "PENDENTE_PAGAMENTO":
+            return "criado"
+        return "aguardando_pagamento"
+
+    @status_resolvido.inplace.expression
+    @classmethod
+    def _status_resolvido_expression(cls):
+        return case(
+            (func.coalesce(cls.status_pedido, "") != "", cls.status_pedido),
+            (cls.cancelada == True, literal("cancelado")),
+            (func.upper(func.btrim(func.coalesce(cls.forma_pagamento, ""))) == "PENDENTE_PAGAMENTO", literal("criado")),
+            else_=literal("aguardando_pagamento"),
+        )
+
 
 class Mesa(DeclarativeBase):
     __tablename__ = "mesas"
@@ -109,7 +165,10 @@ class Mesa(DeclarativeBase):
     numero: Mapped[int] = mapped_column(Integer, nullable=False)
     capacidade: Mapped[int] = mapped_column(Integer, default=4)
     status: Mapped[str] = mapped_column(String(30), default="Livre")
-    mesa_token: Mapped[str] = mapped_column(String(60), nullable=False, index=True)
+    # Derivado de numero pelo próprio Postgres (coluna gerada); nunca escrito pela aplicação
+    mesa_token: Mapped[str] = mapped_column(
+        String(60), Computed("'mesa-' || numero::text", persisted=True), index=True
+    )
 
 
 class Turno(DeclarativeBase):
@@ -195,7 +254,8 @@ class PaymentTransaction(DeclarativeBase):
     status: Mapped[str] = mapped_column(String(20), default="pending")
     provider_reference: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
 
-    venda: Mapped[Optional["Venda"]] = relationship("Venda")
+    # Carregar sempre explicitamente (joinedload/selectinload) para evitar lazy load acidental em async
+    venda: Mapped[Optional["Venda"]] = relationship("Venda", lazy="raise")
 
 
 class EmpresaConfig(DeclarativeBase):
@@ -1,4 +1,8 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import settings
 
 # Create engine with error handling
@@ -13,12 +17,19 @@ try:
 
     engine = create_async_engine(
         db_url,
+        # Explícito: QueuePool síncrono trava sob asyncpg; o adaptado é o correto para asyncio
+        poolclass=AsyncAdaptedQueuePool,
         pool_pre_ping=True,           # Detect stale connections
-        pool_recycle=900,             # Recycle connections every 15 minutes
-        pool_timeout=30,              # Wait up to 30s for a connection
+        pool_recycle=1800,            # Recycle connections every 30 minutes
+        pool_timeout=10,              # Fail fast instead of queueing requests for 30s
         echo=False,                   # Set to True for SQL debugging
-        pool_size=5,                  # Tune according to Railway plan
-        max_overflow=5                # Allow short bursts
+        pool_size=settings.DB_POOL_SIZE,          # Configurável por env (padrão conservador 10)
+        max_overflow=settings.DB_MAX_OVERFLOW,    # Allow short bursts (padrão 5)
+        connect_args={
+            # Reuse prepared statements per connection (SQLAlchemy adapter + asyncpg)
+            "prepared_statement_cache_size": 256,
+            "statement_cache_size": 256,
+        },
     )
     AsyncSessionLocal = async_sessionmaker(
         autocommit=False,
@@ -26,6 +37,30 @@ try:
         bind=engine,
         expire_on_commit=False,
     )
+
+    # Pool separado só para leituras agregadas (métricas): aponta para a réplica quando configurada
+    # e abre toda transação como READ ONLY, sem disputar conexões com as escritas.
+    readonly_engine = create_async_engine(
+        str(settings.DATABASE_REPLICA_URL),
+        poolclass=AsyncAdaptedQueuePool,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        pool_timeout=30,
+        echo=False,
+        pool_size=settings.DB_READONLY_POOL_SIZE,
+        max_overflow=settings.DB_READONLY_MAX_OVERFLOW,
+        connect_args={
+            "prepared_statement_cache_size": 256,
+            "statement_cache_size": 256,
+        },
+        execution_options={"postgresql_readonly": True},
+    )
+    ReadOnlySessionLocal = async_sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        bind=readonly_engine,
+        expire_on_commit=False,
+    )
 except Exception as e:
     print(f"Database connection error: {e}")
     print(f"DATABASE_URL: {settings.DATABASE_URL}")
@@ -33,3 +68,14 @@ except Exception as e:
 
 # Alias para compatibilidade
 async_session = AsyncSessionLocal
+
+
+async def aquecer_pool(eng: AsyncEngine, conexoes: int) -> None:
+    """Abre `conexoes` conexões em paralelo no startup (equivalente ao min_size do aiopg),
+    para que as primeiras requisições não paguem o handshake TCP/TLS/auth."""
+
+    async def _ping() -> None:
+        async with eng.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(_ping() for _ in range(conexoes)))
@@ -15,10 +15,12 @@ from app.routers import public_distancia
 from app.routers import mesas
 from app.routers import pedidos
 from app.routers import turnos
-from app.db.session import engine, AsyncSessionLocal
+from app.db.session import engine, readonly_engine, AsyncSessionLocal, aquecer_pool
+from app.core.config import settings
 from app.db.base import DeclarativeBase
 from app.db.models import User
 from app.core.security import get_password_hash
+from app.core.realtime import manager as realtime_manager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -104,6 +106,29 @@ async def lifespan(app: FastAPI):
                 await conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{idx_name}_tenant_id ON {table} (tenant_id)"))
 
             await conn.execute(text("ALTER TABLE pdv.produtos ADD COLUMN IF NOT EXISTS imagem_path VARCHAR(255)"))
+            await conn.execute(text("ALTER TABLE pdv.produtos ADD COLUMN IF NOT EXISTS edited_at TIMESTAMPTZ"))
+
+            # mesa_token passou a ser coluna gerada ('mesa-' || numero). Converter bancos antigos
+            # onde a coluna ainda é escrita pela aplicação (os valores são os mesmos).
+            await conn.execute(
+                text(
+                    """
+                    DO $$
+                    BEGIN
+                        IF EXISTS (
+                            SELECT 1 FROM information_schema.columns
+                            WHERE table_schema = 'pdv' AND table_name = 'mesas'
+                              AND column_name = 'mesa_token' AND is_generated = 'NEVER'
+                        ) THEN
+                            ALTER TABLE pdv.mesas DROP COLUMN mesa_token;
+                            ALTER TABLE pdv.mesas
+                                ADD COLUMN mesa_token VARCHAR(60) GENERATED ALWAYS AS ('mesa-' || numero::text) STORED;
+                        END IF;
+                    END $$;
+                    """
+                )
+            )
+            await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_pdv_mesas_mesa_token ON pdv.mesas (mesa_token)"))
 
             # Preencher tenant_id default em registros existentes (mantém compatibilidade)
             for table in [
@@ -124,6 +149,81 @@ async def lifespan(app: FastAPI):
             await conn.execute(text("ALTER TABLE pdv.vendas ADD COLUMN IF NOT EXISTS status_updated_by_nome VARCHAR(100)"))
             await conn.execute(text("ALTER TABLE pdv.vendas ADD COLUMN IF NOT EXISTS status_updated_at TIMESTAMPTZ"))
 
+            # status_pedido é gravado sempre em minúsculas; normalizar legado e garantir via CHECK
+            # para que os filtros usem igualdade simples (status_pedido = 'pago') em vez de lower().
+            await conn.execute(
+                text("UPDATE pdv.vendas SET status_pedido = lower(btrim(status_pedido)) WHERE status_pedido <> lower(btrim(status_pedido))")
+            )
+            await conn.execute(
+                text(
+                    """
+                    DO $$
+                    BEGIN
+                        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'ck_vendas_status_pedido_lower') THEN
+                            ALTER TABLE pdv.vendas ADD CONSTRAINT ck_vendas_status_pedido_lower
+                                CHECK (status_pedido IS NULL OR status_pedido = lower(status_pedido));
+                        END IF;
+                    END $$;
+                    """
+                )
+            )
+
+            # Métricas (vendas-dia/vendas-mes): varredura por intervalo em created_at dentro do tenant,
+            # com total/status_pedido incluídos para permitir index-only scan.
+            await conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_pdv_vendas_tenant_cancelada_created "
+                    "ON pdv.vendas (tenant_id, cancelada, created_at) INCLUDE (total, status_pedido)"
+                )
+            )
+
+            # Produtos: índices compostos por tenant (sync por updated_at, listagem). codigo já é único
+            # globalmente; o único (tenant_id, codigo) criado antes era redundante e só custava escrita.
+            await conn.execute(text("DROP INDEX IF EXISTS pdv.ix_pdv_produtos_tenant_codigo"))
+            await conn.execute(
+                text("CREATE INDEX IF NOT EXISTS ix_pdv_produtos_tenant_updated ON pdv.produtos (tenant_id, updated_at)")
+            )
+            await conn.execute(
+                text("CREATE INDEX IF NOT EXISTS ix_pdv_produtos_tenant_ativo_nome ON pdv.produtos (tenant_id, ativo, nome)")
+            )
+            # Menu público (ativo = true ORDER BY nome): índice parcial só com os ativos, sem nó de sort.
+            await conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_pdv_produtos_tenant_nome_ativos "
+                    "ON pdv.produtos (tenant_id, nome) WHERE ativo"
+                )
+            )
+
+            # Busca de produtos (ILIKE '%q%' em nome/codigo): índices GIN de trigramas. Sem permissão
+            # para criar a extensão, segue sem eles (a busca continua funcionando, só sem índice).
+            await conn.execute(
+                text(
+                    """
+                    DO $$
+                    BEGIN
+                        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                    EXCEPTION WHEN insufficient_privilege THEN
+                        RAISE NOTICE 'pg_trgm indisponível: busca de produtos sem índice de trigramas';
+                    END $$;
+                    """
+                )
+            )
+            await conn.execute(
+                text(
+                    """
+                    DO $$
+                    BEGIN
+                        IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+                            CREATE INDEX IF NOT EXISTS ix_pdv_produtos_nome_trgm
+                                ON pdv.produtos USING gin (nome gin_trgm_ops);
+                            CREATE INDEX IF NOT EXISTS ix_pdv_produtos_codigo_trgm
+                                ON pdv.produtos USING gin (codigo gin_trgm_ops);
+                        END IF;
+                    END $$;
+                    """
+                )
+            )
+
             # Turnos (escala): criar tabelas caso não existam.
             await conn.execute(
                 text(
@@ -266,13 +366,21 @@ async def lifespan(app: FastAPI):
         print(f"Erro ao conectar com o banco: {e}")
         # Continue mesmo com erro de banco para permitir healthcheck
         pass
+
+    # Pré-aquecer algumas conexões (não o pool inteiro: cada worker abriria todas no startup)
+    try:
+        await aquecer_pool(engine, min(settings.DB_POOL_WARM, engine.pool.size()))
+    except Exception as e:
+        print(f"Aviso: não foi possível pré-aquecer o pool de conexões: {e}")
     
     yield
     
     # Shutdown
     print("Encerrando backend...")
     try:
+        await realtime_manager.stop()
         await engine.dispose()
+        await readonly_engine.dispose()
     except:
         pass
 
@@ -7,6 +7,7 @@ from sqlalchemy import select
 from app.db.database import get_db_session
 from app.db.models import EmpresaConfig
 from app.core.deps import get_current_admin_user, get_tenant_id
+from app.core.empresa_cache import empresa_cache_invalidate
 import uuid
 
 router = APIRouter(prefix="/api/config", tags=["configuracao"])
@@ -60,6 +61,7 @@ async def update_empresa_config(
 
   db.add(cfg)
   await db.commit()
+  empresa_cache_invalidate(tenant_id)
   await db.refresh(cfg)
 
   return {
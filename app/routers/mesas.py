@@ -3,6 +3,7 @@ from __future__ import annotations
 import uuid
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -23,6 +24,20 @@ class MesaOut(BaseModel):
     mesa_token: str
 
 
+def _mesa_out(m: Mesa) -> dict:
+    """Linha no formato de MesaOut, serializada direto por orjson (sem validação pydantic na resposta).
+
+    MesaOut continua como response_model apenas para documentar o contrato no OpenAPI.
+    """
+    return {
+        "id": m.id,
+        "numero": m.numero,
+        "capacidade": m.capacidade,
+        "status": m.status,
+        "mesa_token": m.mesa_token,
+    }
+
+
 class MesaCreate(BaseModel):
     numero: int
     capacidade: int = 4
@@ -50,7 +65,6 @@ async def _ensure_default_mesas(db: AsyncSession, tenant_id: uuid.UUID) -> None:
                 numero=n,
                 capacidade=4,
                 status="Livre",
-                mesa_token=f"mesa-{n}",
             )
         )
     await db.commit()
@@ -65,16 +79,7 @@ async def listar_mesas(
     await _ensure_default_mesas(db, tenant_id)
     res = await db.execute(select(Mesa).where(Mesa.tenant_id == tenant_id).order_by(Mesa.numero.asc()))
     rows = res.scalars().all()
-    return [
-        MesaOut(
-            id=getattr(m, "id"),
-            numero=int(getattr(m, "numero")),
-            capacidade=int(getattr(m, "capacidade")),
-            status=str(getattr(m, "status")),
-            mesa_token=str(getattr(m, "mesa_token")),
-        )
-        for m in rows
-    ]
+    return ORJSONResponse([_mesa_out(m) for m in rows])
 
 
 @router.post("/", response_model=MesaOut)
@@ -100,18 +105,11 @@ async def criar_mesa(
         numero=numero,
         capacidade=capacidade,
         status="Livre",
-        mesa_token=f"mesa-{numero}",
     )
     db.add(m)
     await db.commit()
     await db.refresh(m)
-    return MesaOut(
-        id=getattr(m, "id"),
-        numero=int(getattr(m, "numero")),
-        capacidade=int(getattr(m, "capacidade")),
-        status=str(getattr(m, "status")),
-        mesa_token=str(getattr(m, "mesa_token")),
-    )
+    return ORJSONResponse(_mesa_out(m))
 
 
 @router.put("/{mesa_id}/status", response_model=MesaOut)
@@ -140,13 +138,7 @@ async def atualizar_status_mesa(
 
     await db.commit()
     await db.refresh(m)
-    return MesaOut(
-        id=getattr(m, "id"),
-        numero=int(getattr(m, "numero")),
-        capacidade=int(getattr(m, "capacidade")),
-        status=str(getattr(m, "status")),
-        mesa_token=str(getattr(m, "mesa_token")),
-    )
+    return ORJSONResponse(_mesa_out(m))
 
 
 @router.put("/{mesa_id}", response_model=MesaOut)
@@ -170,7 +162,6 @@ async def atualizar_mesa(
         if res_dup.scalars().first():
             raise HTTPException(status_code=400, detail="Mesa já existe")
         m.numero = numero
-        m.mesa_token = f"mesa-{numero}"
 
     if payload.capacidade is not None:
         capacidade = int(payload.capacidade)
@@ -186,13 +177,7 @@ async def atualizar_mesa(
 
     await db.commit()
     await db.refresh(m)
-    return MesaOut(
-        id=getattr(m, "id"),
-        numero=int(getattr(m, "numero")),
-        capacidade=int(getattr(m, "capacidade")),
-        status=str(getattr(m, "status")),
-        mesa_token=str(getattr(m, "mesa_token")),
-    )
+    return ORJSONResponse(_mesa_out(m))
 
 
 @router.delete("/{mesa_id}")
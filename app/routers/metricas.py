@@ -1,42 +1,57 @@
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi import Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, or_
-from datetime import datetime, date
+from sqlalchemy import select, func, or_, bindparam, DateTime
+from datetime import datetime, date, timedelta
+from time import monotonic as _now_ts
 import asyncio
 import uuid
 
-from ..db.database import get_db_session
+from ..db.database import get_readonly_db_session
+from ..db.session import ReadOnlySessionLocal
 from ..db.models import Venda, ItemVenda, Produto
-from ..core.deps import get_tenant_id, get_current_user
+from ..core.deps import get_tenant_id_readonly, get_current_user_readonly
 
 router = APIRouter(prefix="/api/metricas", tags=["metricas"]) 
 
-# Cache em memória simples para suavizar cold start (TTL curto)
-_metrics_cache = {}
+# Cache em memória simples para suavizar cold start (TTL curto, relógio monotônico)
+# Entradas imutáveis (valor, ts): get/set de uma chave são atômicos no event loop, dispensando lock.
+_metrics_cache: dict[str, tuple[float, float]] = {}
 _cache_ttl_seconds = 15
-_cache_lock = asyncio.Lock()
 
-def _now_ts() -> float:
-    return datetime.utcnow().timestamp()
+# Statement montado uma única vez no carregamento do módulo; por request só se ligam os parâmetros.
+# Intervalo semiaberto [inicio, fim) para aproveitar o índice (tenant_id, cancelada, created_at).
+_STMT_VENDAS_PERIODO = select(func.coalesce(func.sum(Venda.total), 0.0)).where(
+    Venda.tenant_id == bindparam("tid"),
+    Venda.cancelada == False,
+    Venda.created_at >= bindparam("inicio", type_=DateTime(timezone=True)),
+    Venda.created_at < bindparam("fim", type_=DateTime(timezone=True)),
+    or_(
+        Venda.status_pedido.is_(None),
+        Venda.status_pedido == "pago",
+    ),
+)
 
 def _cache_get(key: str):
     entry = _metrics_cache.get(key)
-    if not entry:
-        return None
-    if (_now_ts() - float(entry.get("ts", 0.0))) < _cache_ttl_seconds:
-        return entry.get("value")
+    if entry and (_now_ts() - entry[1]) < _cache_ttl_seconds:
+        return entry[0]
     return None
 
+def _cache_get_stale(key: str):
+    """Último valor conhecido, mesmo expirado (fallback quando a consulta falha)."""
+    entry = _metrics_cache.get(key)
+    return entry[0] if entry else None
+
 def _cache_set(key: str, value):
-    _metrics_cache[key] = {"value": value, "ts": _now_ts()}
+    _metrics_cache[key] = (value, _now_ts())
 
 @router.get("/vendas-dia")
 async def vendas_dia(
     data: str | None = Query(default=None, description="Data no formato YYYY-MM-DD (timezone do cliente)"),
-    db: AsyncSession = Depends(get_db_session),
-    tenant_id: uuid.UUID = Depends(get_tenant_id),
-    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_readonly_db_session),
+    tenant_id: uuid.UUID = Depends(get_tenant_id_readonly),
+    user=Depends(get_current_user_readonly),
 ):
     """Retorna o total de vendas (não canceladas) do dia informado (ou dia atual)."""
     # Data alvo: usar a recebida do cliente ou o dia do servidor
@@ -45,43 +60,34 @@ async def vendas_dia(
     except Exception:
         alvo = date.today()
     cache_key = f"vendas_dia:{tenant_id}:{alvo.isoformat()}"
-    async with _cache_lock:
-        cached = _cache_get(cache_key)
-        if cached is not None:
-            return {"data": str(alvo), "total": float(cached)}
-
-    stmt = select(func.coalesce(func.sum(Venda.total), 0.0)).where(
-        Venda.cancelada == False,
-        func.date(Venda.created_at) == alvo,
-        Venda.tenant_id == tenant_id,
-        or_(
-            Venda.status_pedido.is_(None),
-            func.lower(func.coalesce(Venda.status_pedido, "")) == "pago",
-        ),
-    )
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return {"data": str(alvo), "total": float(cached)}
+
     # Tentativa principal + 1 retry leve
     for attempt in range(2):
         try:
-            result = await db.execute(stmt)
+            result = await db.execute(
+                _STMT_VENDAS_PERIODO,
+                {"inicio": alvo, "fim": alvo + timedelta(days=1), "tid": tenant_id},
+            )
             total = float(result.scalar() or 0.0)
-            async with _cache_lock:
-                _cache_set(cache_key, total)
+            _cache_set(cache_key, total)
             return {"data": str(alvo), "total": total}
         except Exception:
             if attempt == 0:
                 await asyncio.sleep(0.2)
                 continue
             # Fallback: servir cache antigo se existir, senão 0
-            async with _cache_lock:
-                cached = _metrics_cache.get(cache_key, {}).get("value")
+            cached = _cache_get_stale(cache_key)
             return {"data": str(alvo), "total": float(cached or 0.0), "warning": "cached"}
 
 @router.get("/vendas-mes")
 async def vendas_mes(
     ano_mes: str | None = Query(default=None, description="Ano-mês no formato YYYY-MM (timezone do cliente)"),
-    db: AsyncSession = Depends(get_db_session),
-    tenant_id: uuid.UUID = Depends(get_tenant_id),
-    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_readonly_db_session),
+    tenant_id: uuid.UUID = Depends(get_tenant_id_readonly),
+    user=Depends(get_current_user_readonly),
 ):
     """Retorna o total de vendas (não canceladas) do mês informado (ou mês atual)."""
     try:
@@ -102,48 +108,35 @@ async def vendas_mes(
             1
         )
         # Intervalo [primeiro_dia, proximo_mes)
-        stmt = select(func.coalesce(func.sum(Venda.total), 0.0)).where(
-            Venda.cancelada == False,
-            Venda.created_at >= primeiro_dia,
-            Venda.created_at < proximo_mes,
-            Venda.tenant_id == tenant_id,
-            or_(
-                Venda.status_pedido.is_(None),
-                func.lower(func.coalesce(Venda.status_pedido, "")) == "pago",
-            ),
-        )
+        params = {"inicio": primeiro_dia, "fim": proximo_mes, "tid": tenant_id}
         cache_key = f"vendas_mes:{tenant_id}:{primeiro_dia.strftime('%Y-%m')}"
         # Servir cache se fresco
-        async with _cache_lock:
-            cached = _cache_get(cache_key)
-            if cached is not None:
-                return {"ano_mes": primeiro_dia.strftime("%Y-%m"), "total": float(cached)}
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            return {"ano_mes": primeiro_dia.strftime("%Y-%m"), "total": float(cached)}
 
         for attempt in range(2):
             try:
-                result = await db.execute(stmt)
+                result = await db.execute(_STMT_VENDAS_PERIODO, params)
                 total = float(result.scalar() or 0.0)
-                async with _cache_lock:
-                    _cache_set(cache_key, total)
+                _cache_set(cache_key, total)
                 return {"ano_mes": primeiro_dia.strftime("%Y-%m"), "total": total}
             except Exception:
                 if attempt == 0:
                     await asyncio.sleep(0.2)
                     continue
-                async with _cache_lock:
-                    cached = _metrics_cache.get(cache_key, {}).get("value")
+                cached = _cache_get_stale(cache_key)
                 return {"ano_mes": primeiro_dia.strftime("%Y-%m"), "total": float(cached or 0.0), "warning": "cached"}
     except Exception:
         # Falha inesperada: retornar cache ou zero
-        async with _cache_lock:
-            cached = _metrics_cache.get(f"vendas_mes:{tenant_id}:{datetime.utcnow().strftime('%Y-%m')}", {}).get("value")
+        cached = _cache_get_stale(f"vendas_mes:{tenant_id}:{datetime.utcnow().strftime('%Y-%m')}")
         return {"ano_mes": datetime.utcnow().strftime("%Y-%m"), "total": float(cached or 0.0), "warning": "cached"}
 
 @router.get("/estoque")
 async def metricas_estoque(
-    db: AsyncSession = Depends(get_db_session),
-    tenant_id: uuid.UUID = Depends(get_tenant_id),
-    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_readonly_db_session),
+    tenant_id: uuid.UUID = Depends(get_tenant_id_readonly),
+    user=Depends(get_current_user_readonly),
 ):
     """Retorna métricas de estoque: valor_estoque (custo), valor_potencial (venda) e lucro_potencial.
 
@@ -153,32 +146,117 @@ async def metricas_estoque(
     - lucro_potencial = valor_potencial - valor_estoque
     """
     try:
-        stmt_custo = select(func.coalesce(func.sum(Produto.estoque * Produto.preco_custo), 0.0)).where(
-            Produto.ativo == True,
-            Produto.tenant_id == tenant_id,
-        )
-        stmt_venda = select(func.coalesce(func.sum(Produto.estoque * Produto.preco_venda), 0.0)).where(
-            Produto.ativo == True,
-            Produto.tenant_id == tenant_id,
-        )
+        return await _valores_estoque(db, tenant_id)
+    except Exception as e:
+        # Em falha, retornar zeros para não quebrar o cliente
+        return {
+            "valor_estoque": 0.0,
+            "valor_potencial": 0.0,
+            "lucro_potencial": 0.0,
+            "warning": str(e)
+        }
 
-        result_custo = await db.execute(stmt_custo)
-        result_venda = await db.execute(stmt_venda)
 
-        valor_estoque = float(result_custo.scalar() or 0.0)
-        valor_potencial = float(result_venda.scalar() or 0.0)
-        lucro_potencial = float(valor_potencial - valor_estoque)
+async def _valores_estoque(db: AsyncSession, tenant_id: uuid.UUID) -> dict:
+    stmt_custo = select(func.coalesce(func.sum(Produto.estoque * Produto.preco_custo), 0.0)).where(
+        Produto.ativo == True,
+        Produto.tenant_id == tenant_id,
+    )
+    stmt_venda = select(func.coalesce(func.sum(Produto.estoque * Produto.preco_venda), 0.0)).where(
+        Produto.ativo == True,
+        Produto.tenant_id == tenant_id,
+    )
 
-        return {
-            "valor_estoque": valor_estoque,
-            "valor_potencial": valor_potencial,
-            "lucro_potencial": lucro_potencial,
-        }
+    result_custo = await db.execute(stmt_custo)
+    result_venda = await db.execute(stmt_venda)
+
+    valor_estoque = float(result_custo.scalar() or 0.0)
+    valor_potencial = float(result_venda.scalar() or 0.0)
+    lucro_potencial = float(valor_potencial - valor_estoque)
+
+    return {
+        "valor_estoque": valor_estoque,
+        "valor_potencial": valor_potencial,
+        "lucro_potencial": lucro_potencial,
+    }
+
+
+async def _total_vendas_periodo(tenant_id: uuid.UUID, inicio: date, fim: date, cache_key: str) -> float:
+    """Total de vendas em [inicio, fim) numa sessão própria (AsyncSession não é segura para uso concorrente)."""
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return float(cached)
+    try:
+        async with ReadOnlySessionLocal() as session:
+            result = await session.execute(
+                _STMT_VENDAS_PERIODO, {"inicio": inicio, "fim": fim, "tid": tenant_id}
+            )
+            total = float(result.scalar() or 0.0)
+    except Exception:
+        cached = _cache_get_stale(cache_key)
+        return float(cached or 0.0)
+    _cache_set(cache_key, total)
+    return total
+
+
+async def _estoque_isolado(tenant_id: uuid.UUID) -> dict:
+    try:
+        async with ReadOnlySessionLocal() as session:
+            return await _valores_estoque(session, tenant_id)
     except Exception as e:
-        # Em falha, retornar zeros para não quebrar o cliente
         return {
             "valor_estoque": 0.0,
             "valor_potencial": 0.0,
             "lucro_potencial": 0.0,
             "warning": str(e)
         }
+
+
+@router.get("/resumo")
+async def metricas_resumo(
+    data: str | None = Query(default=None, description="Data no formato YYYY-MM-DD (timezone do cliente)"),
+    ano_mes: str | None = Query(default=None, description="Ano-mês no formato YYYY-MM (timezone do cliente)"),
+    tenant_id: uuid.UUID = Depends(get_tenant_id_readonly),
+    user=Depends(get_current_user_readonly),
+):
+    """Agrega vendas-dia, vendas-mes e estoque numa única resposta.
+
+    As três consultas correm em paralelo, cada uma na sua sessão, para que a latência
+    seja a da consulta mais lenta e não a soma das três.
+    """
+    try:
+        alvo = date.fromisoformat(data) if data else date.today()
+    except Exception:
+        alvo = date.today()
+
+    primeiro_dia = None
+    if ano_mes:
+        try:
+            ano, mes = map(int, ano_mes.split("-"))
+            primeiro_dia = date(ano, mes, 1)
+        except Exception:
+            primeiro_dia = None
+    if primeiro_dia is None:
+        dnow = datetime.utcnow()
+        primeiro_dia = date(dnow.year, dnow.month, 1)
+    proximo_mes = date(
+        primeiro_dia.year + (1 if primeiro_dia.month == 12 else 0),
+        1 if primeiro_dia.month == 12 else primeiro_dia.month + 1,
+        1
+    )
+
+    total_dia, total_mes, estoque = await asyncio.gather(
+        _total_vendas_periodo(
+            tenant_id, alvo, alvo + timedelta(days=1), f"vendas_dia:{tenant_id}:{alvo.isoformat()}"
+        ),
+        _total_vendas_periodo(
+            tenant_id, primeiro_dia, proximo_mes, f"vendas_mes:{tenant_id}:{primeiro_dia.strftime('%Y-%m')}"
+        ),
+        _estoque_isolado(tenant_id),
+    )
+
+    return {
+        "vendas_dia": {"data": str(alvo), "total": total_dia},
+        "vendas_mes": {"ano_mes": primeiro_dia.strftime("%Y-%m"), "total": total_mes},
+        "estoque": estoque,
+    }
@@ -1,14 +1,18 @@
 from __future__ import annotations
 
+import os
 import uuid
 from datetime import datetime
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import BaseModel, Field
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 
 from app.core.deps import get_tenant_id
 from app.db.database import get_db_session
@@ -17,6 +21,17 @@ from app.db.models import PaymentTransaction, Venda
 
 router = APIRouter(prefix="/api/payments", tags=["payments"])
 
+# Templates compilados uma vez e mantidos em cache (sem recarregar do disco por request)
+_TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+templates = Jinja2Templates(
+    env=Environment(
+        loader=FileSystemLoader(_TEMPLATES_DIR),
+        autoescape=select_autoescape(["html"]),
+        auto_reload=False,
+        cache_size=-1,
+    )
+)
+
 
 class CheckoutRequest(BaseModel):
     pedido_uuid: str
@@ -76,16 +91,11 @@ async def checkout_payment(
 
 @router.get("/{payment_id}")
 async def get_payment_status(
-    payment_id: str,
+    payment_id: uuid.UUID,
     db: AsyncSession = Depends(get_db_session),
     tenant_id: uuid.UUID = Depends(get_tenant_id),
 ):
-    try:
-        pid = uuid.UUID(payment_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="payment_id inválido")
-
-    res = await db.execute(select(PaymentTransaction).where(PaymentTransaction.id == pid, PaymentTransaction.tenant_id == tenant_id))
+    res = await db.execute(select(PaymentTransaction).where(PaymentTransaction.id == payment_id, PaymentTransaction.tenant_id == tenant_id))
     p = res.scalar_one_or_none()
     if not p:
         raise HTTPException(status_code=404, detail="Pagamento não encontrado")
@@ -103,27 +113,37 @@ async def get_payment_status(
 
 @router.post("/{payment_id}/mark-paid")
 async def mark_payment_paid(
-    payment_id: str,
+    payment_id: uuid.UUID,
     db: AsyncSession = Depends(get_db_session),
     tenant_id: uuid.UUID = Depends(get_tenant_id),
 ):
-    try:
-        pid = uuid.UUID(payment_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="payment_id inválido")
-
-    res = await db.execute(select(PaymentTransaction).where(PaymentTransaction.id == pid, PaymentTransaction.tenant_id == tenant_id))
+    # Pagamento + venda num único round trip (LEFT OUTER JOIN)
+    res = await db.execute(
+        select(PaymentTransaction)
+        .options(joinedload(PaymentTransaction.venda))
+        .where(PaymentTransaction.id == payment_id, PaymentTransaction.tenant_id == tenant_id)
+    )
     p = res.scalar_one_or_none()
     if not p:
         raise HTTPException(status_code=404, detail="Pagamento não encontrado")
 
-    p.status = "paid"
-    p.updated_at = datetime.utcnow()
+    # Idempotente: callbacks duplicados / duplo clique não voltam a escrever
+    if p.status == "paid":
+        return {"status": "paid"}
+
+    # UPDATE condicional: só uma requisição concorrente efetiva a transição para "paid"
+    res_up = await db.execute(
+        update(PaymentTransaction)
+        .where(PaymentTransaction.id == p.id, PaymentTransaction.status.is_distinct_from("paid"))
+        .values(status="paid", updated_at=datetime.utcnow())
+    )
+    if res_up.rowcount == 0:
+        await db.rollback()
+        return {"status": "paid"}
 
     if getattr(p, "venda_id", None):
-        res_v = await db.execute(select(Venda).where(Venda.id == p.venda_id, Venda.tenant_id == tenant_id))
-        venda = res_v.scalar_one_or_none()
-        if venda:
+        venda = p.venda
+        if venda and venda.tenant_id == tenant_id:
             venda.forma_pagamento = (getattr(p, "provider", None) or "online").upper()
             try:
                 setattr(venda, "status_pedido", "pago")
@@ -136,75 +156,17 @@ async def mark_payment_paid(
 
 @router.get("/{payment_id}/pay", response_class=HTMLResponse)
 async def payment_pay_page(
-    payment_id: str,
+    request: Request,
+    payment_id: uuid.UUID,
     db: AsyncSession = Depends(get_db_session),
     tenant_id: uuid.UUID = Depends(get_tenant_id),
 ):
-    try:
-        pid = uuid.UUID(payment_id)
-    except Exception:
-        return HTMLResponse("<h2>Pagamento inválido</h2>", status_code=400)
-
     res = await db.execute(
-        select(PaymentTransaction).where(PaymentTransaction.id == pid, PaymentTransaction.tenant_id == tenant_id)
+        select(PaymentTransaction).where(PaymentTransaction.id == payment_id, PaymentTransaction.tenant_id == tenant_id)
     )
     p = res.scalar_one_or_none()
     if not p:
         return HTMLResponse("<h2>Pagamento não encontrado</h2>", status_code=404)
 
-    status_val = str(getattr(p, "status", "pending") or "pending")
-    amount = float(getattr(p, "amount", 0.0) or 0.0)
-    currency = str(getattr(p, "currency", "MZN") or "MZN")
-    provider = str(getattr(p, "provider", "") or "").upper()
-    phone = str(getattr(p, "phone", "") or "")
-
-    if status_val == "paid":
-        return HTMLResponse(
-            f"""
-            <html><head><meta name='viewport' content='width=device-width, initial-scale=1.0'></head>
-            <body style='font-family:Segoe UI,Arial,sans-serif;padding:18px;'>
-              <h2>Pagamento confirmado</h2>
-              <div>Operadora: <b>{provider}</b></div>
-              <div>Número: <b>{phone}</b></div>
-              <div style='margin-top:10px;'>Valor: <b>{amount:.2f} {currency}</b></div>
-              <p>Pode fechar esta página.</p>
-            </body></html>
-            """,
-            status_code=200,
-        )
-
-    return HTMLResponse(
-        f"""
-        <html>
-          <head>
-            <meta name='viewport' content='width=device-width, initial-scale=1.0'>
-            <title>Confirmar pagamento</title>
-          </head>
-          <body style='font-family:Segoe UI,Arial,sans-serif;padding:18px;'>
-            <h2>Confirmar pagamento (simulação)</h2>
-            <div style='margin-top:6px;'>Operadora: <b>{provider}</b></div>
-            <div style='margin-top:6px;'>Número: <b>{phone}</b></div>
-            <div style='margin-top:12px;'>Valor: <b>{amount:.2f} {currency}</b></div>
-            <div style='margin-top:16px;'>
-              <button id='payBtn' style='padding:12px 16px;border:0;border-radius:12px;background:#16a34a;color:#fff;font-weight:800;cursor:pointer;'>Confirmar no telemóvel</button>
-            </div>
-            <div id='msg' style='margin-top:12px;color:#374151;'></div>
-            <script>
-              const msg = document.getElementById('msg');
-              document.getElementById('payBtn').addEventListener('click', async () => {{
-                try {{
-                  msg.textContent = 'Processando...';
-                  const res = await fetch('/api/payments/{payment_id}/mark-paid', {{ method: 'POST' }});
-                  const data = await res.json();
-                  msg.textContent = (data && data.status === 'paid') ? 'Pago com sucesso.' : 'Falha.';
-                  setTimeout(() => location.reload(), 900);
-                }} catch (e) {{
-                  msg.textContent = 'Erro ao pagar.';
-                }}
-              }});
-            </script>
-          </body>
-        </html>
-        """,
-        status_code=200,
-    )
+    template_name = "payment_paid.html" if p.status == "paid" else "payment_pay.html"
+    return templates.TemplateResponse(request, template_name, {"p": p}, status_code=200)
@@ -1,17 +1,87 @@
 from __future__ import annotations
 
+import html
 import time
-import uuid
+from collections import OrderedDict
 from typing import Any
 
 from fastapi import APIRouter
 from fastapi.responses import HTMLResponse
 from pydantic import BaseModel
 
+from app.core.ids import new_uuid
+
 
 router = APIRouter(prefix="/api/payments/mock", tags=["payments-mock"])
 
-_PAYMENTS: dict[str, dict[str, Any]] = {}
+# LRU limitado: pagamentos simulados antigos são descartados para a memória não crescer sem fim.
+# Sem lock: os handlers não fazem await entre ler e alterar uma entrada, e cada operação no
+# OrderedDict é atômica dentro do event loop.
+_PAYMENTS: OrderedDict[str, dict[str, Any]] = OrderedDict()
+_PAYMENTS_MAX = 10000
+
+
+# Páginas HTML montadas uma vez no carregamento do módulo; por request só entram valor/moeda/id.
+# O JS fica num sufixo fixo, fora do .format(), para não precisar escapar chaves.
+_PAY_NOT_FOUND_HTML = "<h2>Pagamento não encontrado</h2>"
+
+_PAY_HTML_PAID = """
+<html><head><meta name='viewport' content='width=device-width, initial-scale=1.0'></head>
+<body style='font-family:Segoe UI,Arial,sans-serif;padding:18px;'>
+  <h2>Pagamento confirmado</h2>
+  <div>Valor: <b>{amount:.2f} {currency}</b></div>
+  <p>Pode fechar esta página.</p>
+</body></html>
+"""
+
+_PAY_HTML_PENDING_PREFIX = """
+<html>
+  <head>
+    <meta name='viewport' content='width=device-width, initial-scale=1.0'>
+    <title>Pagamento</title>
+  </head>
+  <body style='font-family:Segoe UI,Arial,sans-serif;padding:18px;'>
+    <h2>Pagamento (simulação)</h2>
+"""
+
+_PAY_HTML_PENDING_MIDDLE = """    <div style='margin-top:8px;'>Valor: <b>{amount:.2f} {currency}</b></div>
+    <div style='margin-top:16px;'>
+      <button id='payBtn' style='padding:12px 16px;border:0;border-radius:12px;background:#16a34a;color:#fff;font-weight:800;cursor:pointer;'>Pagar agora</button>
+    </div>
+    <div id='msg' style='margin-top:12px;color:#374151;'></div>
+    <script>window.__PID__ = "{payment_id}";</script>
+"""
+
+_PAY_HTML_PENDING_SUFFIX = """    <script>
+      const msg = document.getElementById('msg');
+      document.getElementById('payBtn').addEventListener('click', async () => {
+        try {
+          msg.textContent = 'Processando...';
+          const res = await fetch('/api/payments/mock/' + window.__PID__ + '/mark-paid', { method: 'POST' });
+          const data = await res.json();
+          msg.textContent = (data && data.status === 'paid') ? 'Pago com sucesso.' : 'Falha.';
+          setTimeout(() => location.reload(), 800);
+        } catch (e) {
+          msg.textContent = 'Erro ao pagar.';
+        }
+      });
+    </script>
+  </body>
+</html>
+"""
+
+
+# Estado interno como inteiro; a string só é montada na resposta.
+_PENDING = 0
+_PAID = 1
+_STATUS_NOME = ("pending", "paid")
+
+
+def _get_payment(payment_id: str) -> dict[str, Any] | None:
+    p = _PAYMENTS.get(payment_id)
+    if p is not None:
+        _PAYMENTS.move_to_end(payment_id)
+    return p
 
 
 class CreatePaymentRequest(BaseModel):
@@ -25,7 +95,7 @@ class CreatePaymentRequest(BaseModel):
 
 @router.post("/create")
 async def create_payment(req: CreatePaymentRequest):
-    payment_id = str(uuid.uuid4())
+    payment_id = str(new_uuid())
     now = time.time()
 
     auto_sec = int(req.auto_pay_seconds) if req.auto_pay_seconds is not None else 20
@@ -33,7 +103,7 @@ async def create_payment(req: CreatePaymentRequest):
 
     _PAYMENTS[payment_id] = {
         "id": payment_id,
-        "status": "pending",
+        "status_code": _PENDING,
         "amount": float(req.amount or 0),
         "currency": (req.currency or "MZN"),
         "description": req.description,
@@ -42,7 +112,11 @@ async def create_payment(req: CreatePaymentRequest):
         "created_at": now,
         "updated_at": now,
         "auto_pay_seconds": auto_sec,
+        # Instante do pagamento automático, calculado uma vez (auto_pay_seconds=0 desliga)
+        "expiry": now + auto_sec if auto_sec > 0 else float("inf"),
     }
+    if len(_PAYMENTS) > _PAYMENTS_MAX:
+        _PAYMENTS.popitem(last=False)
 
     pay_url = f"/api/payments/mock/{payment_id}/pay"
 
@@ -54,23 +128,15 @@ async def create_payment(req: CreatePaymentRequest):
 
 
 def _maybe_auto_pay(p: dict[str, Any]) -> None:
-    try:
-        if p.get("status") != "pending":
-            return
-        created = float(p.get("created_at") or 0)
-        auto_sec = int(p.get("auto_pay_seconds") or 0)
-        if auto_sec <= 0:
-            return
-        if time.time() - created >= auto_sec:
-            p["status"] = "paid"
-            p["updated_at"] = time.time()
-    except Exception:
-        return
+    # Todos os campos foram gravados por create_payment com tipos fixos: sem try/except
+    if p["status_code"] == _PENDING and time.time() >= p["expiry"]:
+        p["status_code"] = _PAID
+        p["updated_at"] = time.time()
 
 
 @router.get("/{payment_id}")
 async def get_payment(payment_id: str):
-    p = _PAYMENTS.get(str(payment_id))
+    p = _get_payment(payment_id)
     if not p:
         return {"payment_id": payment_id, "status": "not_found"}
 
@@ -78,7 +144,7 @@ async def get_payment(payment_id: str):
 
     return {
         "payment_id": p.get("id"),
-        "status": p.get("status"),
+        "status": _STATUS_NOME[p["status_code"]],
         "amount": p.get("amount"),
         "currency": p.get("currency"),
         "order_uuid": p.get("order_uuid"),
@@ -88,68 +154,28 @@ async def get_payment(payment_id: str):
 
 @router.post("/{payment_id}/mark-paid")
 async def mark_paid(payment_id: str):
-    p = _PAYMENTS.get(str(payment_id))
+    p = _get_payment(payment_id)
     if not p:
         return {"payment_id": payment_id, "status": "not_found"}
 
-    p["status"] = "paid"
+    p["status_code"] = _PAID
     p["updated_at"] = time.time()
-    return {"payment_id": p.get("id"), "status": p.get("status")}
+    return {"payment_id": p.get("id"), "status": _STATUS_NOME[_PAID]}
 
 
 @router.get("/{payment_id}/pay", response_class=HTMLResponse)
 async def pay_page(payment_id: str):
-    p = _PAYMENTS.get(str(payment_id))
+    p = _get_payment(payment_id)
     if not p:
-        return HTMLResponse("<h2>Pagamento não encontrado</h2>", status_code=404)
+        return HTMLResponse(_PAY_NOT_FOUND_HTML, status_code=404)
 
     _maybe_auto_pay(p)
 
-    status = str(p.get("status") or "pending")
-    amount = p.get("amount")
-    currency = p.get("currency")
-
-    if status == "paid":
-        return HTMLResponse(
-            f"""
-            <html><head><meta name='viewport' content='width=device-width, initial-scale=1.0'></head>
-            <body style='font-family:Segoe UI,Arial,sans-serif;padding:18px;'>
-              <h2>Pagamento confirmado</h2>
-              <div>Valor: <b>{amount:.2f} {currency}</b></div>
-              <p>Pode fechar esta página.</p>
-            </body></html>
-            """
-        )
-
-    return HTMLResponse(
-        f"""
-        <html>
-          <head>
-            <meta name='viewport' content='width=device-width, initial-scale=1.0'>
-            <title>Pagamento</title>
-          </head>
-          <body style='font-family:Segoe UI,Arial,sans-serif;padding:18px;'>
-            <h2>Pagamento (simulação)</h2>
-            <div style='margin-top:8px;'>Valor: <b>{amount:.2f} {currency}</b></div>
-            <div style='margin-top:16px;'>
-              <button id='payBtn' style='padding:12px 16px;border:0;border-radius:12px;background:#16a34a;color:#fff;font-weight:800;cursor:pointer;'>Pagar agora</button>
-            </div>
-            <div id='msg' style='margin-top:12px;color:#374151;'></div>
-            <script>
-              const msg = document.getElementById('msg');
-              document.getElementById('payBtn').addEventListener('click', async () => {{
-                try {{
-                  msg.textContent = 'Processando...';
-                  const res = await fetch('/api/payments/mock/{payment_id}/mark-paid', {{ method: 'POST' }});
-                  const data = await res.json();
-                  msg.textContent = (data && data.status === 'paid') ? 'Pago com sucesso.' : 'Falha.';
-                  setTimeout(() => location.reload(), 800);
-                }} catch (e) {{
-                  msg.textContent = 'Erro ao pagar.';
-                }}
-              }});
-            </script>
-          </body>
-        </html>
-        """
-    )
+    amount = float(p.get("amount") or 0.0)
+    currency = html.escape(str(p.get("currency") or ""))
+
+    if p["status_code"] == _PAID:
+        return HTMLResponse(_PAY_HTML_PAID.format(amount=amount, currency=currency))
+
+    middle = _PAY_HTML_PENDING_MIDDLE.format(amount=amount, currency=currency, payment_id=p["id"])
+    return HTMLResponse("".join((_PAY_HTML_PENDING_PREFIX, middle, _PAY_HTML_PENDING_SUFFIX)))
@@ -2,17 +2,20 @@ from __future__ import annotations
 
 import uuid
 from datetime import datetime
+from time import monotonic
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import joinedload, load_only, selectinload
 
 from app.core.deps import get_current_admin_user, get_current_user, get_tenant_id
+from app.core.ids import new_uuid, parse_uuid
 from app.db.database import get_db_session
-from app.db.models import Produto, Venda, ItemVenda
+from app.db.models import Produto, Venda, ItemVenda, User, normalizar_status_pedido
 
 
 router = APIRouter(prefix="/api/pedidos", tags=["pedidos"])
@@ -37,6 +40,14 @@ class PedidoListItem(BaseModel):
     updated_at: Optional[datetime] = None
 
 
+class PedidoItemOut(BaseModel):
+    produto_id: str
+    produto_nome: str
+    quantidade: int
+    preco_unitario: float
+    subtotal: float
+
+
 class PedidoDetail(BaseModel):
     pedido_uuid: str
     pedido_id: str
@@ -54,7 +65,7 @@ class PedidoDetail(BaseModel):
     observacoes: Optional[str] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
-    itens: list[dict] = []
+    itens: list[PedidoItemOut] = []
 
 
 class PedidoStatusUpdate(BaseModel):
@@ -80,16 +91,33 @@ class PedidoCreateOut(BaseModel):
     status: str
 
 
-def _resolve_status(v: Venda) -> str:
-    status_pedido = (getattr(v, "status_pedido", None) or "").strip()
-    if status_pedido:
-        return status_pedido
-    if bool(getattr(v, "cancelada", False)):
-        return "cancelado"
-    fp = (getattr(v, "forma_pagamento", None) or "").strip().upper()
-    if fp == "PENDENTE_PAGAMENTO":
-        return "criado"
-    return "aguardando_pagamento"
+# Cache curto da listagem: o PDV web faz polling a cada poucos segundos.
+# Chave: (tenant_id, status_filter, mesa_id, incluir_cancelados, limit) -> (expira_em, itens)
+_LIST_CACHE: dict[tuple, tuple[float, list[PedidoListItem]]] = {}
+_LIST_CACHE_TTL_SECONDS = 2.0
+_LIST_CACHE_MAX = 1024
+
+
+def _list_cache_get(key: tuple) -> list[PedidoListItem] | None:
+    entry = _LIST_CACHE.get(key)
+    if entry and entry[0] > monotonic():
+        return entry[1]
+    return None
+
+
+def _list_cache_set(key: tuple, items: list[PedidoListItem]) -> None:
+    if len(_LIST_CACHE) >= _LIST_CACHE_MAX:
+        agora = monotonic()
+        for k in [k for k, (exp, _) in _LIST_CACHE.items() if exp <= agora]:
+            _LIST_CACHE.pop(k, None)
+        if len(_LIST_CACHE) >= _LIST_CACHE_MAX:
+            _LIST_CACHE.clear()
+    _LIST_CACHE[key] = (monotonic() + _LIST_CACHE_TTL_SECONDS, items)
+
+
+def _list_cache_invalidate(tenant_id: uuid.UUID) -> None:
+    for k in [k for k in _LIST_CACHE if k[0] == tenant_id]:
+        _LIST_CACHE.pop(k, None)
 
 
 @router.post("/", response_model=PedidoCreateOut)
@@ -119,41 +147,29 @@ async def criar_pedido(
         cliente_uuid = None
         if payload.cliente_id:
             try:
-                cliente_uuid = uuid.UUID(str(payload.cliente_id))
+                cliente_uuid = parse_uuid(str(payload.cliente_id))
             except Exception:
                 cliente_uuid = None
 
-        pedido_uuid = uuid.uuid4()
-        v = Venda(
-            id=uuid.uuid4(),
-            tenant_id=tenant_id,
-            usuario_id=getattr(user, "id", None),
-            cliente_id=cliente_uuid,
-            total=0.0,
-            desconto=0.0,
-            forma_pagamento="PENDENTE_PAGAMENTO",
-            tipo_pedido="local",
-            status_pedido="aberto",
-            mesa_id=mesa_id,
-            lugar_numero=lugar,
-            observacoes=payload.observacoes,
-            cancelada=False,
-            created_at=datetime.utcnow(),
-        )
-        db.add(v)
-        await db.flush()
-
-        total = 0.0
+        # Validar todos os produto_id e buscar os produtos numa única consulta (evita N+1)
+        produto_uuids: list[uuid.UUID] = []
         for it in payload.itens:
             try:
-                produto_uuid = uuid.UUID(str(it.produto_id))
+                produto_uuids.append(parse_uuid(str(it.produto_id)))
             except Exception:
                 raise HTTPException(status_code=400, detail=f"produto_id inválido: {it.produto_id}")
 
-            res_prod = await db.execute(
-                select(Produto).where(Produto.id == produto_uuid, Produto.tenant_id == tenant_id)
-            )
-            produto = res_prod.scalar_one_or_none()
+        res_prod = await db.execute(
+            select(Produto).where(Produto.id.in_(set(produto_uuids)), Produto.tenant_id == tenant_id)
+        )
+        prod_map = {p.id: p for p in res_prod.scalars().all()}
+
+        # Calcular as linhas de item antes de gravar (total já vai no INSERT da venda)
+        venda_id = new_uuid()
+        itens_rows: list[dict] = []
+        total = 0.0
+        for it, produto_uuid in zip(payload.itens, produto_uuids):
+            produto = prod_map.get(produto_uuid)
             if not produto:
                 raise HTTPException(status_code=400, detail=f"Produto inexistente no servidor: {it.produto_id}")
 
@@ -170,26 +186,47 @@ async def criar_pedido(
                 base_iva = subtotal
                 valor_iva = 0.0
 
-            db.add(
-                ItemVenda(
-                    venda_id=v.id,
-                    produto_id=produto_uuid,
-                    quantidade=qtd,
-                    peso_kg=0.0,
-                    preco_unitario=preco_unit,
-                    subtotal=subtotal,
-                    taxa_iva=taxa_iva,
-                    base_iva=base_iva,
-                    valor_iva=valor_iva,
-                )
+            itens_rows.append(
+                {
+                    "venda_id": venda_id,
+                    "produto_id": produto_uuid,
+                    "quantidade": qtd,
+                    "peso_kg": 0.0,
+                    "preco_unitario": preco_unit,
+                    "subtotal": subtotal,
+                    "taxa_iva": taxa_iva,
+                    "base_iva": base_iva,
+                    "valor_iva": valor_iva,
+                }
             )
             total += subtotal
 
-        v.total = float(total)
+        v = Venda(
+            id=venda_id,
+            tenant_id=tenant_id,
+            usuario_id=getattr(user, "id", None),
+            cliente_id=cliente_uuid,
+            total=float(total),
+            desconto=0.0,
+            forma_pagamento="PENDENTE_PAGAMENTO",
+            tipo_pedido="local",
+            status_pedido="aberto",
+            mesa_id=mesa_id,
+            lugar_numero=lugar,
+            observacoes=payload.observacoes,
+            cancelada=False,
+            created_at=datetime.utcnow(),
+        )
+        db.add(v)
+        await db.flush()
+
+        # Itens num único INSERT executemany (Core), sem unit-of-work do ORM por item
+        await db.execute(insert(ItemVenda), itens_rows)
         await db.commit()
+        _list_cache_invalidate(tenant_id)
         return PedidoCreateOut(
             pedido_uuid=str(v.id),
-            pedido_id=str(v.id)[:8],
+            pedido_id=v.id.hex[:8],
             status=str(getattr(v, "status_pedido", None) or "aberto"),
         )
     except HTTPException:
@@ -200,7 +237,7 @@ async def criar_pedido(
         raise HTTPException(status_code=500, detail=f"Erro ao criar pedido: {str(e)}")
 
 
-@router.get("/", response_model=list[PedidoListItem])
+@router.get("/", response_model=list[PedidoListItem], response_class=ORJSONResponse)
 async def listar_pedidos(
     status_filter: Optional[str] = None,
     mesa_id: Optional[int] = None,
@@ -212,9 +249,14 @@ async def listar_pedidos(
 ):
     limit = max(1, min(500, int(limit)))
 
+    cache_key = (tenant_id, status_filter, mesa_id, incluir_cancelados, limit)
+    cached = _list_cache_get(cache_key)
+    if cached is not None:
+        return cached
+
     stmt = (
-        select(Venda)
-        .options(selectinload(Venda.usuario))
+        select(Venda, Venda.status_resolvido.label("status"))
+        .options(joinedload(Venda.usuario).load_only(User.nome))
         .where(Venda.tenant_id == tenant_id)
         .order_by(Venda.created_at.desc())
         .limit(limit)
@@ -234,41 +276,44 @@ async def listar_pedidos(
         # Evitar misturar vendas de balcão com pedidos: pedidos de mesa sempre têm mesa_id > 0.
         stmt = stmt.where(Venda.mesa_id.is_not(None), Venda.mesa_id > 0)
 
+    status_norm = normalizar_status_pedido(status_filter or "")
+    if status_norm:
+        stmt = stmt.where(Venda.status_resolvido == status_norm)
+
     # Restaurante: pedidos são vendas com tipo_pedido preenchido ou mesa_id/lugar_numero.
     # Não aplicamos filtro rígido aqui para manter compatibilidade com mercearia, mas o PDV web pode filtrar.
 
     res = await db.execute(stmt)
-    rows = res.scalars().all()
+    rows = res.all()
 
+    # Valores vêm de colunas tipadas do banco: model_construct evita revalidar cada linha
     out: list[PedidoListItem] = []
-    for v in rows:
-        s = _resolve_status(v)
-        if status_filter and s.lower() != str(status_filter).strip().lower():
-            continue
+    for v, s in rows:
         out.append(
-            PedidoListItem(
+            PedidoListItem.model_construct(
                 pedido_uuid=str(v.id),
-                pedido_id=str(v.id)[:8],
-                tipo_pedido=getattr(v, "tipo_pedido", None),
+                pedido_id=v.id.hex[:8],
+                tipo_pedido=v.tipo_pedido,
                 status=s,
-                total=float(getattr(v, "total", 0.0) or 0.0),
-                usuario_nome=getattr(getattr(v, "usuario", None), "nome", None),
-                status_updated_by_nome=getattr(v, "status_updated_by_nome", None),
-                status_updated_at=getattr(v, "status_updated_at", None),
-                mesa_id=getattr(v, "mesa_id", None),
-                lugar_numero=getattr(v, "lugar_numero", None),
-                distancia_tipo=getattr(v, "distancia_tipo", None),
-                cliente_nome=getattr(v, "cliente_nome", None),
-                cliente_telefone=getattr(v, "cliente_telefone", None),
-                endereco_entrega=getattr(v, "endereco_entrega", None),
-                created_at=getattr(v, "created_at", None),
-                updated_at=getattr(v, "updated_at", None) or getattr(v, "created_at", None),
+                total=float(v.total or 0.0),
+                usuario_nome=v.usuario.nome if v.usuario else None,
+                status_updated_by_nome=v.status_updated_by_nome,
+                status_updated_at=v.status_updated_at,
+                mesa_id=v.mesa_id,
+                lugar_numero=v.lugar_numero,
+                distancia_tipo=v.distancia_tipo,
+                cliente_nome=v.cliente_nome,
+                cliente_telefone=v.cliente_telefone,
+                endereco_entrega=v.endereco_entrega,
+                created_at=v.created_at,
+                updated_at=v.updated_at or v.created_at,
             )
         )
+    _list_cache_set(cache_key, out)
     return out
 
 
-@router.get("/uuid/{pedido_uuid}", response_model=PedidoDetail)
+@router.get("/uuid/{pedido_uuid}", response_model=PedidoDetail, response_class=ORJSONResponse)
 async def obter_pedido(
     pedido_uuid: str,
     db: AsyncSession = Depends(get_db_session),
@@ -276,60 +321,60 @@ async def obter_pedido(
     user=Depends(get_current_user),
 ):
     try:
-        vid = uuid.UUID(str(pedido_uuid))
+        vid = parse_uuid(str(pedido_uuid))
     except Exception:
         raise HTTPException(status_code=400, detail="pedido_uuid inválido")
 
+    # Itens + produtos carregados pelo ORM junto com a venda (o pedido já está restrito ao tenant)
     res = await db.execute(
         select(Venda)
-        .options(selectinload(Venda.usuario))
+        .options(
+            joinedload(Venda.usuario).load_only(User.nome),
+            selectinload(Venda.itens)
+            .joinedload(ItemVenda.produto)
+            .load_only(Produto.id, Produto.nome, Produto.descricao),
+        )
         .where(Venda.id == vid, Venda.tenant_id == tenant_id)
+        .limit(1)
     )
-    v = res.scalar_one_or_none()
+    v = res.scalars().first()
     if not v:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
 
-    res_itens = await db.execute(
-        select(ItemVenda, Produto)
-        .join(Produto, Produto.id == ItemVenda.produto_id)
-        .where(ItemVenda.venda_id == v.id, Produto.tenant_id == tenant_id)
-    )
-    itens_rows = res_itens.all()
-    itens_out = []
-    for item, produto in itens_rows:
-        itens_out.append(
-            {
-                "produto_id": str(getattr(produto, "id", "")),
-                "produto_nome": str(getattr(produto, "nome", None) or getattr(produto, "descricao", None) or "Produto"),
-                "quantidade": int(getattr(item, "quantidade", 0) or 0),
-                "preco_unitario": float(getattr(item, "preco_unitario", 0.0) or 0.0),
-                "subtotal": float(getattr(item, "subtotal", 0.0) or 0.0),
-            }
+    itens_out = [
+        PedidoItemOut.model_construct(
+            produto_id=str(item.produto.id) if item.produto else "",
+            produto_nome=((item.produto.nome or item.produto.descricao) if item.produto else None) or "Produto",
+            quantidade=int(item.quantidade or 0),
+            preco_unitario=float(item.preco_unitario or 0.0),
+            subtotal=float(item.subtotal or 0.0),
         )
+        for item in v.itens
+    ]
 
-    taxa_entrega = float(getattr(v, "taxa_entrega", 0.0) or 0.0)
-    total_base = float(getattr(v, "total", 0.0) or 0.0)
+    taxa_entrega = float(v.taxa_entrega or 0.0)
+    total_base = float(v.total or 0.0)
 
-    updated_at = getattr(v, "updated_at", None) or getattr(v, "created_at", None)
+    updated_at = v.updated_at or v.created_at
 
-    return PedidoDetail(
+    return PedidoDetail.model_construct(
         pedido_uuid=str(v.id),
-        pedido_id=str(v.id)[:8],
-        tipo_pedido=getattr(v, "tipo_pedido", None),
-        status=_resolve_status(v),
+        pedido_id=v.id.hex[:8],
+        tipo_pedido=v.tipo_pedido,
+        status=v.status_resolvido,
         total=total_base,
         taxa_entrega=taxa_entrega,
-        usuario_nome=getattr(getattr(v, "usuario", None), "nome", None),
-        status_updated_by_nome=getattr(v, "status_updated_by_nome", None),
-        status_updated_at=getattr(v, "status_updated_at", None),
-        mesa_id=getattr(v, "mesa_id", None),
-        lugar_numero=getattr(v, "lugar_numero", None),
-        distancia_tipo=getattr(v, "distancia_tipo", None),
-        cliente_nome=getattr(v, "cliente_nome", None),
-        cliente_telefone=getattr(v, "cliente_telefone", None),
-        endereco_entrega=getattr(v, "endereco_entrega", None),
-        observacoes=getattr(v, "observacoes", None),
-        created_at=getattr(v, "created_at", None),
+        usuario_nome=v.usuario.nome if v.usuario else None,
+        status_updated_by_nome=v.status_updated_by_nome,
+        status_updated_at=v.status_updated_at,
+        mesa_id=v.mesa_id,
+        lugar_numero=v.lugar_numero,
+        distancia_tipo=v.distancia_tipo,
+        cliente_nome=v.cliente_nome,
+        cliente_telefone=v.cliente_telefone,
+        endereco_entrega=v.endereco_entrega,
+        observacoes=v.observacoes,
+        created_at=v.created_at,
         updated_at=updated_at,
         itens=itens_out,
     )
@@ -343,33 +388,48 @@ async def atualizar_status_pedido(
     tenant_id: uuid.UUID = Depends(get_tenant_id),
     user=Depends(get_current_user),
 ):
-    novo = (payload.status or "").strip().lower()
+    novo = normalizar_status_pedido(payload.status or "")
     if not novo:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="status é obrigatório")
 
     try:
-        vid = uuid.UUID(str(pedido_uuid))
+        vid = parse_uuid(str(pedido_uuid))
     except Exception:
         raise HTTPException(status_code=400, detail="pedido_uuid inválido")
 
-    res = await db.execute(select(Venda).where(Venda.id == vid, Venda.tenant_id == tenant_id))
-    v = res.scalar_one_or_none()
-    if not v:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado")
-
-    # Regra definitiva: pedido pago não pode voltar/ser alterado.
-    status_atual = (getattr(v, "status_pedido", None) or "").strip().lower()
-    if status_atual == "pago":
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Pedido já está pago e não pode ser alterado")
-
-    v.status_pedido = novo
     try:
-        v.status_updated_by_nome = str(getattr(user, "nome", None) or getattr(user, "usuario", None) or "") or None
+        user_nome = str(getattr(user, "nome", None) or getattr(user, "usuario", None) or "") or None
     except Exception:
-        v.status_updated_by_nome = None
-    v.status_updated_at = datetime.utcnow()
+        user_nome = None
+
+    vals = {
+        "status_pedido": novo,
+        "status_updated_by_nome": user_nome,
+        "status_updated_at": datetime.utcnow(),
+    }
     if novo in ("cancelado", "cancelada"):
-        v.cancelada = True
+        vals["cancelada"] = True
+
+    # UPDATE direto (sem SELECT prévio). Regra definitiva: pedido pago não pode voltar/ser alterado,
+    # por isso a condição fica no próprio WHERE.
+    result = await db.execute(
+        update(Venda)
+        .where(
+            Venda.id == vid,
+            Venda.tenant_id == tenant_id,
+            Venda.status_pedido.is_distinct_from("pago"),
+        )
+        .values(**vals)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        await db.rollback()
+        # Só no caminho de erro: distinguir pedido inexistente de pedido já pago
+        res = await db.execute(select(Venda.id).where(Venda.id == vid, Venda.tenant_id == tenant_id).limit(1))
+        if res.scalar() is None:
+            raise HTTPException(status_code=404, detail="Pedido não encontrado")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Pedido já está pago e não pode ser alterado")
     await db.commit()
+    _list_cache_invalidate(tenant_id)
 
-    return {"ok": True, "pedido_uuid": str(v.id), "status": novo}
+    return {"ok": True, "pedido_uuid": str(vid), "status": novo}
@@ -1,18 +1,31 @@
 """Endpoints para gerenciamento de produtos com sincronização."""
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, status, UploadFile, File
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete, or_
+from sqlalchemy import Boolean, select, update, delete, and_, or_, lambda_stmt, literal_column, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import IntegrityError
-from typing import List, Optional
+from sqlalchemy.orm import raiseload
+from typing import Annotated, List, Optional
+import asyncio
+import errno
+import hashlib
+import shutil
+import tempfile
 import uuid
-from datetime import datetime
+from functools import lru_cache
+from datetime import datetime, timezone
+from time import monotonic
 import os
 
 from app.db.database import get_db_session
 from app.db.models import Produto
 from app.core.realtime import manager as realtime_manager
 from app.core.deps import get_tenant_id
-from pydantic import BaseModel
+from app.core.ids import parse_uuid
+from app.core.media import invalidar_listagem
+from app.core.menu_cache import menu_cache_invalidate
+from pydantic import BaseModel, StringConstraints
 
 router = APIRouter(prefix="/api/produtos", tags=["Produtos"])
 
@@ -47,11 +60,15 @@ class ProdutoUpdate(BaseModel):
     ativo: Optional[bool] = None
 
 
+# Só identificadores/códigos são aparados na validação; texto livre (descricao) chega como enviado
+_StrAparada = Annotated[str, StringConstraints(strip_whitespace=True)]
+
+
 class ProdutoUpsert(BaseModel):
-    codigo: str
-    nome: str
+    codigo: _StrAparada
+    nome: _StrAparada
     descricao: Optional[str] = None
-    imagem: Optional[str] = None
+    imagem: Optional[_StrAparada] = None
     preco_custo: Optional[float] = 0.0
     preco_venda: Optional[float] = 0.0
     estoque: Optional[float] = 0.0
@@ -64,22 +81,60 @@ class ProdutoUpsert(BaseModel):
     updated_at: Optional[str] = None
 
 
-def _parse_iso_dt(value: Optional[str]):
-    if not value:
-        return None
+@lru_cache(maxsize=4096)
+def _parse_iso_dt_cached(s: str) -> Optional[datetime]:
+    # Clientes de sync reenviam os mesmos timestamps; datetime é imutável, então o cache é seguro.
+    if s.endswith("Z"):
+        s = s[:-1] + "+00:00"
     try:
-        s = str(value)
-        if s.endswith("Z"):
-            s = s[:-1] + "+00:00"
         dt = datetime.fromisoformat(s)
-        try:
-            if getattr(dt, "tzinfo", None) is not None:
-                dt = dt.replace(tzinfo=None)
-        except Exception:
-            pass
-        return dt
-    except Exception:
+    except ValueError:
+        return None
+    # Sempre com fuso (UTC), como as colunas timestamptz voltam do asyncpg; sem offset, vale como UTC
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def _parse_iso_dt(value: Optional[str]):
+    if not value:
         return None
+    return _parse_iso_dt_cached(str(value))
+
+
+# Cache em memória da listagem (o catálogo é lido muito mais do que escrito). Cada tenant tem um
+# contador de versão que entra na chave: invalidar é só incrementar, sem varrer o dicionário.
+# TTL curto porque o estoque também muda por vendas e cada worker tem seu próprio cache.
+_PRODUTOS_CACHE: dict[tuple, tuple[float, list]] = {}
+_PRODUTOS_CACHE_VER: dict[uuid.UUID, int] = {}
+_PRODUTOS_CACHE_TTL_SECONDS = 5.0
+_PRODUTOS_CACHE_MAX = 1024
+
+
+def _produtos_cache_key(tenant_id: uuid.UUID, q: Optional[str], incluir_inativos: bool, *pagina) -> tuple:
+    return (tenant_id, _PRODUTOS_CACHE_VER.get(tenant_id, 0), (q or "").strip(), incluir_inativos, *pagina)
+
+
+def _produtos_cache_get(key: tuple) -> Optional[list]:
+    entry = _PRODUTOS_CACHE.get(key)
+    if entry and entry[0] > monotonic():
+        return entry[1]
+    return None
+
+
+def _produtos_cache_set(key: tuple, items: list) -> None:
+    if len(_PRODUTOS_CACHE) >= _PRODUTOS_CACHE_MAX:
+        agora = monotonic()
+        for k in [k for k, (exp, _) in _PRODUTOS_CACHE.items() if exp <= agora]:
+            _PRODUTOS_CACHE.pop(k, None)
+        if len(_PRODUTOS_CACHE) >= _PRODUTOS_CACHE_MAX:
+            _PRODUTOS_CACHE.clear()
+    _PRODUTOS_CACHE[key] = (monotonic() + _PRODUTOS_CACHE_TTL_SECONDS, items)
+
+
+def _produtos_cache_invalidar(tenant_id: uuid.UUID) -> None:
+    _PRODUTOS_CACHE_VER[tenant_id] = _PRODUTOS_CACHE_VER.get(tenant_id, 0) + 1
+    menu_cache_invalidate(tenant_id)
 
 
 @router.post("/upsert")
@@ -88,80 +143,70 @@ async def upsert_produto(
     db: AsyncSession = Depends(get_db_session),
     tenant_id: uuid.UUID = Depends(get_tenant_id),
 ):
-    codigo = (payload.codigo or "").strip()
-    nome = (payload.nome or "").strip()
+    codigo = payload.codigo
+    nome = payload.nome
     if not codigo or not nome:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="codigo e nome são obrigatórios")
 
-    result = await db.execute(
-        select(Produto).where(
-            Produto.codigo == codigo,
-            Produto.tenant_id == tenant_id,
-        )
-    )
-    existing = result.scalar_one_or_none()
-
     incoming_updated = _parse_iso_dt(payload.updated_at)
+    agora = datetime.now(timezone.utc)
+
+    vals = {
+        "id": uuid.uuid4(),
+        "tenant_id": tenant_id,
+        "codigo": codigo,
+        "nome": nome,
+        # Campos já chegam tipados pelo pydantic; o "or" só cobre null explícito do cliente
+        "descricao": payload.descricao or "",
+        "preco_custo": payload.preco_custo or 0.0,
+        "preco_venda": payload.preco_venda or 0.0,
+        "estoque": payload.estoque or 0.0,
+        "estoque_minimo": payload.estoque_minimo or 0.0,
+        "categoria_id": payload.categoria_id,
+        "venda_por_peso": payload.venda_por_peso or False,
+        "unidade_medida": payload.unidade_medida or "un",
+        "taxa_iva": payload.taxa_iva or 0.0,
+        "ativo": payload.ativo if payload.ativo is not None else True,
+        # updated_at é sempre hora do servidor (o sync/pull filtra por ela); a hora da edição no
+        # cliente vai para edited_at e só decide o conflito, como no sync/push
+        "updated_at": agora,
+        "edited_at": incoming_updated or agora,
+    }
 
-    if existing:
-        if incoming_updated and existing.updated_at and incoming_updated <= existing.updated_at:
-            return {"status": "skipped", "reason": "older_or_equal", "id": str(existing.id)}
-
-        update_data = {
-            "nome": nome,
-            "descricao": payload.descricao or "",
-            "preco_custo": float(payload.preco_custo or 0),
-            "preco_venda": float(payload.preco_venda or 0),
-            "estoque": float(payload.estoque or 0),
-            "estoque_minimo": float(payload.estoque_minimo or 0),
-            "categoria_id": payload.categoria_id,
-            "venda_por_peso": bool(payload.venda_por_peso or False),
-            "unidade_medida": payload.unidade_medida or "un",
-            "taxa_iva": float(payload.taxa_iva or 0.0),
-            "ativo": bool(payload.ativo if payload.ativo is not None else True),
-            "updated_at": incoming_updated or datetime.utcnow(),
-        }
-
-        if isinstance(payload.imagem, str):
-            img = payload.imagem.strip()
-            if img and not img.lower().startswith("assets/") and not img.lower().startswith("assets\\"):
-                update_data["imagem_path"] = img
-
-        await db.execute(
-            update(Produto)
-            .where(
-                Produto.id == existing.id,
-                Produto.tenant_id == tenant_id,
-            )
-            .values(**update_data)
-        )
-        await db.commit()
-        return {"status": "updated", "id": str(existing.id)}
-
-    produto = Produto(
-        id=uuid.uuid4(),
-        tenant_id=tenant_id,
-        codigo=codigo,
-        nome=nome,
-        descricao=payload.descricao or "",
-        preco_custo=float(payload.preco_custo or 0),
-        preco_venda=float(payload.preco_venda or 0),
-        estoque=float(payload.estoque or 0),
-        estoque_minimo=float(payload.estoque_minimo or 0),
-        categoria_id=payload.categoria_id,
-        venda_por_peso=bool(payload.venda_por_peso or False),
-        unidade_medida=payload.unidade_medida or "un",
-        taxa_iva=float(payload.taxa_iva or 0.0),
-        ativo=bool(payload.ativo if payload.ativo is not None else True),
-        updated_at=incoming_updated or datetime.utcnow(),
-    )
     if isinstance(payload.imagem, str):
-        img = payload.imagem.strip()
+        img = payload.imagem
         if img and not img.lower().startswith("assets/") and not img.lower().startswith("assets\\"):
-            produto.imagem_path = img
-    db.add(produto)
+            vals["imagem_path"] = img
+
+    # Um único INSERT ... ON CONFLICT: sem SELECT prévio e sem janela de corrida entre dois upserts
+    # do mesmo código. A regra "older_or_equal" vira o WHERE do DO UPDATE.
+    stmt = pg_insert(Produto).values(**vals)
+    atualizar_se = Produto.tenant_id == tenant_id
+    if incoming_updated:
+        atualizar_se = and_(
+            atualizar_se,
+            or_(Produto.edited_at.is_(None), stmt.excluded.edited_at > Produto.edited_at),
+        )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Produto.codigo],
+        set_={col: stmt.excluded[col] for col in vals if col not in ("id", "tenant_id", "codigo")},
+        where=atualizar_se,
+    ).returning(Produto.id, literal_column("xmax = 0", Boolean).label("created"))
+
+    row = (await db.execute(stmt)).first()
+    if row is None:
+        # Conflito sem UPDATE: registro mais novo no servidor, ou código pertencente a outro tenant
+        existing = (
+            await db.execute(select(Produto.id, Produto.tenant_id).where(Produto.codigo == codigo))
+        ).first()
+        await db.rollback()
+        if existing is not None and existing.tenant_id == tenant_id:
+            return {"status": "skipped", "reason": "older_or_equal", "id": str(existing.id)}
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Produto com este código já existe")
+
     await db.commit()
-    return {"status": "created", "id": str(produto.id)}
+    _produtos_cache_invalidar(tenant_id)
+    return {"status": "created" if row.created else "updated", "id": str(row.id)}
 
 class ProdutoResponse(BaseModel):
     id: str
@@ -205,25 +250,100 @@ class ProdutoResponse(BaseModel):
             updated_at=obj.updated_at
         )
 
-@router.get("/", response_model=List[ProdutoResponse])
+_LISTAGEM_COLUNAS = (
+    Produto.id,
+    Produto.codigo,
+    Produto.nome,
+    Produto.descricao,
+    Produto.preco_custo,
+    Produto.preco_venda,
+    Produto.estoque,
+    Produto.estoque_minimo,
+    Produto.categoria_id,
+    Produto.venda_por_peso,
+    Produto.unidade_medida,
+    Produto.taxa_iva,
+    Produto.ativo,
+    Produto.imagem_path,
+    Produto.created_at,
+    Produto.updated_at,
+)
+
+
+def _produto_listagem_out(r) -> dict:
+    """Linha no formato de ProdutoResponse, serializada direto por orjson (sem modelo pydantic por linha).
+
+    ProdutoResponse continua como response_model apenas para documentar o contrato no OpenAPI.
+    """
+    return {
+        "id": str(r.id),
+        "codigo": r.codigo,
+        "nome": r.nome,
+        "descricao": r.descricao,
+        "preco_custo": r.preco_custo,
+        "preco_venda": r.preco_venda,
+        "estoque": r.estoque,
+        "estoque_minimo": r.estoque_minimo,
+        "categoria_id": r.categoria_id,
+        "venda_por_peso": r.venda_por_peso,
+        "unidade_medida": r.unidade_medida,
+        "taxa_iva": r.taxa_iva if r.taxa_iva is not None else 0.0,
+        "ativo": r.ativo,
+        "imagem_path": r.imagem_path,
+        "created_at": r.created_at,
+        "updated_at": r.updated_at,
+    }
+
+
+_LISTAGEM_SELECT = select(*_LISTAGEM_COLUNAS)
+
+
+@router.get("/", response_model=List[ProdutoResponse], response_class=ORJSONResponse)
 async def get_produtos(
     db: AsyncSession = Depends(get_db_session),
     tenant_id: uuid.UUID = Depends(get_tenant_id),
     q: Optional[str] = None,
     incluir_inativos: bool = False,
+    after_nome: Optional[str] = None,
+    after_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
 ):
-    """Lista todos os produtos ativos."""
+    """Lista todos os produtos ativos.
+
+    Paginação opcional por keyset: passe `limit` e, nas páginas seguintes, o `nome`/`id` do último
+    item recebido em `after_nome`/`after_id` (sem OFFSET).
+    """
     try:
-        query = select(Produto).where(Produto.tenant_id == tenant_id)
+        after_uuid = uuid.UUID(after_id) if after_id else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="after_id inválido")
+
+    try:
+        cache_key = _produtos_cache_key(tenant_id, q, incluir_inativos, after_nome, after_uuid, limit)
+        cached = _produtos_cache_get(cache_key)
+        if cached is not None:
+            return ORJSONResponse(cached)
+
+        # lambda_stmt: o SQL compilado fica em cache por forma de consulta; só os parâmetros variam
+        stmt = lambda_stmt(lambda: _LISTAGEM_SELECT.where(Produto.tenant_id == tenant_id))
         if not incluir_inativos:
-            query = query.where(Produto.ativo == True)
+            stmt += lambda s: s.where(Produto.ativo == True)
         if q:
             term = f"%{q.strip()}%"
-            query = query.where(or_(Produto.nome.ilike(term), Produto.codigo.ilike(term)))
-
-        result = await db.execute(query.order_by(Produto.nome))
-        produtos = result.scalars().all()
-        return [ProdutoResponse.from_orm(p) for p in produtos]
+            stmt += lambda s: s.where(or_(Produto.nome.ilike(term), Produto.codigo.ilike(term)))
+        if after_nome is not None:
+            if after_uuid is not None:
+                stmt += lambda s: s.where(tuple_(Produto.nome, Produto.id) > tuple_(after_nome, after_uuid))
+            else:
+                stmt += lambda s: s.where(Produto.nome > after_nome)
+        stmt += lambda s: s.order_by(Produto.nome, Produto.id)
+        if limit:
+            stmt += lambda s: s.limit(limit)
+
+        result = await db.execute(stmt)
+        resp = [_produto_listagem_out(r) for r in result]
+        _produtos_cache_set(cache_key, resp)
+        return ORJSONResponse(resp)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -239,10 +359,10 @@ async def get_produto(
     """Busca produto por UUID."""
     try:
         # Tentar converter para UUID
-        produto_id = uuid.UUID(produto_uuid)
+        produto_id = parse_uuid(produto_uuid)
         
         result = await db.execute(
-            select(Produto).where(
+            select(Produto).options(raiseload("*")).where(
                 Produto.id == produto_id,
                 Produto.ativo == True,
                 Produto.tenant_id == tenant_id,
@@ -279,51 +399,49 @@ async def create_produto(
         # Gerar UUID se não fornecido
         produto_uuid = uuid.UUID(produto_data.uuid) if produto_data.uuid else uuid.uuid4()
         
-        # Verificar se UUID já existe
-        existing = await db.execute(
-            select(Produto).where(
-                Produto.id == produto_uuid,
-                Produto.tenant_id == tenant_id,
-            )
-        )
-        if existing.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Produto com este UUID já existe"
+        # INSERT ... ON CONFLICT (id) DO NOTHING RETURNING: detecção de UUID duplicado atômica e a
+        # linha criada (com created_at/updated_at do servidor) no mesmo round trip.
+        stmt = (
+            pg_insert(Produto)
+            .values(
+                id=produto_uuid,
+                tenant_id=tenant_id,
+                codigo=produto_data.codigo,
+                nome=produto_data.nome,
+                descricao=produto_data.descricao,
+                preco_custo=produto_data.preco_custo,
+                preco_venda=produto_data.preco_venda,
+                estoque=produto_data.estoque,
+                estoque_minimo=produto_data.estoque_minimo,
+                categoria_id=produto_data.categoria_id,
+                venda_por_peso=produto_data.venda_por_peso,
+                unidade_medida=produto_data.unidade_medida,
+                taxa_iva=getattr(produto_data, "taxa_iva", 0.0),
+                ativo=bool(getattr(produto_data, "ativo", True)),
             )
-        
-        # Criar produto
-        produto = Produto(
-            id=produto_uuid,
-            tenant_id=tenant_id,
-            codigo=produto_data.codigo,
-            nome=produto_data.nome,
-            descricao=produto_data.descricao,
-            preco_custo=produto_data.preco_custo,
-            preco_venda=produto_data.preco_venda,
-            estoque=produto_data.estoque,
-            estoque_minimo=produto_data.estoque_minimo,
-            categoria_id=produto_data.categoria_id,
-            venda_por_peso=produto_data.venda_por_peso,
-            unidade_medida=produto_data.unidade_medida,
-            taxa_iva=getattr(produto_data, "taxa_iva", 0.0),
-            ativo=bool(getattr(produto_data, "ativo", True))
+            .on_conflict_do_nothing(index_elements=[Produto.id])
+            .returning(Produto)
         )
-        
-        db.add(produto)
         try:
-            await db.commit()
+            produto = (await db.execute(stmt)).scalar_one_or_none()
         except IntegrityError:
             await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail="Produto com este código já existe",
             )
-        await db.refresh(produto)
+        if produto is None:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Produto com este UUID já existe"
+            )
+        await db.commit()
+        _produtos_cache_invalidar(tenant_id)
         
         # Broadcast realtime: produto criado
         try:
-            await realtime_manager.broadcast("produto.created", {
+            realtime_manager.enqueue("produto.created", {
                 "ts": datetime.utcnow().isoformat(),
                 "data": {
                     "id": str(produto.id),
@@ -363,43 +481,45 @@ async def update_produto(
     """Atualiza produto existente."""
     try:
         # Converter UUID
-        produto_id = uuid.UUID(produto_uuid)
+        produto_id = parse_uuid(produto_uuid)
         
-        # Buscar produto
-        result = await db.execute(
-            select(Produto).where(
-                Produto.id == produto_id,
-                Produto.ativo == True,
-                Produto.tenant_id == tenant_id,
-            )
+        update_data = produto_data.model_dump(exclude_unset=True)
+        filtro = (
+            Produto.id == produto_id,
+            Produto.ativo == True,
+            Produto.tenant_id == tenant_id,
         )
+        if update_data:
+            update_data['updated_at'] = datetime.utcnow()
+            # Edição feita no servidor agora: versões offline mais antigas não a sobrescrevem no sync
+            update_data['edited_at'] = datetime.now(timezone.utc)
+
+            # Um único UPDATE ... RETURNING: existência, escrita e linha final no mesmo round trip
+            result = await db.execute(
+                update(Produto)
+                .where(*filtro)
+                .values(**update_data)
+                .returning(Produto)
+                .execution_options(populate_existing=True)
+            )
+        else:
+            result = await db.execute(select(Produto).options(raiseload("*")).where(*filtro))
         produto = result.scalar_one_or_none()
-        
+
         if not produto:
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Produto não encontrado"
             )
-        
-        # Atualizar campos fornecidos
-        update_data = produto_data.dict(exclude_unset=True)
+
         if update_data:
-            update_data['updated_at'] = datetime.utcnow()
-            
-            await db.execute(
-                update(Produto)
-                .where(
-                    Produto.id == produto_id,
-                    Produto.tenant_id == tenant_id,
-                )
-                .values(**update_data)
-            )
             await db.commit()
-            await db.refresh(produto)
+            _produtos_cache_invalidar(tenant_id)
         
         # Broadcast realtime: produto atualizado
         try:
-            await realtime_manager.broadcast("produto.updated", {
+            realtime_manager.enqueue("produto.updated", {
                 "ts": datetime.utcnow().isoformat(),
                 "data": {
                     "id": str(produto.id),
@@ -429,6 +549,69 @@ async def update_produto(
         )
 
 
+_UPLOAD_CHUNK = 1 << 20
+
+
+def _upload_tmp_dir() -> str:
+    # Fora do MEDIA_DIR (servido em /media): um upload interrompido não deixa lixo público
+    return os.getenv("UPLOAD_TMP_DIR") or tempfile.gettempdir()
+
+
+def _publicar_upload(tmp_path: str, abs_path: str) -> None:
+    # Mesmo conteúdo já gravado (outro produto ou reenvio): descarta a cópia temporária
+    if os.path.exists(abs_path):
+        os.remove(tmp_path)
+        return
+    try:
+        os.replace(tmp_path, abs_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Temporário em outro filesystem: copia para um nome oculto ao lado do destino e renomeia,
+        # para que o nome final (usado no dedup acima) nunca aponte para um arquivo incompleto
+        parcial = os.path.join(os.path.dirname(abs_path), f".{uuid.uuid4().hex}.part")
+        try:
+            shutil.copyfile(tmp_path, parcial)
+            os.replace(parcial, abs_path)
+        except BaseException:
+            if os.path.exists(parcial):
+                os.remove(parcial)
+            raise
+        finally:
+            os.remove(tmp_path)
+
+
+def _remover_arquivo(abs_path: str) -> None:
+    try:
+        os.remove(abs_path)
+    except FileNotFoundError:
+        pass
+
+
+async def _salvar_upload(file: UploadFile, abs_dir: str, ext: str) -> str:
+    """Copia o upload para o disco em blocos de 1 MiB (escrita em thread, fora do event loop).
+
+    O arquivo é nomeado pelo SHA-256 do conteúdo, calculado durante a cópia: imagens idênticas
+    ocupam um único arquivo. Retorna o nome final.
+    """
+    digest = hashlib.sha256()
+    fd, tmp_path = await asyncio.to_thread(tempfile.mkstemp, ".part", ".upload-", _upload_tmp_dir())
+    f = await asyncio.to_thread(os.fdopen, fd, "wb")
+    try:
+        while chunk := await file.read(_UPLOAD_CHUNK):
+            digest.update(chunk)
+            await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.remove, tmp_path)
+        raise
+    await asyncio.to_thread(f.close)
+
+    out_name = f"{digest.hexdigest()}{ext}"
+    await asyncio.to_thread(_publicar_upload, tmp_path, os.path.join(abs_dir, out_name))
+    return out_name
+
+
 @router.post("/{produto_uuid}/imagem", response_model=ProdutoResponse)
 async def upload_imagem_produto(
     produto_uuid: str,
@@ -437,47 +620,68 @@ async def upload_imagem_produto(
     tenant_id: uuid.UUID = Depends(get_tenant_id),
 ):
     try:
-        produto_id = uuid.UUID(produto_uuid)
+        produto_id = parse_uuid(produto_uuid)
+
+        filename = (file.filename or "").strip()
+        ext = os.path.splitext(filename)[1].lower()
+        if ext not in [".jpg", ".jpeg", ".png", ".webp"]:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Formato inválido (use jpg, png ou webp)")
+
         result = await db.execute(
-            select(Produto).where(
+            select(Produto.id, Produto.imagem_path).where(
                 Produto.id == produto_id,
                 Produto.tenant_id == tenant_id,
             )
         )
-        produto = result.scalar_one_or_none()
-        if not produto:
+        atual = result.one_or_none()
+        if atual is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Produto não encontrado")
+        imagem_anterior = atual.imagem_path
 
-        filename = (file.filename or "").strip()
-        ext = os.path.splitext(filename)[1].lower()
-        if ext not in [".jpg", ".jpeg", ".png", ".webp"]:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Formato inválido (use jpg, png ou webp)")
+        # Devolve a conexão ao pool durante a escrita em disco (pode levar segundos para arquivos
+        # grandes); a sessão pega outra conexão só para o UPDATE final.
+        await db.close()
 
         media_dir = os.getenv("MEDIA_DIR", "media")
         rel_dir = os.path.join("produtos", str(tenant_id))
         abs_dir = os.path.join(media_dir, rel_dir)
-        os.makedirs(abs_dir, exist_ok=True)
+        await asyncio.to_thread(os.makedirs, abs_dir, exist_ok=True)
 
-        out_name = f"{produto_id}{ext}"
-        abs_path = os.path.join(abs_dir, out_name)
-
-        content = await file.read()
-        with open(abs_path, "wb") as f:
-            f.write(content)
+        out_name = await _salvar_upload(file, abs_dir, ext)
+        invalidar_listagem(abs_dir)
 
         imagem_path = f"/media/produtos/{tenant_id}/{out_name}"
-        await db.execute(
+        result2 = await db.execute(
             update(Produto)
             .where(Produto.id == produto_id, Produto.tenant_id == tenant_id)
             .values(imagem_path=imagem_path, updated_at=datetime.utcnow())
+            .returning(Produto)
         )
+        produto2 = result2.scalar_one_or_none()
+        if produto2 is None:
+            await db.rollback()
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Produto não encontrado")
         await db.commit()
-
-        result2 = await db.execute(
-            select(Produto).where(Produto.id == produto_id, Produto.tenant_id == tenant_id)
-        )
-        produto2 = result2.scalar_one()
-        return ProdutoResponse.from_orm(produto2)
+        _produtos_cache_invalidar(tenant_id)
+        resposta = ProdutoResponse.from_orm(produto2)
+
+        # Imagem anterior: só depois do UPDATE confirmado, e só se nenhum outro produto aponta para o
+        # mesmo arquivo (nomes por hash são compartilhados entre produtos com a mesma imagem). Falhar
+        # aqui não desfaz o upload já confirmado.
+        prefixo = f"/media/produtos/{tenant_id}/"
+        if imagem_anterior and imagem_anterior != imagem_path and imagem_anterior.startswith(prefixo):
+            nome_anterior = imagem_anterior[len(prefixo):]
+            if nome_anterior and "/" not in nome_anterior:
+                try:
+                    ainda_usada = await db.execute(
+                        select(Produto.id).where(Produto.imagem_path == imagem_anterior).limit(1)
+                    )
+                    if ainda_usada.scalar_one_or_none() is None:
+                        await asyncio.to_thread(_remover_arquivo, os.path.join(abs_dir, nome_anterior))
+                        invalidar_listagem(abs_dir)
+                except Exception:
+                    pass
+        return resposta
     except ValueError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="UUID inválido")
     except HTTPException:
@@ -495,11 +699,11 @@ async def delete_produto(
     """Exclusão do produto."""
     try:
         # Converter UUID
-        produto_id = uuid.UUID(produto_uuid)
+        produto_id = parse_uuid(produto_uuid)
 
         # Verificar se produto existe (independente de ativo)
         result = await db.execute(
-            select(Produto).where(
+            select(Produto).options(raiseload("*")).where(
                 Produto.id == produto_id,
                 Produto.tenant_id == tenant_id,
             )
@@ -521,6 +725,7 @@ async def delete_produto(
                 )
             )
             await db.commit()
+            _produtos_cache_invalidar(tenant_id)
         except IntegrityError:
             await db.rollback()
             raise HTTPException(
@@ -530,7 +735,7 @@ async def delete_produto(
 
         # Broadcast realtime: produto deletado
         try:
-            await realtime_manager.broadcast("produto.deleted", {
+            realtime_manager.enqueue("produto.deleted", {
                 "ts": datetime.utcnow().isoformat(),
                 "data": {
                     "id": str(produto_id),
@@ -555,6 +760,11 @@ async def delete_produto(
             detail=f"Erro ao deletar produto: {str(e)}"
         )
 
+# Linhas por INSERT ... ON CONFLICT: ~15 parâmetros por produto, e o asyncpg limita uma instrução
+# a 32767 parâmetros.
+_SYNC_PUSH_LOTE = 1000
+
+
 # Endpoints de sincronização
 @router.post("/sync/push")
 async def sync_push_produtos(
@@ -564,77 +774,69 @@ async def sync_push_produtos(
 ):
     """Recebe produtos do cliente para sincronização."""
     try:
-        synced_count = 0
         errors = []
-        
+        agora = datetime.now(timezone.utc)
+
+        # Valida tudo em memória primeiro; o lote inteiro vira um único INSERT ... ON CONFLICT.
+        # Chave por id: o mesmo uuid repetido no lote faria o ON CONFLICT afetar a linha duas vezes.
+        rows_por_id = {}
         for produto_data in produtos:
             try:
-                produto_uuid = uuid.UUID(produto_data['uuid'])
-                
-                # Verificar se produto já existe
-                result = await db.execute(
-                    select(Produto).where(
-                        Produto.id == produto_uuid,
-                        Produto.tenant_id == tenant_id,
-                    )
-                )
-                existing = result.scalar_one_or_none()
-                
-                if existing:
-                    # Atualizar produto existente
-                    update_data = {
-                        'codigo': produto_data.get('codigo', ''),
-                        'nome': produto_data['nome'],
-                        'descricao': produto_data.get('descricao', ''),
-                        'preco_custo': produto_data.get('preco_custo', 0),
-                        'preco_venda': produto_data.get('preco_venda', 0),
-                        'estoque': produto_data.get('estoque', 0),
-                        'estoque_minimo': produto_data.get('estoque_minimo', 0),
-                        'categoria_id': produto_data.get('categoria_id'),
-                        'venda_por_peso': produto_data.get('venda_por_peso', False),
-                        'unidade_medida': produto_data.get('unidade_medida', 'un'),
-                        'taxa_iva': produto_data.get('taxa_iva', 0.0),
-                        'updated_at': datetime.utcnow()
-                    }
-                    
-                    await db.execute(
-                        update(Produto)
-                        .where(
-                            Produto.id == produto_uuid,
-                            Produto.tenant_id == tenant_id,
-                        )
-                        .values(**update_data)
-                    )
-                else:
-                    # Criar novo produto
-                    produto = Produto(
-                        id=produto_uuid,
-                        tenant_id=tenant_id,
-                        codigo=produto_data.get('codigo', ''),
-                        nome=produto_data['nome'],
-                        descricao=produto_data.get('descricao', ''),
-                        preco_custo=produto_data.get('preco_custo', 0),
-                        preco_venda=produto_data.get('preco_venda', 0),
-                        estoque=produto_data.get('estoque', 0),
-                        estoque_minimo=produto_data.get('estoque_minimo', 0),
-                        categoria_id=produto_data.get('categoria_id'),
-                        venda_por_peso=produto_data.get('venda_por_peso', False),
-                        unidade_medida=produto_data.get('unidade_medida', 'un'),
-                        taxa_iva=produto_data.get('taxa_iva', 0.0),
-                        ativo=True
-                    )
-                    db.add(produto)
-                
-                synced_count += 1
-                
+                produto_uuid = parse_uuid(str(produto_data['uuid']))
+                rows_por_id[produto_uuid] = {
+                    'id': produto_uuid,
+                    'tenant_id': tenant_id,
+                    'codigo': produto_data.get('codigo', ''),
+                    'nome': produto_data['nome'],
+                    'descricao': produto_data.get('descricao', ''),
+                    'preco_custo': produto_data.get('preco_custo', 0),
+                    'preco_venda': produto_data.get('preco_venda', 0),
+                    'estoque': produto_data.get('estoque', 0),
+                    'estoque_minimo': produto_data.get('estoque_minimo', 0),
+                    'categoria_id': produto_data.get('categoria_id'),
+                    'venda_por_peso': produto_data.get('venda_por_peso', False),
+                    'unidade_medida': produto_data.get('unidade_medida', 'un'),
+                    'taxa_iva': produto_data.get('taxa_iva', 0.0),
+                    'ativo': True,
+                    # Sempre hora do servidor: o sync/pull filtra por updated_at > last_sync, e uma
+                    # edição offline enviada tarde com a hora do cliente nunca seria puxada.
+                    'updated_at': agora,
+                    # Hora da edição no cliente: só para a regra "última escrita vence"
+                    'edited_at': _parse_iso_dt(produto_data.get('updated_at')) or agora,
+                }
             except Exception as e:
                 errors.append({
                     'uuid': produto_data.get('uuid', 'unknown'),
                     'error': str(e)
                 })
-        
+
+        rows = list(rows_por_id.values())
+        synced_count = 0
+        for inicio in range(0, len(rows), _SYNC_PUSH_LOTE):
+            lote = rows[inicio:inicio + _SYNC_PUSH_LOTE]
+
+            stmt = pg_insert(Produto).values(lote)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Produto.id],
+                # ativo só é definido na criação, como antes; a linha existente precisa ser do tenant.
+                # Última escrita vence comparando hora de edição com hora de edição (edited_at), no
+                # próprio banco; linhas ainda sem edited_at aceitam a versão recebida.
+                set_={
+                    c.name: stmt.excluded[c.name]
+                    for c in stmt.excluded
+                    if c.name in lote[0] and c.name not in ('id', 'tenant_id', 'ativo')
+                },
+                where=and_(
+                    Produto.tenant_id == tenant_id,
+                    or_(Produto.edited_at.is_(None), stmt.excluded.edited_at > Produto.edited_at),
+                ),
+            ).returning(Produto.id)
+            # RETURNING só traz as linhas inseridas ou atualizadas (não as barradas pelo WHERE)
+            synced_count += len((await db.execute(stmt)).all())
+
         await db.commit()
-        
+        _produtos_cache_invalidar(tenant_id)
+
         return {
             'synced_count': synced_count,
             'errors': errors,
@@ -648,15 +850,41 @@ async def sync_push_produtos(
             detail=f"Erro na sincronização: {str(e)}"
         )
 
-@router.get("/sync/pull")
+_SYNC_PULL_COLUNAS = (
+    Produto.id,
+    Produto.codigo,
+    Produto.nome,
+    Produto.descricao,
+    Produto.preco_custo,
+    Produto.preco_venda,
+    Produto.estoque,
+    Produto.estoque_minimo,
+    Produto.categoria_id,
+    Produto.venda_por_peso,
+    Produto.unidade_medida,
+    Produto.taxa_iva,
+    Produto.ativo,
+    Produto.created_at,
+    Produto.updated_at,
+)
+
+
+@router.get("/sync/pull", response_class=ORJSONResponse)
 async def sync_pull_produtos(
     last_sync: Optional[str] = None,
+    after_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=5000),
     db: AsyncSession = Depends(get_db_session),
     tenant_id: uuid.UUID = Depends(get_tenant_id),
 ):
-    """Envia produtos atualizados para o cliente."""
+    """Envia produtos atualizados para o cliente.
+
+    Com `limit`, o cliente pagina por (updated_at, id): repassa o `next_cursor` recebido como
+    `last_sync`/`after_id` até `has_more` ser falso.
+    """
     try:
-        query = select(Produto).where(
+        # Só as colunas usadas: tuplas leves em vez de entidades ORM
+        query = select(*_SYNC_PULL_COLUNAS).where(
             Produto.ativo == True,
             Produto.tenant_id == tenant_id,
         )
@@ -665,37 +893,52 @@ async def sync_pull_produtos(
         if last_sync:
             try:
                 last_sync_date = datetime.fromisoformat(last_sync.replace('Z', '+00:00'))
-                query = query.where(Produto.updated_at > last_sync_date)
+                if after_id:
+                    query = query.where(
+                        tuple_(Produto.updated_at, Produto.id) > tuple_(last_sync_date, uuid.UUID(after_id))
+                    )
+                else:
+                    query = query.where(Produto.updated_at > last_sync_date)
             except ValueError:
-                pass  # Ignorar data inválida
+                pass  # Ignorar data/cursor inválido
         
-        result = await db.execute(query.order_by(Produto.updated_at))
-        produtos = result.scalars().all()
-        
-        return {
-            'produtos': [
-                {
-                    'uuid': str(produto.id),
-                    'codigo': produto.codigo,
-                    'nome': produto.nome,
-                    'descricao': produto.descricao,
-                    'preco_custo': produto.preco_custo,
-                    'preco_venda': produto.preco_venda,
-                    'estoque': produto.estoque,
-                    'estoque_minimo': produto.estoque_minimo,
-                    'categoria_id': produto.categoria_id,
-                    'venda_por_peso': produto.venda_por_peso,
-                    'unidade_medida': produto.unidade_medida,
-                    'taxa_iva': getattr(produto, 'taxa_iva', 0.0),
-                    'ativo': produto.ativo,
-                    'created_at': produto.created_at.isoformat(),
-                    'updated_at': produto.updated_at.isoformat()
-                }
-                for produto in produtos
-            ],
+        query = query.order_by(Produto.updated_at, Produto.id)
+        if limit:
+            query = query.limit(limit)
+
+        # Cursor no servidor: as linhas são convertidas à medida que chegam
+        produtos = []
+        result = await db.stream(query)
+        async for r in result:
+            produtos.append({
+                'uuid': str(r.id),
+                'codigo': r.codigo,
+                'nome': r.nome,
+                'descricao': r.descricao,
+                'preco_custo': r.preco_custo,
+                'preco_venda': r.preco_venda,
+                'estoque': r.estoque,
+                'estoque_minimo': r.estoque_minimo,
+                'categoria_id': r.categoria_id,
+                'venda_por_peso': r.venda_por_peso,
+                'unidade_medida': r.unidade_medida,
+                'taxa_iva': r.taxa_iva if r.taxa_iva is not None else 0.0,
+                'ativo': r.ativo,
+                'created_at': r.created_at.isoformat(),
+                'updated_at': r.updated_at.isoformat()
+            })
+
+        has_more = bool(limit) and len(produtos) == limit
+        return ORJSONResponse({
+            'produtos': produtos,
             'count': len(produtos),
-            'sync_timestamp': datetime.utcnow().isoformat()
-        }
+            'sync_timestamp': datetime.utcnow().isoformat(),
+            'has_more': has_more,
+            'next_cursor': (
+                {'last_sync': produtos[-1]['updated_at'], 'after_id': produtos[-1]['uuid']}
+                if has_more else None
+            ),
+        })
         
     except Exception as e:
         raise HTTPException(
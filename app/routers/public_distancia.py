@@ -6,8 +6,9 @@ from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
-from sqlalchemy import select
+from sqlalchemy import insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
 
 from app.core.deps import get_tenant_id
 from app.db.database import get_db_session
@@ -62,41 +63,25 @@ async def distancia_checkout(
         if tipo == "entrega" and not (payload.endereco_entrega and payload.endereco_entrega.strip()):
             raise HTTPException(status_code=400, detail="endereco_entrega é obrigatório para entrega")
 
-        venda_uuid = uuid.uuid4()
-
-        nova_venda = Venda(
-            id=venda_uuid,
-            tenant_id=tenant_id,
-            usuario_id=None,
-            cliente_id=None,
-            total=0.0,
-            desconto=0.0,
-            forma_pagamento="PENDENTE_PAGAMENTO",
-            tipo_pedido="distancia",
-            status_pedido="aguardando_pagamento",
-            distancia_tipo=tipo,
-            cliente_nome=payload.cliente_nome,
-            cliente_telefone=payload.cliente_telefone,
-            endereco_entrega=payload.endereco_entrega,
-            taxa_entrega=float(payload.taxa_entrega or 0.0),
-            observacoes=None,
-            cancelada=False,
-            created_at=datetime.utcnow(),
-        )
-        db.add(nova_venda)
-        await db.flush()
-
-        total = 0.0
+        # Validação completa (UUIDs + catálogo) antes de qualquer escrita: pedido rejeitado não
+        # custa INSERT + ROLLBACK. Um único SELECT ... IN para todo o catálogo do pedido.
+        produto_ids = []
         for it in payload.itens:
             try:
-                produto_uuid = uuid.UUID(str(it.produto_id))
+                produto_ids.append(uuid.UUID(str(it.produto_id)))
             except Exception:
                 raise HTTPException(status_code=400, detail=f"produto_id inválido: {it.produto_id}")
 
-            res_prod = await db.execute(
-                select(Produto).where(Produto.id == produto_uuid, Produto.tenant_id == tenant_id)
-            )
-            produto = res_prod.scalar_one_or_none()
+        res_prod = await db.execute(
+            select(Produto).options(raiseload("*")).where(Produto.tenant_id == tenant_id, Produto.id.in_(set(produto_ids)))
+        )
+        produtos_por_id = {p.id: p for p in res_prod.scalars().all()}
+
+        venda_uuid = uuid.uuid4()
+        total = 0.0
+        itens_rows: list[dict] = []
+        for it, produto_uuid in zip(payload.itens, produto_ids):
+            produto = produtos_por_id.get(produto_uuid)
             if not produto:
                 raise HTTPException(status_code=400, detail=f"Produto inexistente no servidor: {it.produto_id}")
 
@@ -113,21 +98,45 @@ async def distancia_checkout(
                 base_iva = subtotal
                 valor_iva = 0.0
 
-            item = ItemVenda(
-                venda_id=nova_venda.id,
-                produto_id=produto_uuid,
-                quantidade=qtd,
-                peso_kg=0.0,
-                preco_unitario=preco_unit,
-                subtotal=subtotal,
-                taxa_iva=taxa_iva,
-                base_iva=base_iva,
-                valor_iva=valor_iva,
+            itens_rows.append(
+                {
+                    "venda_id": venda_uuid,
+                    "produto_id": produto_uuid,
+                    "quantidade": qtd,
+                    "peso_kg": 0.0,
+                    "preco_unitario": preco_unit,
+                    "subtotal": subtotal,
+                    "taxa_iva": taxa_iva,
+                    "base_iva": base_iva,
+                    "valor_iva": valor_iva,
+                }
             )
-            db.add(item)
             total += subtotal
 
-        nova_venda.total = float(total + float(payload.taxa_entrega or 0.0))
+        nova_venda = Venda(
+            id=venda_uuid,
+            tenant_id=tenant_id,
+            usuario_id=None,
+            cliente_id=None,
+            total=float(total + float(payload.taxa_entrega or 0.0)),
+            desconto=0.0,
+            forma_pagamento="PENDENTE_PAGAMENTO",
+            tipo_pedido="distancia",
+            status_pedido="aguardando_pagamento",
+            distancia_tipo=tipo,
+            cliente_nome=payload.cliente_nome,
+            cliente_telefone=payload.cliente_telefone,
+            endereco_entrega=payload.endereco_entrega,
+            taxa_entrega=float(payload.taxa_entrega or 0.0),
+            observacoes=None,
+            cancelada=False,
+            created_at=datetime.utcnow(),
+        )
+        db.add(nova_venda)
+        await db.flush()
+
+        # Itens num único INSERT executemany (Core), sem unit-of-work do ORM por item
+        await db.execute(insert(ItemVenda), itens_rows)
 
         payment = PaymentTransaction(
             id=uuid.uuid4(),
@@ -1,14 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, or_
-from typing import Optional, List
+from types import MappingProxyType
+from typing import Mapping, Optional, List
 import uuid
 import os
+from functools import lru_cache
+from pathlib import Path
+
+import orjson
 
 from app.db.database import get_db_session
-from app.db.models import Produto, Tenant
-from app.core.deps import get_tenant_id
+from app.db.models import Produto
+from app.core.deps import get_tenant
+from app.core.menu_cache import menu_cache_get, menu_cache_key, menu_cache_set
+from app.core.media import arquivo_existe, carregar_listagens, listar_arquivos
+from app.core.tenant_cache import TenantInfo, get_tenant_by_slug
 
 router = APIRouter(prefix="/public/menu", tags=["public_menu"])
 
@@ -25,115 +34,209 @@ class PublicProdutoOut(BaseModel):
     estoque: float
 
 
-def _categoria_nome_por_tipo(tipo_negocio: str, categoria_id: Optional[int]) -> Optional[str]:
-    if not categoria_id:
-        return None
-    tipo = (tipo_negocio or "").strip().lower()
-
-    # Listas alinhadas com /api/categorias (routers/categorias.py)
-    if tipo == "restaurante":
-        mapping = {
-            1: "Pratos",
-            2: "Bebidas",
-            3: "Entradas",
-            4: "Sobremesas",
-            5: "Acompanhamentos",
-            6: "Lanches",
-            7: "Pizzas",
-            8: "Saladas",
-            9: "Grelhados",
-            10: "Massas",
-            11: "Outros",
-        }
-        return mapping.get(int(categoria_id))
-
-    mapping = {
-        1: "Alimentos",
-        2: "Bebidas",
-        3: "Limpeza",
-        4: "Higiene",
-        5: "Congelados",
-        6: "Mercearia",
-        7: "Padaria",
-        8: "Hortifruti",
-        9: "Açougue",
-        10: "Laticínios",
-        11: "Outros",
-    }
-    return mapping.get(int(categoria_id))
-
-
-def _resolve_public_image_path(produto: Produto, tenant_id: uuid.UUID) -> Optional[str]:
-    existing = getattr(produto, "imagem_path", None)
-    if isinstance(existing, str) and existing.strip():
-        s = existing.strip()
+# Listas alinhadas com /api/categorias (routers/categorias.py); imutáveis e montadas uma vez.
+_CAT_RESTAURANTE: Mapping[int, str] = MappingProxyType({
+    1: "Pratos",
+    2: "Bebidas",
+    3: "Entradas",
+    4: "Sobremesas",
+    5: "Acompanhamentos",
+    6: "Lanches",
+    7: "Pizzas",
+    8: "Saladas",
+    9: "Grelhados",
+    10: "Massas",
+    11: "Outros",
+})
+
+_CAT_GENERICO: Mapping[int, str] = MappingProxyType({
+    1: "Alimentos",
+    2: "Bebidas",
+    3: "Limpeza",
+    4: "Higiene",
+    5: "Congelados",
+    6: "Mercearia",
+    7: "Padaria",
+    8: "Hortifruti",
+    9: "Açougue",
+    10: "Laticínios",
+    11: "Outros",
+})
+
+
+def _categorias_por_tipo(tipo_negocio: str) -> Mapping[int, str]:
+    """Resolvido uma vez por requisição; depois cada produto é só um .get() no mapa."""
+    return _CAT_RESTAURANTE if (tipo_negocio or "").strip().lower() == "restaurante" else _CAT_GENERICO
+
+
+_MEDIA_PREFIX = "/media/"
+
+
+@lru_cache(maxsize=1)
+def _media_root() -> Path:
+    # Lido na primeira requisição, não no import: app.main normaliza MEDIA_DIR (caminho absoluto)
+    # depois de importar os routers.
+    return Path(os.getenv("MEDIA_DIR", "media"))
+
+
+def _media_abs_path(s: str) -> str:
+    return str(_media_root().joinpath(*s.removeprefix(_MEDIA_PREFIX).lstrip("/").split("/")))
+
+
+def _tenant_media_dir(tenant_id: uuid.UUID) -> str:
+    return str(_media_root() / "produtos" / str(tenant_id))
+
+
+def _resolve_image(img_path: Optional[str], pid: uuid.UUID, tenant_id: uuid.UUID) -> Optional[str]:
+    if isinstance(img_path, str) and img_path.strip():
+        s = img_path.strip()
         # Se o backend está apontando para /media, garantir que o arquivo realmente exista
-        if s.startswith("/media/"):
-            media_dir = os.getenv("MEDIA_DIR", "media")
-            rel = s.replace("/media/", "", 1).lstrip("/")
-            abs_path = os.path.join(media_dir, rel.replace("/", os.sep))
-            if os.path.exists(abs_path):
+        if s.startswith(_MEDIA_PREFIX):
+            if arquivo_existe(_media_abs_path(s)):
                 return s
             # Se não existe no disco, cair para tentativa de inferência
         else:
             return s
 
-    media_dir = os.getenv("MEDIA_DIR", "media")
-    base_rel = os.path.join("produtos", str(tenant_id))
-    base_abs = os.path.join(media_dir, base_rel)
+    base_abs = _tenant_media_dir(tenant_id)
 
-    pid = getattr(produto, "id", None)
     if not pid:
         return None
 
+    arquivos = listar_arquivos(base_abs)
     for ext in (".jpg", ".jpeg", ".png", ".webp"):
         out_name = f"{pid}{ext}"
-        abs_path = os.path.join(base_abs, out_name)
-        if os.path.exists(abs_path):
+        if out_name in arquivos:
             return f"/media/produtos/{tenant_id}/{out_name}"
 
     return None
 
 
-@router.get("/produtos", response_model=List[PublicProdutoOut])
-async def public_menu_produtos(
-    q: Optional[str] = None,
-    db: AsyncSession = Depends(get_db_session),
-    tenant_id: uuid.UUID = Depends(get_tenant_id),
-):
-    res_tenant = await db.execute(select(Tenant).where(Tenant.id == tenant_id))
-    tenant = res_tenant.scalar_one_or_none()
-    tipo_negocio = (getattr(tenant, "tipo_negocio", None) if tenant else None) or "mercearia"
-
-    query = select(Produto).where(
+# Navegadores/CDN podem reusar o menu por alguns segundos e revalidar via If-None-Match depois.
+_MENU_CACHE_CONTROL = "public, max-age=15, stale-while-revalidate=60"
+
+
+def _etag_confere(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Comparação fraca (RFC 9110): ignora o prefixo W/ dos dois lados
+    alvo = etag.removeprefix("W/")
+    return any(t.strip().removeprefix("W/") == alvo for t in if_none_match.split(","))
+
+
+# Linhas por bloco lido do cursor: um orjson.dumps por bloco, não por produto.
+_MENU_LOTE = 500
+
+
+async def _menu_response(
+    request: Request, db: AsyncSession, tenant_id: uuid.UUID, tipo_negocio: str, q: Optional[str]
+) -> Response:
+    """Corpo JSON do menu, servido do cache enquanto o catálogo do tenant não mudar; 304 sem corpo
+    quando o cliente já tem a mesma versão."""
+    key = menu_cache_key(tenant_id, q)
+    cached = menu_cache_get(key)
+    if cached is None:
+        # Corpo montado por inteiro antes de responder: um erro do banco no meio da leitura vira
+        # 500, e não um 200 com JSON truncado. Usa a sessão da requisição (a mesma do tenant): uma
+        # só conexão do pool por requisição.
+        body = await _menu_body(db, tenant_id, tipo_negocio, q)
+        cached = body, menu_cache_set(key, body)
+
+    body, etag = cached
+    headers = {"ETag": etag, "Cache-Control": _MENU_CACHE_CONTROL}
+    if _etag_confere(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _menu_query(tenant_id: uuid.UUID, q: Optional[str]):
+    # Só as colunas que o menu expõe: tuplas simples, sem entidades ORM no identity map
+    query = select(
+        Produto.id,
+        Produto.nome,
+        Produto.descricao,
+        Produto.categoria_id,
+        Produto.preco_venda,
+        Produto.imagem_path,
+        Produto.estoque,
+    ).where(
         Produto.ativo == True,
         Produto.tenant_id == tenant_id,
     )
     if q:
+        # '%q%' para qualquer tamanho de termo; com 3+ caracteres o planner pode usar os índices
+        # GIN de trigramas (nome/codigo), abaixo disso fica no índice (tenant_id, ativo, nome)
         term = f"%{q.strip()}%"
         query = query.where(or_(Produto.nome.ilike(term), Produto.codigo.ilike(term)))
+    return query.order_by(Produto.nome)
+
+
+async def _menu_body(db: AsyncSession, tenant_id: uuid.UUID, tipo_negocio: str, q: Optional[str]) -> bytes:
+    """Array JSON do menu, montado por blocos à medida que as linhas chegam do servidor
+    (server-side cursor). O resultado vai para o cache do menu (bytes compactos, não as dicts)."""
+    # Dicts no formato de PublicProdutoOut, serializados direto por orjson (sem modelo pydantic por
+    # linha); PublicProdutoOut continua como response_model só para documentar o contrato.
+    # Nomes locais evitam buscas globais/atributos a cada linha; a query já filtra ativo = true e o
+    # mapa de categorias devolve None para 0/None.
+    _str = str
+    dumps = orjson.dumps
+    cat_get = _categorias_por_tipo(tipo_negocio).get
+    resolve = _resolve_image
+
+    await carregar_listagens((_tenant_media_dir(tenant_id),))
+
+    partes = [b"["]
+    result = await db.stream(_menu_query(tenant_id, q).execution_options(yield_per=_MENU_LOTE))
+    async for rows in result.partitions():
+        # Listagens de diretório do bloco carregadas em thread antes de montar as linhas: o
+        # _resolve_image abaixo só consulta memória e não bloqueia o event loop.
+        dirs = {
+            os.path.dirname(_media_abs_path(img.strip()))
+            for (_, _, _, _, _, img, _) in rows
+            if isinstance(img, str) and img.strip().startswith(_MEDIA_PREFIX)
+        }
+        if dirs:
+            await carregar_listagens(dirs)
+
+        # dumps da lista do bloco sem os colchetes: os itens já separados por vírgula
+        bloco = dumps([
+            {
+                "id": _str(pid),
+                "nome": nome,
+                "descricao": descricao,
+                "categoria_id": categoria_id,
+                "categoria_nome": cat_get(categoria_id),
+                "ativo": True,
+                "preco_venda": preco_venda if preco_venda is not None else 0.0,
+                "imagem": resolve(imagem_path, pid, tenant_id),
+                "estoque": estoque if estoque is not None else 0.0,
+            }
+            for (pid, nome, descricao, categoria_id, preco_venda, imagem_path, estoque) in rows
+        ])[1:-1]
+        if not bloco:
+            continue
+        if len(partes) > 1:
+            bloco = b"," + bloco
+        partes.append(bloco)
+    partes.append(b"]")
+    return b"".join(partes)
+
+
+@router.get("/produtos", response_model=List[PublicProdutoOut], response_class=ORJSONResponse)
+async def public_menu_produtos(
+    request: Request,
+    q: Optional[str] = None,
+    db: AsyncSession = Depends(get_db_session),
+    tenant: TenantInfo = Depends(get_tenant),
+):
+    return await _menu_response(request, db, tenant.id, tenant.tipo_negocio, q)
 
-    result = await db.execute(query.order_by(Produto.nome))
-    produtos = result.scalars().all()
-
-    return [
-        PublicProdutoOut(
-            id=str(p.id),
-            nome=p.nome,
-            descricao=p.descricao,
-            categoria_id=getattr(p, "categoria_id", None),
-            categoria_nome=_categoria_nome_por_tipo(tipo_negocio, getattr(p, "categoria_id", None)),
-            ativo=bool(getattr(p, "ativo", True)),
-            preco_venda=float(p.preco_venda or 0.0),
-            imagem=_resolve_public_image_path(p, tenant_id),
-            estoque=float(p.estoque or 0.0),
-        )
-        for p in produtos
-    ]
-
-
-@router.get("/{tenant_slug}/produtos", response_model=List[PublicProdutoOut])
+
+@router.get("/{tenant_slug}/produtos", response_model=List[PublicProdutoOut], response_class=ORJSONResponse)
 async def public_menu_produtos_by_slug(
+    request: Request,
     tenant_slug: str,
     q: Optional[str] = None,
     db: AsyncSession = Depends(get_db_session),
@@ -142,34 +245,10 @@ async def public_menu_produtos_by_slug(
     if not slug:
         raise HTTPException(status_code=400, detail="tenant_slug inválido")
 
-    res_tenant = await db.execute(select(Tenant).where(Tenant.slug == slug, Tenant.ativo == True))
-    tenant = res_tenant.scalar_one_or_none()
+    tenant = await get_tenant_by_slug(db, slug)
     if not tenant:
         raise HTTPException(status_code=404, detail="Tenant não encontrado")
 
     tenant_id = tenant.id
-    tipo_negocio = (getattr(tenant, "tipo_negocio", None) if tenant else None) or "mercearia"
-    query = select(Produto).where(
-        Produto.ativo == True,
-        Produto.tenant_id == tenant_id,
-    )
-    if q:
-        term = f"%{q.strip()}%"
-        query = query.where(or_(Produto.nome.ilike(term), Produto.codigo.ilike(term)))
-
-    result = await db.execute(query.order_by(Produto.nome))
-    produtos = result.scalars().all()
-    return [
-        PublicProdutoOut(
-            id=str(p.id),
-            nome=p.nome,
-            descricao=p.descricao,
-            categoria_id=getattr(p, "categoria_id", None),
-            categoria_nome=_categoria_nome_por_tipo(tipo_negocio, getattr(p, "categoria_id", None)),
-            ativo=bool(getattr(p, "ativo", True)),
-            preco_venda=float(p.preco_venda or 0.0),
-            imagem=_resolve_public_image_path(p, tenant_id),
-            estoque=float(p.estoque or 0.0),
-        )
-        for p in produtos
-    ]
+    tipo_negocio = tenant.tipo_negocio
+    return await _menu_response(request, db, tenant_id, tipo_negocio, q)
@@ -6,8 +6,9 @@ from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
-from sqlalchemy import select
+from sqlalchemy import insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 
 from app.core.deps import get_tenant_id
 from app.db.database import get_db_session
@@ -18,7 +19,7 @@ router = APIRouter(prefix="/public", tags=["public_pedidos"])
 
 
 class PublicPedidoItemIn(BaseModel):
-    produto_id: str
+    produto_id: uuid.UUID
     quantidade: int = Field(..., ge=1)
     observacao: Optional[str] = None
 
@@ -44,13 +45,18 @@ class PublicMesaOut(BaseModel):
     mesa_token: str
 
 
+# Mesas de fallback (ambientes sem a tabela): montadas uma vez, com índice por token.
+_DEFAULT_MESAS: tuple[PublicMesaOut, ...] = (
+    PublicMesaOut(id=1, nome="Mesa 1", numero=1, mesa_token="mesa-1"),
+    PublicMesaOut(id=2, nome="Mesa 2", numero=2, mesa_token="mesa-2"),
+    PublicMesaOut(id=3, nome="Mesa 3", numero=3, mesa_token="mesa-3"),
+    PublicMesaOut(id=4, nome="Mesa 4", numero=4, mesa_token="mesa-4"),
+)
+_MESA_BY_TOKEN: dict[str, PublicMesaOut] = {m.mesa_token: m for m in _DEFAULT_MESAS}
+
+
 def _default_mesas() -> list[PublicMesaOut]:
-    return [
-        PublicMesaOut(id=1, nome="Mesa 1", numero=1, mesa_token="mesa-1"),
-        PublicMesaOut(id=2, nome="Mesa 2", numero=2, mesa_token="mesa-2"),
-        PublicMesaOut(id=3, nome="Mesa 3", numero=3, mesa_token="mesa-3"),
-        PublicMesaOut(id=4, nome="Mesa 4", numero=4, mesa_token="mesa-4"),
-    ]
+    return list(_DEFAULT_MESAS)
 
 
 async def _ensure_default_mesas(db: AsyncSession, tenant_id: uuid.UUID) -> None:
@@ -65,7 +71,6 @@ async def _ensure_default_mesas(db: AsyncSession, tenant_id: uuid.UUID) -> None:
                 numero=n,
                 capacidade=4,
                 status="Livre",
-                mesa_token=f"mesa-{n}",
             )
         )
     await db.commit()
@@ -112,10 +117,7 @@ async def _mesa_from_token(db: AsyncSession, tenant_id: uuid.UUID, token: str) -
         )
     except Exception:
         # Fallback em ambientes sem DB
-        for m in _default_mesas():
-            if m.mesa_token == t:
-                return m
-        return None
+        return _MESA_BY_TOKEN.get(t)
 
 
 async def _create_venda_from_public_pedido(
@@ -136,69 +138,80 @@ async def _create_venda_from_public_pedido(
 
     status_pedido = "aguardando_pagamento" if forma_pagamento == "BALCAO" else "criado"
 
-    nova_venda = Venda(
-        id=venda_uuid,
-        tenant_id=tenant_id,
-        usuario_id=None,
-        cliente_id=None,
-        total=0.0,
-        desconto=0.0,
-        forma_pagamento=forma_pagamento,
-        tipo_pedido="local",
-        status_pedido=status_pedido,
-        mesa_id=int(payload.mesa_id),
-        lugar_numero=int(payload.lugar_numero) if getattr(payload, "lugar_numero", None) is not None else None,
-        observacoes=payload.observacao_cozinha,
-        cancelada=False,
-        created_at=datetime.utcnow(),
+    # produto_id já chega como uuid.UUID, validado pelo pydantic-core (ids malformados: 422)
+    produto_uuids = [it.produto_id for it in payload.itens]
+
+    # Um único SELECT ... IN para os produtos do pedido (antes era um por item)
+    res_prod = await db.execute(
+        select(Produto).where(Produto.id.in_(set(produto_uuids)), Produto.tenant_id == tenant_id)
     )
-    db.add(nova_venda)
-    await db.flush()
+    # Preço, taxa e fator de IVA calculados uma vez por produto distinto (não por linha do pedido)
+    precos_por_id = {}
+    for p in res_prod.scalars().all():
+        taxa = float(getattr(p, "taxa_iva", 0.0) or 0.0)
+        precos_por_id[p.id] = (
+            float(getattr(p, "preco_venda", 0.0) or 0.0),
+            taxa,
+            (1 + (taxa / 100.0)) if taxa > 0 else None,
+        )
 
     total = 0.0
-    for it in payload.itens:
-        try:
-            produto_uuid = uuid.UUID(str(it.produto_id))
-        except Exception:
-            raise HTTPException(status_code=400, detail=f"produto_id inválido: {it.produto_id}")
-
-        res_prod = await db.execute(
-            select(Produto).where(Produto.id == produto_uuid, Produto.tenant_id == tenant_id)
-        )
-        produto = res_prod.scalar_one_or_none()
-        if not produto:
+    itens_rows: list[dict] = []
+    for it, produto_uuid in zip(payload.itens, produto_uuids):
+        dados = precos_por_id.get(produto_uuid)
+        if dados is None:
             raise HTTPException(status_code=400, detail=f"Produto inexistente no servidor: {it.produto_id}")
+        preco_unit, taxa_iva, fator = dados
 
         qtd = max(1, int(it.quantidade or 0))
-        preco_unit = float(getattr(produto, "preco_venda", 0.0) or 0.0)
         subtotal = float(preco_unit * qtd)
 
-        taxa_iva = float(getattr(produto, "taxa_iva", 0.0) or 0.0)
-        if taxa_iva > 0:
-            fator = 1 + (taxa_iva / 100.0)
+        if fator is not None:
             base_iva = subtotal / fator
             valor_iva = subtotal - base_iva
         else:
             base_iva = subtotal
             valor_iva = 0.0
 
-        item = ItemVenda(
-            venda_id=nova_venda.id,
-            produto_id=produto_uuid,
-            quantidade=qtd,
-            peso_kg=0.0,
-            preco_unitario=preco_unit,
-            subtotal=subtotal,
-            taxa_iva=taxa_iva,
-            base_iva=base_iva,
-            valor_iva=valor_iva,
+        itens_rows.append(
+            {
+                "venda_id": venda_uuid,
+                "produto_id": produto_uuid,
+                "quantidade": qtd,
+                "peso_kg": 0.0,
+                "preco_unitario": preco_unit,
+                "subtotal": subtotal,
+                "taxa_iva": taxa_iva,
+                "base_iva": base_iva,
+                "valor_iva": valor_iva,
+            }
         )
-        db.add(item)
         total += subtotal
 
-    nova_venda.total = float(total)
+    # Pedido validado por inteiro antes de escrever: venda já com o total, um flush (FK dos itens)
+    # e os itens num único INSERT executemany (Core), sem unit-of-work do ORM por item.
+    nova_venda = Venda(
+        id=venda_uuid,
+        tenant_id=tenant_id,
+        usuario_id=None,
+        cliente_id=None,
+        total=float(total),
+        desconto=0.0,
+        forma_pagamento=forma_pagamento,
+        tipo_pedido="local",
+        status_pedido=status_pedido,
+        mesa_id=int(payload.mesa_id),
+        lugar_numero=int(payload.lugar_numero) if getattr(payload, "lugar_numero", None) is not None else None,
+        observacoes=payload.observacao_cozinha,
+        cancelada=False,
+        created_at=datetime.utcnow(),
+    )
+    db.add(nova_venda)
+    await db.flush()
+    await db.execute(insert(ItemVenda), itens_rows)
     await db.commit()
-    await db.refresh(nova_venda)
+    # Sem refresh: id e status_pedido (o que os endpoints devolvem) já estão na instância e a
+    # sessão não expira atributos no commit.
     return nova_venda
 
 
@@ -247,8 +260,17 @@ async def public_get_pedido_by_uuid(
     except Exception:
         raise HTTPException(status_code=400, detail="pedido_uuid inválido")
 
-    res = await db.execute(select(Venda).where(Venda.id == vid, Venda.tenant_id == tenant_id))
-    v = res.scalar_one_or_none()
+    # Venda + itens + nome do produto num único round trip (antes: SELECT venda e depois o JOIN dos itens)
+    res = await db.execute(
+        select(Venda)
+        .options(
+            joinedload(Venda.itens)
+            .joinedload(ItemVenda.produto)
+            .load_only(Produto.id, Produto.nome, Produto.descricao, Produto.tenant_id)
+        )
+        .where(Venda.id == vid, Venda.tenant_id == tenant_id)
+    )
+    v = res.unique().scalar_one_or_none()
     if not v:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
 
@@ -258,21 +280,16 @@ async def public_get_pedido_by_uuid(
     if bool(getattr(v, "cancelada", False)):
         status = "CANCELADO"
 
-    res_itens = await db.execute(
-        select(ItemVenda, Produto)
-        .join(Produto, Produto.id == ItemVenda.produto_id)
-        .where(
-            ItemVenda.venda_id == v.id,
-            Produto.tenant_id == tenant_id,
-        )
-    )
-    itens_rows = res_itens.all()
     itens_out = []
-    for item, produto in itens_rows:
+    for item in v.itens:
+        produto = item.produto
+        # Mesmo critério do JOIN anterior: só itens com produto existente do próprio tenant
+        if produto is None or produto.tenant_id != tenant_id:
+            continue
         itens_out.append(
             {
-                "produto_id": str(getattr(produto, "id", "")),
-                "produto_nome": str(getattr(produto, "nome", None) or getattr(produto, "descricao", None) or "Produto"),
+                "produto_id": str(produto.id),
+                "produto_nome": str(produto.nome or produto.descricao or "Produto"),
                 "quantidade": int(getattr(item, "quantidade", 0) or 0),
                 "subtotal": float(getattr(item, "subtotal", 0.0) or 0.0),
             }
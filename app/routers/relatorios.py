@@ -1,24 +1,24 @@
-from io import BytesIO, StringIO
+from io import BytesIO, TextIOWrapper
 from typing import List
 from datetime import datetime, timedelta
 import uuid
 import csv
+import zlib
 from pathlib import Path
+from functools import lru_cache
+from types import SimpleNamespace
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_, func
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, and_, or_, func, literal_column
 
+from app.core.deps import get_tenant_id
+from app.core.empresa_cache import get_empresa_config_cached
 from app.db.database import get_db_session
+from app.db.session import AsyncSessionLocal
 from app.db.models import Produto, Venda, ItemVenda, User, Cliente, EmpresaConfig
 
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import mm
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib import colors
 
 router = APIRouter(prefix="/api/relatorios", tags=["relatorios"])
 
@@ -26,14 +26,71 @@ router = APIRouter(prefix="/api/relatorios", tags=["relatorios"])
 LOGO_PATH = Path(__file__).resolve().parents[2] / "img" / "vuchada.png"
 
 
+@lru_cache(maxsize=1)
+def _pdf() -> SimpleNamespace:
+    """ReportLab e estilos dos relatórios, carregados na primeira geração de PDF.
+
+    Workers que nunca geram PDF (sync, CSV, IVA) não importam o pacote. Os estilos são montados
+    uma vez: getSampleStyleSheet() cria ~20 ParagraphStyles a cada chamada e os TableStyle são
+    idênticos em toda requisição (ReportLab só os lê ao desenhar).
+    """
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, LongTable, TableStyle, Image
+
+    return SimpleNamespace(
+        A4=A4,
+        mm=mm,
+        SimpleDocTemplate=SimpleDocTemplate,
+        Paragraph=Paragraph,
+        Spacer=Spacer,
+        Table=Table,
+        LongTable=LongTable,
+        Image=Image,
+        styles=getSampleStyleSheet(),
+        produtos_table_style=TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#0f766e")),
+            ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+            ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("FONTSIZE", (0, 0), (-1, 0), 10),
+            ("BOTTOMPADDING", (0, 0), (-1, 0), 8),
+            ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+            ("FONTSIZE", (0, 1), (-1, -1), 9),
+        ]),
+        # Tabelas de vendas e de itens vendidos do relatório de vendas
+        vendas_table_style=TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#0f766e")),
+            ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+            ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("FONTSIZE", (0, 0), (-1, 0), 9),
+            ("BOTTOMPADDING", (0, 0), (-1, 0), 6),
+            ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+            ("FONTSIZE", (0, 1), (-1, -1), 8),
+        ]),
+        financeiro_table_style=TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#0f766e")),
+            ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("FONTSIZE", (0, 0), (-1, 0), 10),
+            ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+            ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ]),
+    )
+
+
 def _add_header(story, styles, titulo: str, subtitulo: str | None = None, empresa: EmpresaConfig | None = None):
     """Adiciona cabeçalho padrão com logo + dados da empresa + título/subtítulo."""
+    rl = _pdf()
     # Logo (se existir)
     if LOGO_PATH.exists():
         try:
-            logo = Image(str(LOGO_PATH), width=25 * mm, height=25 * mm)
+            logo = rl.Image(str(LOGO_PATH), width=25 * rl.mm, height=25 * rl.mm)
             story.append(logo)
-            story.append(Spacer(1, 4))
+            story.append(rl.Spacer(1, 4))
         except Exception:
             pass
 
@@ -54,103 +111,108 @@ def _add_header(story, styles, titulo: str, subtitulo: str | None = None, empres
         linha3 = (empresa.endereco or "").strip()
 
         if linha1:
-            story.append(Paragraph(linha1, styles["Heading3"]))
+            story.append(rl.Paragraph(linha1, styles["Heading3"]))
         if linha2:
-            story.append(Paragraph(linha2, styles["Normal"]))
+            story.append(rl.Paragraph(linha2, styles["Normal"]))
         if linha3:
-            story.append(Paragraph(linha3, styles["Normal"]))
+            story.append(rl.Paragraph(linha3, styles["Normal"]))
         if linha1 or linha2 or linha3:
-            story.append(Spacer(1, 6))
+            story.append(rl.Spacer(1, 6))
 
     # Título e subtítulo do relatório
-    story.append(Paragraph(titulo, styles["Title"]))
+    story.append(rl.Paragraph(titulo, styles["Title"]))
     if subtitulo:
-        story.append(Paragraph(subtitulo, styles["Normal"]))
+        story.append(rl.Paragraph(subtitulo, styles["Normal"]))
+
+    story.append(rl.Spacer(1, 8))
+
 
-    story.append(Spacer(1, 8))
+# Formatadores das células dos PDFs (métodos ligados uma vez, reaproveitados por célula). Todo valor
+# monetário dos relatórios passa por eles; o format() do float já é C e arredonda corretamente.
+_fmt_mt = "MT {:,.2f}".format
+_fmt_num = "{:,.2f}".format
 
 
-def _build_produtos_pdf(produtos: List[Produto], titulo: str, empresa: EmpresaConfig | None = None) -> bytes:
+def _buffer_stream(buffer: BytesIO):
+    """Corpo do arquivo (PDF/CSV) como um único chunk. getvalue() devolve o buffer interno do BytesIO sem copiar;
+    iterar o BytesIO em si quebraria o binário por b"\\n" em muitos chunks pequenos."""
+    yield buffer.getvalue()
+
+
+def _build_produtos_pdf(produtos: List[Produto], titulo: str, empresa: EmpresaConfig | None = None) -> BytesIO:
+    rl = _pdf()
     buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=20 * mm, rightMargin=20 * mm,
-                            topMargin=20 * mm, bottomMargin=20 * mm)
+    doc = rl.SimpleDocTemplate(buffer, pagesize=rl.A4, leftMargin=20 * rl.mm, rightMargin=20 * rl.mm,
+                            topMargin=20 * rl.mm, bottomMargin=20 * rl.mm)
 
-    styles = getSampleStyleSheet()
+    styles = rl.styles
     story = []
 
     _add_header(story, styles, titulo, empresa=empresa)
 
+    fmt_mt = _fmt_mt
     data = [["Código", "Nome", "Preço venda", "Estoque", "Estoque mín."]]
-    for p in produtos:
-        data.append([
-            p.codigo or "",
-            p.nome or "",
-            f"MT {p.preco_venda:,.2f}",
-            f"{p.estoque}",
-            f"{p.estoque_minimo}",
-        ])
+    data.extend(
+        [p.codigo or "", p.nome or "", fmt_mt(p.preco_venda), str(p.estoque), str(p.estoque_minimo)]
+        for p in produtos
+    )
 
-    table = Table(data, repeatRows=1)
-    table.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#0f766e")),
-        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-        ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-        ("FONTSIZE", (0, 0), (-1, 0), 10),
-        ("BOTTOMPADDING", (0, 0), (-1, 0), 8),
-        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-        ("FONTSIZE", (0, 1), (-1, -1), 9),
-    ]))
+    # LongTable: mesmo layout, otimizada para quebrar tabelas longas sem recalcular tudo por página
+    table = rl.LongTable(data, repeatRows=1)
+    table.setStyle(rl.produtos_table_style)
 
     story.append(table)
     doc.build(story)
-    pdf = buffer.getvalue()
-    buffer.close()
-    return pdf
+    return buffer
 
 
 @router.get("/produtos", response_class=StreamingResponse)
-async def relatorio_produtos(baixo_estoque: bool = False, db: AsyncSession = Depends(get_db_session)):
-    stmt = select(Produto).where(Produto.ativo == True)
-    result = await db.execute(stmt)
-    produtos = result.scalars().all()
-
+async def relatorio_produtos(
+    baixo_estoque: bool = False,
+    db: AsyncSession = Depends(get_db_session),
+    tenant_id: uuid.UUID = Depends(get_tenant_id),
+):
+    conds = [Produto.ativo == True]
     if baixo_estoque:
-        def is_baixo(p: Produto) -> bool:
-            # Ignorar categoria "Serviços" (id 15) no cálculo de baixo estoque
-            try:
-                if getattr(p, "categoria_id", None) == 15:
-                    return False
-            except Exception:
-                pass
-
-            estoque = float(p.estoque or 0)
-            minimo = float(p.estoque_minimo or 0)
-            return (minimo > 0 and estoque <= minimo) or (minimo <= 0 and estoque <= 5)
-
-        produtos = [p for p in produtos if is_baixo(p)]
+        # Baixo estoque filtrado no banco: estoque <= mínimo quando há mínimo, senão <= 5.
+        # Categoria "Serviços" (id 15) fica de fora; nulos contam como 0, como no filtro anterior.
+        estoque = func.coalesce(Produto.estoque, 0)
+        minimo = func.coalesce(Produto.estoque_minimo, 0)
+        conds.append(or_(Produto.categoria_id.is_(None), Produto.categoria_id != 15))
+        conds.append(or_(and_(minimo > 0, estoque <= minimo), and_(minimo <= 0, estoque <= 5)))
+
+    result = await db.execute(select(Produto).where(*conds))
+    produtos = result.scalars().all()
 
-    # Buscar dados da empresa
-    cfg_result = await db.execute(select(EmpresaConfig))
-    empresa = cfg_result.scalars().first()
+    # Dados da empresa (cache com TTL, invalidado na edição)
+    empresa = await get_empresa_config_cached(db, tenant_id)
 
     titulo = "Produtos" if not baixo_estoque else "Produtos com baixo estoque"
-    pdf_bytes = _build_produtos_pdf(produtos, titulo, empresa=empresa)
+    pdf_buffer = _build_produtos_pdf(produtos, titulo, empresa=empresa)
 
     filename = "produtos.pdf" if not baixo_estoque else "produtos_baixo_estoque.pdf"
 
     return StreamingResponse(
-        BytesIO(pdf_bytes),
+        _buffer_stream(pdf_buffer),
         media_type="application/pdf",
         headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
 
 
-def _parse_date_ymd(value: str) -> datetime:
+@lru_cache(maxsize=512)
+def _parse_date_ymd_cached(value: str) -> datetime | None:
+    # Os mesmos períodos (hoje, início do mês...) se repetem entre requisições; datetime é imutável.
     try:
         return datetime.fromisoformat(f"{value}T00:00:00")
-    except Exception:
+    except ValueError:
+        return None
+
+
+def _parse_date_ymd(value: str) -> datetime:
+    dt = _parse_date_ymd_cached(str(value))
+    if dt is None:
         raise HTTPException(status_code=400, detail="Parâmetro de data inválido. Use YYYY-MM-DD")
+    return dt
 
 
 @router.get("/vendas", response_class=StreamingResponse)
@@ -159,126 +221,118 @@ async def relatorio_vendas(
     data_fim: str,
     usuario_id: str | None = None,
     db: AsyncSession = Depends(get_db_session),
+    tenant_id: uuid.UUID = Depends(get_tenant_id),
 ):
     """Relatório detalhado de vendas em PDF para o período/usuário informado."""
     d1 = _parse_date_ymd(data_inicio)
     d2 = _parse_date_ymd(data_fim)
     d2_exclusive = d2 + timedelta(days=1)
 
-    stmt = (
-        select(Venda)
-        .options(
-            selectinload(Venda.itens).selectinload(ItemVenda.produto),
-            selectinload(Venda.cliente),
-            selectinload(Venda.usuario),
-        )
-        .where(
-            Venda.created_at >= d1,
-            Venda.created_at < d2_exclusive,
-            Venda.cancelada == False,
-            or_(
-                Venda.status_pedido.is_(None),
-                func.lower(func.coalesce(Venda.status_pedido, "")) == "pago",
-            ),
-        )
-    )
-
+    filtros_v = [
+        Venda.created_at >= d1,
+        Venda.created_at < d2_exclusive,
+        Venda.cancelada == False,
+        or_(
+            Venda.status_pedido.is_(None),
+            Venda.status_pedido == "pago",
+        ),
+    ]
     if usuario_id is not None:
         try:
             uid = uuid.UUID(usuario_id)
-            stmt = stmt.where(Venda.usuario_id == uid)
+            filtros_v.append(Venda.usuario_id == uid)
         except Exception:
             pass
 
-    result = await db.execute(stmt)
-    vendas = result.scalars().all()
+    # Só as colunas impressas (tuplas, sem entidades ORM): vendas com vendedor/cliente por outer
+    # join e, numa segunda consulta, os itens do mesmo período com o nome do produto. As duas na
+    # mesma ordem (data, id), então os itens saem agrupados por venda como antes.
+    stmt_vendas = (
+        select(Venda.created_at, User.nome, Cliente.nome, Venda.forma_pagamento, Venda.total)
+        .select_from(Venda)
+        .outerjoin(User, Venda.usuario_id == User.id)
+        .outerjoin(Cliente, Venda.cliente_id == Cliente.id)
+        .where(*filtros_v)
+        .order_by(Venda.created_at, Venda.id)
+    )
+    stmt_itens = (
+        select(
+            Venda.created_at,
+            Produto.nome,
+            ItemVenda.quantidade,
+            ItemVenda.peso_kg,
+            ItemVenda.preco_unitario,
+            ItemVenda.subtotal,
+        )
+        .select_from(ItemVenda)
+        .join(Venda, ItemVenda.venda_id == Venda.id)
+        .outerjoin(Produto, ItemVenda.produto_id == Produto.id)
+        .where(*filtros_v)
+        .order_by(Venda.created_at, Venda.id)
+    )
+    # Em sequência, na sessão (e transação) da requisição: uma única conexão do pool por relatório
+    vendas = (await db.execute(stmt_vendas)).all()
+    itens = (await db.execute(stmt_itens)).all()
 
+    rl = _pdf()
     buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=15 * mm, rightMargin=15 * mm,
-                            topMargin=15 * mm, bottomMargin=15 * mm)
-    styles = getSampleStyleSheet()
+    doc = rl.SimpleDocTemplate(buffer, pagesize=rl.A4, leftMargin=15 * rl.mm, rightMargin=15 * rl.mm,
+                            topMargin=15 * rl.mm, bottomMargin=15 * rl.mm)
+    styles = rl.styles
     story = []
 
-    # Dados da empresa
-    cfg_result = await db.execute(select(EmpresaConfig))
-    empresa = cfg_result.scalars().first()
+    # Dados da empresa (cache com TTL, invalidado na edição)
+    empresa = await get_empresa_config_cached(db, tenant_id)
 
     titulo = "Relatório de Vendas"
     subtitulo = f"Período: {data_inicio} a {data_fim}"
     _add_header(story, styles, titulo, subtitulo, empresa=empresa)
 
+    fmt_mt = _fmt_mt
+    fmt_num = _fmt_num
     header = ["Data", "Vendedor", "Cliente", "Forma pag.", "Total (MT)"]
     data = [header]
     total_geral = 0.0
 
-    for v in vendas:
-        dt = getattr(v, "created_at", None)
+    for dt, vendedor, cliente, forma, total in vendas:
         data_str = dt.strftime("%Y-%m-%d %H:%M") if isinstance(dt, datetime) else ""
-        vendedor = getattr(getattr(v, "usuario", None), "nome", "") or "-"
-        cliente = getattr(getattr(v, "cliente", None), "nome", "") or "-"
-        forma = v.forma_pagamento or "-"
-        total = float(v.total or 0)
+        total = float(total or 0)
         total_geral += total
-        data.append([data_str, vendedor, cliente, forma, f"MT {total:,.2f}"])
-
-    table = Table(data, repeatRows=1)
-    table.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#0f766e")),
-        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-        ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-        ("FONTSIZE", (0, 0), (-1, 0), 9),
-        ("BOTTOMPADDING", (0, 0), (-1, 0), 6),
-        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-        ("FONTSIZE", (0, 1), (-1, -1), 8),
-    ]))
+        data.append([data_str, vendedor or "-", cliente or "-", forma or "-", fmt_mt(total)])
+
+    table = rl.LongTable(data, repeatRows=1)
+    table.setStyle(rl.vendas_table_style)
 
     story.append(table)
-    story.append(Spacer(1, 8))
-    story.append(Paragraph(f"Total geral: MT {total_geral:,.2f}", styles["Heading3"]))
+    story.append(rl.Spacer(1, 8))
+    story.append(rl.Paragraph(f"Total geral: {_fmt_mt(total_geral)}", styles["Heading3"]))
 
     # Tabela de itens vendidos (detalhe por produto)
     itens_header = ["Data", "Produto", "Qtd", "Preço unit.", "Subtotal (MT)"]
     itens_data = [itens_header]
 
-    for v in vendas:
-        dt = getattr(v, "created_at", None)
+    for dt, prod_nome, quantidade, peso_kg, preco_unit, subtotal in itens:
         data_str = dt.strftime("%Y-%m-%d %H:%M") if isinstance(dt, datetime) else ""
-        for it in getattr(v, "itens", []) or []:
-            prod_nome = getattr(getattr(it, "produto", None), "nome", "") or "-"
-            qtd = float(getattr(it, "peso_kg", 0) or 0) if getattr(it, "peso_kg", 0) else float(getattr(it, "quantidade", 0) or 0)
-            preco_unit = float(getattr(it, "preco_unitario", 0) or 0)
-            subtotal = float(getattr(it, "subtotal", 0) or 0)
-            itens_data.append([
-                data_str,
-                prod_nome,
-                f"{qtd:,.2f}",
-                f"MT {preco_unit:,.2f}",
-                f"MT {subtotal:,.2f}",
-            ])
+        qtd = float(peso_kg) if peso_kg else float(quantidade or 0)
+        itens_data.append([
+            data_str,
+            prod_nome or "-",
+            fmt_num(qtd),
+            fmt_mt(float(preco_unit or 0)),
+            fmt_mt(float(subtotal or 0)),
+        ])
 
     if len(itens_data) > 1:
-        story.append(Spacer(1, 12))
-        story.append(Paragraph("Itens vendidos", styles["Heading3"]))
-        itens_table = Table(itens_data, repeatRows=1)
-        itens_table.setStyle(TableStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#0f766e")),
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-            ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-            ("FONTSIZE", (0, 0), (-1, 0), 9),
-            ("BOTTOMPADDING", (0, 0), (-1, 0), 6),
-            ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-            ("FONTSIZE", (0, 1), (-1, -1), 8),
-        ]))
+        story.append(rl.Spacer(1, 12))
+        story.append(rl.Paragraph("Itens vendidos", styles["Heading3"]))
+        itens_table = rl.LongTable(itens_data, repeatRows=1)
+        itens_table.setStyle(rl.vendas_table_style)
         story.append(itens_table)
 
     doc.build(story)
-    pdf_bytes = buffer.getvalue()
-    buffer.close()
 
     return StreamingResponse(
-        BytesIO(pdf_bytes),
+        _buffer_stream(buffer),
         media_type="application/pdf",
         headers={"Content-Disposition": "attachment; filename=vendas_periodo.pdf"},
     )
@@ -290,99 +344,88 @@ async def relatorio_financeiro(
     data_fim: str,
     usuario_id: str | None = None,
     db: AsyncSession = Depends(get_db_session),
+    tenant_id: uuid.UUID = Depends(get_tenant_id),
 ):
     """Relatório financeiro resumido (faturamento, custo, lucro, ticket etc.) em PDF."""
     d1 = _parse_date_ymd(data_inicio)
     d2 = _parse_date_ymd(data_fim)
     d2_exclusive = d2 + timedelta(days=1)
 
-    # Buscar vendas do período
-    stmt_v = (
-        select(Venda)
-        .options(selectinload(Venda.itens))
-        .where(
-            Venda.created_at >= d1,
-            Venda.created_at < d2_exclusive,
-            Venda.cancelada == False,
-            or_(
-                Venda.status_pedido.is_(None),
-                func.lower(func.coalesce(Venda.status_pedido, "")) == "pago",
-            ),
-        )
-    )
+    filtros_v = [
+        Venda.created_at >= d1,
+        Venda.created_at < d2_exclusive,
+        Venda.cancelada == False,
+        or_(
+            Venda.status_pedido.is_(None),
+            Venda.status_pedido == "pago",
+        ),
+    ]
     if usuario_id is not None:
         try:
             uid = uuid.UUID(usuario_id)
-            stmt_v = stmt_v.where(Venda.usuario_id == uid)
+            filtros_v.append(Venda.usuario_id == uid)
         except Exception:
             pass
 
-    result_v = await db.execute(stmt_v)
-    vendas = result_v.scalars().all()
-
-    # Mapear custos por produto
-    result_p = await db.execute(select(Produto))
-    produtos = result_p.scalars().all()
-    custo_por_produto = {str(p.id): float(p.preco_custo or 0) for p in produtos}
-
-    faturamento = 0.0
-    custo_total = 0.0
-    itens_total = 0.0
-
-    for v in vendas:
-        for it in getattr(v, "itens", []) or []:
-            pid = str(it.produto_id)
-            preco_unit = float(it.preco_unitario or 0)
-            qtd = float(it.peso_kg or 0) if getattr(it, "peso_kg", 0) else float(it.quantidade or 0)
-            custo_unit = float(custo_por_produto.get(pid, 0))
-            faturamento += preco_unit * qtd
-            custo_total += custo_unit * qtd
-            itens_total += qtd
+    # Totais somados no banco (sem carregar vendas, itens e o catálogo inteiro de produtos).
+    # Quantidade = peso_kg quando preenchido (≠ 0), senão quantidade; custo = preco_custo atual do
+    # produto (0 se o produto não existe mais). A contagem de vendas vai como subquery escalar na
+    # mesma instrução (sem correlação com o Venda externo; vendas sem itens também contam), então o
+    # relatório custa um único round trip.
+    qtd = func.coalesce(func.nullif(ItemVenda.peso_kg, 0), ItemVenda.quantidade, 0)
+    qtd_vendas_sq = select(func.count(Venda.id)).where(*filtros_v).correlate(None).scalar_subquery()
+    stmt_totais = (
+        select(
+            func.coalesce(func.sum(func.coalesce(ItemVenda.preco_unitario, 0) * qtd), 0.0),
+            func.coalesce(func.sum(func.coalesce(Produto.preco_custo, 0) * qtd), 0.0),
+            func.coalesce(func.sum(qtd), 0.0),
+            qtd_vendas_sq,
+        )
+        .select_from(ItemVenda)
+        .join(Venda, ItemVenda.venda_id == Venda.id)
+        .outerjoin(Produto, ItemVenda.produto_id == Produto.id)
+        .where(*filtros_v)
+    )
+    faturamento, custo_total, itens_total, qtd_vendas = (await db.execute(stmt_totais)).one()
+    faturamento = float(faturamento)
+    custo_total = float(custo_total)
+    itens_total = float(itens_total)
+    qtd_vendas = int(qtd_vendas or 0)
 
     lucro = faturamento - custo_total
-    qtd_vendas = len(vendas)
     ticket_medio = faturamento / qtd_vendas if qtd_vendas > 0 else 0.0
 
+    rl = _pdf()
     buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=20 * mm, rightMargin=20 * mm,
-                            topMargin=20 * mm, bottomMargin=20 * mm)
-    styles = getSampleStyleSheet()
+    doc = rl.SimpleDocTemplate(buffer, pagesize=rl.A4, leftMargin=20 * rl.mm, rightMargin=20 * rl.mm,
+                            topMargin=20 * rl.mm, bottomMargin=20 * rl.mm)
+    styles = rl.styles
     story = []
 
-    # Dados da empresa
-    cfg_result = await db.execute(select(EmpresaConfig))
-    empresa = cfg_result.scalars().first()
+    # Dados da empresa (cache com TTL, invalidado na edição)
+    empresa = await get_empresa_config_cached(db, tenant_id)
 
     titulo = "Relatório Financeiro"
     subtitulo = f"Período: {data_inicio} a {data_fim}"
     _add_header(story, styles, titulo, subtitulo, empresa=empresa)
 
     rows = [
-        ["Faturamento", f"MT {faturamento:,.2f}"],
-        ["Custo", f"MT {custo_total:,.2f}"],
-        ["Lucro", f"MT {lucro:,.2f}"],
+        ["Faturamento", _fmt_mt(faturamento)],
+        ["Custo", _fmt_mt(custo_total)],
+        ["Lucro", _fmt_mt(lucro)],
         ["Qtd. vendas", str(qtd_vendas)],
-        ["Ticket médio", f"MT {ticket_medio:,.2f}"],
-        ["Itens vendidos", f"{itens_total:,.2f}"],
+        ["Ticket médio", _fmt_mt(ticket_medio)],
+        ["Itens vendidos", _fmt_num(itens_total)],
     ]
 
-    table = Table(rows, colWidths=[80 * mm, 80 * mm])
-    table.setStyle(TableStyle([
-        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#0f766e")),
-        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-        ("FONTSIZE", (0, 0), (-1, 0), 10),
-        ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-    ]))
+    table = rl.Table(rows, colWidths=[80 * rl.mm, 80 * rl.mm])
+    table.setStyle(rl.financeiro_table_style)
 
     story.append(table)
     doc.build(story)
-    pdf_bytes = buffer.getvalue()
-    buffer.close()
 
     return StreamingResponse(
-        BytesIO(pdf_bytes),
+        _buffer_stream(buffer),
         media_type="application/pdf",
         headers={"Content-Disposition": "attachment; filename=relatorio_financeiro.pdf"},
     )
@@ -390,9 +433,9 @@ async def relatorio_financeiro(
 
 @router.get("/faturas-mensal", response_class=StreamingResponse)
 async def exportar_faturas_mensal(
+    request: Request,
     ano: int,
     mes: int,
-    db: AsyncSession = Depends(get_db_session),
 ):
     """Exporta faturas (vendas não canceladas) de um mês em CSV para apoio contabilístico/AT.
 
@@ -408,77 +451,143 @@ async def exportar_faturas_mensal(
     except Exception:
         raise HTTPException(status_code=400, detail="Parâmetros de ano/mês inválidos")
 
+    filename = f"faturas_{ano}_{mes:02d}.csv"
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+
+    # CSV muito repetitivo (datas, vendedores, formas de pagamento): comprimido durante o streaming
+    # quando o cliente aceita gzip. Content-Encoding é transparente: o navegador descomprime e salva .csv.
+    body = _faturas_csv_stream(d1, d2)
+    if _aceita_gzip(request.headers.get("accept-encoding", "")):
+        body = _gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(body, media_type="text/csv", headers=headers)
+
+
+# Vendas por bloco lido do cursor (e por chunk enviado ao cliente)
+_CSV_LOTE = 500
+
+
+def _aceita_gzip(accept_encoding: str) -> bool:
+    """gzip aceito no Accept-Encoding, respeitando q-values (gzip;q=0 recusa) e o curinga *."""
+    q_gzip = q_curinga = None
+    for item in accept_encoding.lower().split(","):
+        nome, _, params = item.partition(";")
+        nome = nome.strip()
+        if nome not in ("gzip", "*"):
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            chave, _, valor = param.partition("=")
+            if chave.strip() == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        if nome == "gzip":
+            q_gzip = q
+        else:
+            q_curinga = q
+    q_final = q_gzip if q_gzip is not None else q_curinga
+    return q_final is not None and q_final > 0
+
+
+async def _gzip_stream(chunks):
+    """Comprime os chunks em gzip incrementalmente. Nível 1 (rápido); Z_SYNC_FLUSH por chunk para que
+    cada bloco chegue ao cliente sem esperar o fim da exportação."""
+    comp = zlib.compressobj(1, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        dados = comp.compress(chunk) + comp.flush(zlib.Z_SYNC_FLUSH)
+        if dados:
+            yield dados
+    yield comp.flush()
+
+
+async def _faturas_csv_stream(d1: datetime, d2: datetime):
+    """Linhas do CSV de faturas enviadas por bloco, à medida que chegam do banco (server-side cursor).
+
+    Roda depois que o endpoint retorna, quando uma sessão de dependência já teria sido fechada:
+    usa sessão própria. Só as colunas exportadas, com vendedor/cliente por outer join.
+    """
     stmt = (
-        select(Venda)
-        .options(selectinload(Venda.itens), selectinload(Venda.cliente), selectinload(Venda.usuario))
+        select(
+            Venda.created_at,
+            Venda.id,
+            User.nome,
+            Cliente.nome,
+            Cliente.documento,
+            Venda.forma_pagamento,
+            Venda.total,
+            Venda.desconto,
+            Venda.observacoes,
+        )
+        .select_from(Venda)
+        .outerjoin(User, Venda.usuario_id == User.id)
+        .outerjoin(Cliente, Venda.cliente_id == Cliente.id)
         .where(
             Venda.created_at >= d1,
             Venda.created_at < d2,
             Venda.cancelada == False,
             or_(
                 Venda.status_pedido.is_(None),
-                func.lower(func.coalesce(Venda.status_pedido, "")) == "pago",
+                Venda.status_pedido == "pago",
             ),
         )
         .order_by(Venda.created_at.asc())
+        .execution_options(yield_per=_CSV_LOTE)
     )
 
-    result = await db.execute(stmt)
-    vendas = result.scalars().all()
-
-    # Usar StringIO para escrever texto e depois codificar para bytes
-    text_buffer = StringIO()
+    # CSV codificado em UTF-8 direto num buffer binário pequeno, esvaziado a cada bloco
+    buffer = BytesIO()
+    text_buffer = TextIOWrapper(buffer, encoding="utf-8", newline="", write_through=True)
     writer = csv.writer(text_buffer, delimiter=';', lineterminator='\n')
 
-    # Cabeçalho CSV
-    writer.writerow([
-        "data_hora",
-        "id_venda",
-        "vendedor",
-        "cliente_nome",
-        "cliente_documento",
-        "forma_pagamento",
-        "total",
-        "desconto",
-        "observacoes",
-    ])
-
-    for v in vendas:
-        dt = getattr(v, "created_at", None)
-        data_str = dt.strftime("%Y-%m-%d %H:%M:%S") if isinstance(dt, datetime) else ""
-        vendedor = getattr(getattr(v, "usuario", None), "nome", "") or "-"
-        cliente_nome = getattr(getattr(v, "cliente", None), "nome", "") or "-"
-        cliente_doc = getattr(getattr(v, "cliente", None), "documento", "") or ""
-        forma = v.forma_pagamento or "-"
-        total = float(v.total or 0)
-        desconto = float(v.desconto or 0)
-        obs = v.observacoes or ""
+    def drenar() -> bytes:
+        dados = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return dados
 
+    try:
+        # Cabeçalho CSV
         writer.writerow([
-            data_str,
-            str(getattr(v, "id", "")),
-            vendedor,
-            cliente_nome,
-            cliente_doc,
-            forma,
-            f"{total:.2f}",
-            f"{desconto:.2f}",
-            obs.replace('\n', ' ').replace('\r', ' '),
+            "data_hora",
+            "id_venda",
+            "vendedor",
+            "cliente_nome",
+            "cliente_documento",
+            "forma_pagamento",
+            "total",
+            "desconto",
+            "observacoes",
         ])
-
-    csv_text = text_buffer.getvalue()
-    csv_bytes = csv_text.encode('utf-8')
-    buffer = BytesIO(csv_bytes)
-    filename = f"faturas_{ano}_{mes:02d}.csv"
-
-    return StreamingResponse(
-        buffer,
-        media_type="text/csv",
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}",
-            "Cache-Control": "no-cache",
-        },
-    )
+        yield drenar()
+
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(stmt)
+            async for rows in result.partitions():
+                writer.writerows(
+                    [
+                        dt.strftime("%Y-%m-%d %H:%M:%S") if isinstance(dt, datetime) else "",
+                        str(vid),
+                        vendedor or "-",
+                        cliente_nome or "-",
+                        cliente_doc or "",
+                        forma or "-",
+                        f"{float(total or 0):.2f}",
+                        f"{float(desconto or 0):.2f}",
+                        (obs or "").replace('\n', ' ').replace('\r', ' '),
+                    ]
+                    for (dt, vid, vendedor, cliente_nome, cliente_doc, forma, total, desconto, obs) in rows
+                )
+                yield drenar()
+    finally:
+        # detach(): o wrapper, ao ser coletado, fecharia o BytesIO junto
+        text_buffer.detach()
 
 
 @router.get("/iva")
@@ -492,42 +601,35 @@ async def resumo_iva(
     d2 = _parse_date_ymd(data_fim)
     d2_exclusive = d2 + timedelta(days=1)
 
-    # Buscar itens de vendas não canceladas no período
+    # Soma por taxa no banco: uma linha por taxa de IVA em vez de todos os itens do período.
+    # Taxa nula conta como 0%, como antes (literal inline: o mesmo texto no SELECT e no GROUP BY).
+    taxa_col = func.coalesce(ItemVenda.taxa_iva, literal_column("0"))
     stmt = (
-        select(ItemVenda)
+        select(
+            taxa_col.label("taxa_iva"),
+            func.coalesce(func.sum(ItemVenda.base_iva), 0.0).label("base_total"),
+            func.coalesce(func.sum(ItemVenda.valor_iva), 0.0).label("iva_total"),
+        )
         .join(Venda, ItemVenda.venda_id == Venda.id)
         .where(
             Venda.created_at >= d1,
             Venda.created_at < d2_exclusive,
             Venda.cancelada == False,
         )
+        .group_by(taxa_col)
+        .order_by(taxa_col)
     )
 
     result = await db.execute(stmt)
-    itens = result.scalars().all()
-
-    resumo: dict[float, dict] = {}
-    for it in itens:
-        taxa = float(getattr(it, "taxa_iva", 0.0) or 0.0)
-        base = float(getattr(it, "base_iva", 0.0) or 0.0)
-        iva = float(getattr(it, "valor_iva", 0.0) or 0.0)
-        if taxa not in resumo:
-            resumo[taxa] = {"taxa_iva": taxa, "base_total": 0.0, "iva_total": 0.0}
-        resumo[taxa]["base_total"] += base
-        resumo[taxa]["iva_total"] += iva
-
-    # Converter para lista ordenada por taxa
+
     resultado = []
-    for taxa in sorted(resumo.keys()):
-        base_total = resumo[taxa]["base_total"]
-        iva_total = resumo[taxa]["iva_total"]
-        faturamento_total = base_total + iva_total
+    for taxa, base_total, iva_total in result.all():
         resultado.append(
             {
-                "taxa_iva": taxa,
-                "base_total": base_total,
-                "iva_total": iva_total,
-                "faturamento_total": faturamento_total,
+                "taxa_iva": float(taxa),
+                "base_total": float(base_total),
+                "iva_total": float(iva_total),
+                "faturamento_total": float(base_total) + float(iva_total),
             }
         )
 
@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
@@ -79,293 +79,388 @@ async def push_changes(
         except Exception:
             return None
 
-    for ev in events:
+    # Pré-carga em lote: uma consulta IN por entidade em vez de um SELECT por evento/item.
+    # Os mapas guardam também None para ids consultados e inexistentes.
+    venda_ids: set[uuid.UUID] = set()
+    cliente_ids: set[uuid.UUID] = set()
+    divida_ids: set[uuid.UUID] = set()
+    codigos: set[str] = set()
+    div_prod_ids: set[uuid.UUID] = set()
+    # Evento malformado (ex.: itens não iterável) falha sozinho, como no processamento abaixo,
+    # em vez de derrubar o lote inteiro
+    erros_pre_carga: dict[int, str] = {}
+    for i, ev in enumerate(events):
         try:
             entity = str(ev.entity or "").lower()
             payload = ev.payload or {}
-
             if entity == "pedido":
-                pedido_uuid = payload.get("uuid")
-                if not pedido_uuid:
-                    results.append({"outbox_id": int(ev.outbox_id), "ok": False, "error": "missing uuid"})
-                    continue
-
-                try:
-                    venda_uuid = uuid.UUID(str(pedido_uuid))
-                except Exception:
-                    results.append({"outbox_id": int(ev.outbox_id), "ok": False, "error": "invalid uuid"})
-                    continue
+                vid = _parse_uuid(payload.get("uuid"))
+                pedido_codigos = {
+                    str(it.get("produto_codigo"))
+                    for it in payload.get("itens") or []
+                    if isinstance(it, dict) and it.get("produto_codigo") and _parse_uuid(it.get("produto_id") or None) is None
+                }
+                if vid is not None:
+                    venda_ids.add(vid)
+                codigos.update(pedido_codigos)
+            elif entity == "cliente":
+                cid = _parse_uuid(payload.get("id") or payload.get("uuid"))
+                if cid is not None:
+                    cliente_ids.add(cid)
+            elif entity == "divida":
+                did = _parse_uuid(payload.get("id"))
+                itens_div = payload.get("itens") or []
+                if did is not None:
+                    divida_ids.add(did)
+                if isinstance(itens_div, list):
+                    for it in itens_div:
+                        pid = _parse_uuid(it.get("produto_id")) if isinstance(it, dict) else None
+                        if pid is not None:
+                            div_prod_ids.add(pid)
+        except Exception as e:
+            erros_pre_carga[i] = str(e)
+
+    vendas_map: dict[uuid.UUID, Any] = dict.fromkeys(venda_ids)
+    if venda_ids:
+        res = await db.execute(select(Venda).where(Venda.id.in_(venda_ids), Venda.tenant_id == tenant_id))
+        vendas_map.update((v.id, v) for v in res.scalars().all())
+
+    clientes_map: dict[uuid.UUID, Any] = dict.fromkeys(cliente_ids)
+    if cliente_ids:
+        res = await db.execute(select(Cliente).where(Cliente.id.in_(cliente_ids), Cliente.tenant_id == tenant_id))
+        clientes_map.update((c.id, c) for c in res.scalars().all())
+
+    dividas_map: dict[uuid.UUID, Any] = dict.fromkeys(divida_ids)
+    if divida_ids:
+        res = await db.execute(
+            select(Divida)
+            .options(selectinload(Divida.itens), selectinload(Divida.pagamentos))
+            .where(Divida.id.in_(divida_ids), Divida.tenant_id == tenant_id)
+        )
+        dividas_map.update((d.id, d) for d in res.scalars().all())
 
-                existing = await db.execute(
-                    select(Venda).where(Venda.id == venda_uuid, Venda.tenant_id == tenant_id)
-                )
-                venda_db = existing.scalar_one_or_none()
-
-                total = float(payload.get("valor_total") or payload.get("total") or 0)
-                created_at = _parse_dt(payload.get("created_at") or payload.get("data_inicio"))
-                updated_at = _parse_dt(payload.get("updated_at"))
-
-                mesa_id = payload.get("mesa_id")
-                lugar_numero = payload.get("lugar_numero")
-                status_payload = payload.get("status")
-
-                tipo_pedido = payload.get("tipo_pedido")
-                if not tipo_pedido:
-                    # Se não veio no payload, inferir pelo mesa_id
-                    tipo_pedido = "distancia" if mesa_id in (None, "", 0, "0") else "local"
-
-                if venda_db is None:
-                    venda_db = Venda(
-                        id=venda_uuid,
-                        tenant_id=tenant_id,
-                        usuario_id=None,
-                        cliente_id=None,
-                        total=total,
-                        desconto=0.0,
-                        forma_pagamento=str(payload.get("forma_pagamento") or "dinheiro"),
-                        tipo_pedido=str(tipo_pedido) if tipo_pedido is not None else None,
-                        status_pedido=str(status_payload) if status_payload is not None else None,
-                        mesa_id=int(mesa_id) if mesa_id not in (None, "") else None,
-                        lugar_numero=int(lugar_numero) if lugar_numero not in (None, "") else None,
-                        observacoes=payload.get("observacao_cozinha") or payload.get("observacoes"),
-                        cancelada=False,
-                        created_at=created_at,
-                    )
-                    db.add(venda_db)
-                    await db.flush()
-                else:
-                    # Atualizar campos principais (inclui mudança de status)
-                    venda_db.total = total
-                    if payload.get("forma_pagamento") is not None:
-                        venda_db.forma_pagamento = str(payload.get("forma_pagamento") or venda_db.forma_pagamento)
-                    try:
-                        venda_db.tipo_pedido = str(tipo_pedido) if tipo_pedido is not None else venda_db.tipo_pedido
-                    except Exception:
-                        pass
-                    try:
-                        if status_payload is not None:
-                            venda_db.status_pedido = str(status_payload)
-                    except Exception:
-                        pass
-                    try:
-                        venda_db.mesa_id = int(mesa_id) if mesa_id not in (None, "") else None
-                        venda_db.lugar_numero = int(lugar_numero) if lugar_numero not in (None, "") else None
-                    except Exception:
-                        pass
-                    try:
-                        venda_db.updated_at = updated_at or datetime.utcnow()
-                    except Exception:
-                        pass
+    produto_por_codigo: dict[str, uuid.UUID] = {}
+    if codigos:
+        res = await db.execute(
+            select(Produto.codigo, Produto.id).where(Produto.codigo.in_(codigos), Produto.tenant_id == tenant_id)
+        )
+        produto_por_codigo = {codigo: pid for codigo, pid in res.all()}
 
-                itens = payload.get("itens") or []
+    produtos_validos: set[uuid.UUID] = set()
+    if div_prod_ids:
+        res = await db.execute(
+            select(Produto.id).where(Produto.id.in_(div_prod_ids), Produto.tenant_id == tenant_id)
+        )
+        produtos_validos = set(res.scalars().all())
+
+    _opcoes_carga = {Divida: (selectinload(Divida.itens), selectinload(Divida.pagamentos))}
+
+    async def _carregar(mapa: dict, model: Any, obj_id: uuid.UUID) -> Any:
+        """Objeto do mapa pré-carregado; consulta o banco só para ids fora dele (ex.: após falha)."""
+        if obj_id in mapa:
+            return mapa[obj_id]
+        res = await db.execute(
+            select(model)
+            .options(*_opcoes_carga.get(model, ()))
+            .where(model.id == obj_id, model.tenant_id == tenant_id)
+        )
+        obj = res.scalar_one_or_none()
+        mapa[obj_id] = obj
+        return obj
 
-                # IMPORTANTE: quando o POS envia snapshot do pedido (ex.: mudança de status),
-                # os itens vêm completos. Se apenas inserirmos, duplicamos itens no acompanhamento.
-                # Então fazemos replace: apagamos os itens atuais e inserimos os do payload.
-                try:
-                    await db.execute(delete(ItemVenda).where(ItemVenda.venda_id == venda_db.id))
-                except Exception:
-                    pass
+    for i, ev in enumerate(events):
+        if i in erros_pre_carga:
+            results.append({"outbox_id": int(ev.outbox_id), "ok": False, "error": erros_pre_carga[i]})
+            continue
+        chave_evento = None
+        try:
+            # Um SAVEPOINT por evento: falha de um evento não desfaz os outros, e o lote inteiro
+            # é gravado num único COMMIT no final (antes era um commit por evento).
+            async with db.begin_nested():
+                entity = str(ev.entity or "").lower()
+                payload = ev.payload or {}
+
+                if entity == "pedido":
+                    pedido_uuid = payload.get("uuid")
+                    if not pedido_uuid:
+                        results.append({"outbox_id": int(ev.outbox_id), "ok": False, "error": "missing uuid"})
+                        continue
 
-                for it in itens:
-                    if not isinstance(it, dict):
+                    try:
+                        venda_uuid = uuid.UUID(str(pedido_uuid))
+                    except Exception:
+                        results.append({"outbox_id": int(ev.outbox_id), "ok": False, "error": "invalid uuid"})
                         continue
-                    produto_codigo = it.get("produto_codigo")
-                    produto_id = it.get("produto_id")
 
-                    produto_uuid = None
-                    if produto_id:
+                    chave_evento = (vendas_map, venda_uuid)
+                    venda_db = await _carregar(vendas_map, Venda, venda_uuid)
+
+                    total = float(payload.get("valor_total") or payload.get("total") or 0)
+                    created_at = _parse_dt(payload.get("created_at") or payload.get("data_inicio"))
+                    updated_at = _parse_dt(payload.get("updated_at"))
+
+                    mesa_id = payload.get("mesa_id")
+                    lugar_numero = payload.get("lugar_numero")
+                    status_payload = payload.get("status")
+
+                    tipo_pedido = payload.get("tipo_pedido")
+                    if not tipo_pedido:
+                        # Se não veio no payload, inferir pelo mesa_id
+                        tipo_pedido = "distancia" if mesa_id in (None, "", 0, "0") else "local"
+
+                    if venda_db is None:
+                        venda_db = Venda(
+                            id=venda_uuid,
+                            tenant_id=tenant_id,
+                            usuario_id=None,
+                            cliente_id=None,
+                            total=total,
+                            desconto=0.0,
+                            forma_pagamento=str(payload.get("forma_pagamento") or "dinheiro"),
+                            tipo_pedido=str(tipo_pedido) if tipo_pedido is not None else None,
+                            status_pedido=str(status_payload) if status_payload is not None else None,
+                            mesa_id=int(mesa_id) if mesa_id not in (None, "") else None,
+                            lugar_numero=int(lugar_numero) if lugar_numero not in (None, "") else None,
+                            observacoes=payload.get("observacao_cozinha") or payload.get("observacoes"),
+                            cancelada=False,
+                            created_at=created_at,
+                        )
+                        db.add(venda_db)
+                        await db.flush()
+                        vendas_map[venda_uuid] = venda_db
+                    else:
+                        # Atualizar campos principais (inclui mudança de status)
+                        venda_db.total = total
+                        if payload.get("forma_pagamento") is not None:
+                            venda_db.forma_pagamento = str(payload.get("forma_pagamento") or venda_db.forma_pagamento)
                         try:
-                            produto_uuid = uuid.UUID(str(produto_id))
+                            venda_db.tipo_pedido = str(tipo_pedido) if tipo_pedido is not None else venda_db.tipo_pedido
                         except Exception:
-                            produto_uuid = None
-
-                    if produto_uuid is None and produto_codigo:
+                            pass
                         try:
-                            res_p = await db.execute(
-                                select(Produto).where(
-                                    Produto.codigo == str(produto_codigo),
-                                    Produto.tenant_id == tenant_id,
-                                )
-                            )
-                            prod = res_p.scalar_one_or_none()
-                            if prod:
-                                produto_uuid = prod.id
+                            if status_payload is not None:
+                                venda_db.status_pedido = str(status_payload)
                         except Exception:
-                            produto_uuid = None
-
-                    if produto_uuid is None:
-                        continue
+                            pass
+                        try:
+                            venda_db.mesa_id = int(mesa_id) if mesa_id not in (None, "") else None
+                            venda_db.lugar_numero = int(lugar_numero) if lugar_numero not in (None, "") else None
+                        except Exception:
+                            pass
+                        try:
+                            venda_db.updated_at = updated_at or datetime.utcnow()
+                        except Exception:
+                            pass
 
-                    quantidade = int(it.get("quantidade") or 1)
-                    preco_unitario = float(it.get("preco_unitario") or it.get("produto_preco_venda") or 0)
-                    subtotal = float(it.get("subtotal") or (quantidade * preco_unitario))
-
-                    db.add(
-                        ItemVenda(
-                            venda_id=venda_db.id,
-                            produto_id=produto_uuid,
-                            quantidade=max(1, quantidade),
-                            peso_kg=float(it.get("peso_kg") or 0.0),
-                            preco_unitario=preco_unitario,
-                            subtotal=subtotal,
-                            taxa_iva=0.0,
-                            base_iva=subtotal,
-                            valor_iva=0.0,
-                        )
-                    )
+                    itens = payload.get("itens") or []
 
-                await db.commit()
-                results.append({"outbox_id": int(ev.outbox_id), "ok": True, "error": None})
-                continue
-
-            if entity == "cliente":
-                cli_id = _parse_uuid(payload.get("id") or payload.get("uuid"))
-                if cli_id is None:
-                    cli_id = uuid.uuid4()
-
-                res_cli = await db.execute(
-                    select(Cliente).where(Cliente.id == cli_id, Cliente.tenant_id == tenant_id)
-                )
-                cli_db = res_cli.scalar_one_or_none()
-
-                if cli_db is None:
-                    cli_db = Cliente(
-                        id=cli_id,
-                        tenant_id=tenant_id,
-                        nome=str(payload.get("nome") or "").strip() or "Cliente",
-                        documento=payload.get("documento"),
-                        telefone=payload.get("telefone"),
-                        endereco=payload.get("endereco"),
-                        ativo=bool(payload.get("ativo", True)),
-                    )
-                    db.add(cli_db)
-                else:
-                    # Upsert simples (LWW fica por conta do client por enquanto)
-                    if payload.get("nome") is not None:
-                        cli_db.nome = str(payload.get("nome") or cli_db.nome)
-                    if payload.get("documento") is not None:
-                        cli_db.documento = payload.get("documento")
-                    if payload.get("telefone") is not None:
-                        cli_db.telefone = payload.get("telefone")
-                    if payload.get("endereco") is not None:
-                        cli_db.endereco = payload.get("endereco")
-                    if payload.get("ativo") is not None:
-                        cli_db.ativo = bool(payload.get("ativo"))
-
-                await db.commit()
-                results.append({"outbox_id": int(ev.outbox_id), "ok": True, "error": None})
-                continue
+                    # IMPORTANTE: quando o POS envia snapshot do pedido (ex.: mudança de status),
+                    # os itens vêm completos. Se apenas inserirmos, duplicamos itens no acompanhamento.
+                    # Então fazemos replace: apagamos os itens atuais e inserimos os do payload.
+                    try:
+                        await db.execute(delete(ItemVenda).where(ItemVenda.venda_id == venda_db.id))
+                    except Exception:
+                        pass
 
-            if entity == "divida":
-                div_id = _parse_uuid(payload.get("id"))
-                if div_id is None:
-                    div_id = uuid.uuid4()
-
-                res_div = await db.execute(
-                    select(Divida)
-                    .options(selectinload(Divida.itens), selectinload(Divida.pagamentos))
-                    .where(Divida.id == div_id, Divida.tenant_id == tenant_id)
-                )
-                div_db = res_div.scalar_one_or_none()
-
-                cliente_id = _parse_uuid(payload.get("cliente_id"))
-                usuario_id = _parse_uuid(payload.get("usuario_id"))
-
-                if div_db is None:
-                    div_db = Divida(
-                        id=div_id,
-                        tenant_id=tenant_id,
-                        id_local=payload.get("id_local"),
-                        cliente_id=cliente_id,
-                        usuario_id=usuario_id,
-                        valor_total=float(payload.get("valor_total") or 0),
-                        valor_original=float(payload.get("valor_original") or 0),
-                        desconto_aplicado=float(payload.get("desconto_aplicado") or 0),
-                        percentual_desconto=float(payload.get("percentual_desconto") or 0),
-                        valor_pago=float(payload.get("valor_pago") or 0),
-                        status=str(payload.get("status") or "Pendente"),
-                        observacao=payload.get("observacao"),
-                    )
-                    db.add(div_db)
-                    await db.flush()
-                else:
-                    if payload.get("id_local") is not None:
-                        div_db.id_local = payload.get("id_local")
-                    if cliente_id is not None:
-                        div_db.cliente_id = cliente_id
-                    if usuario_id is not None:
-                        div_db.usuario_id = usuario_id
-                    if payload.get("valor_total") is not None:
-                        div_db.valor_total = float(payload.get("valor_total") or 0)
-                    if payload.get("valor_original") is not None:
-                        div_db.valor_original = float(payload.get("valor_original") or 0)
-                    if payload.get("desconto_aplicado") is not None:
-                        div_db.desconto_aplicado = float(payload.get("desconto_aplicado") or 0)
-                    if payload.get("percentual_desconto") is not None:
-                        div_db.percentual_desconto = float(payload.get("percentual_desconto") or 0)
-                    if payload.get("valor_pago") is not None:
-                        div_db.valor_pago = float(payload.get("valor_pago") or 0)
-                    if payload.get("status") is not None:
-                        div_db.status = str(payload.get("status") or div_db.status)
-                    if payload.get("observacao") is not None:
-                        div_db.observacao = payload.get("observacao")
-
-                # Itens e pagamentos (best-effort; idempotência por (divida_id, produto_id, subtotal))
-                itens = payload.get("itens") or []
-                if isinstance(itens, list):
+                    itens_rows: list[dict] = []
                     for it in itens:
                         if not isinstance(it, dict):
                             continue
-                        prod_uuid = _parse_uuid(it.get("produto_id"))
-                        if prod_uuid is None:
+                        produto_codigo = it.get("produto_codigo")
+                        produto_id = it.get("produto_id")
+
+                        produto_uuid = None
+                        if produto_id:
+                            try:
+                                produto_uuid = uuid.UUID(str(produto_id))
+                            except Exception:
+                                produto_uuid = None
+
+                        if produto_uuid is None and produto_codigo:
+                            produto_uuid = produto_por_codigo.get(str(produto_codigo))
+
+                        if produto_uuid is None:
                             continue
-                        # validar produto no tenant
-                        rp = await db.execute(
-                            select(Produto).where(Produto.id == prod_uuid, Produto.tenant_id == tenant_id)
+
+                        quantidade = int(it.get("quantidade") or 1)
+                        preco_unitario = float(it.get("preco_unitario") or it.get("produto_preco_venda") or 0)
+                        subtotal = float(it.get("subtotal") or (quantidade * preco_unitario))
+
+                        itens_rows.append(
+                            {
+                                "venda_id": venda_db.id,
+                                "produto_id": produto_uuid,
+                                "quantidade": max(1, quantidade),
+                                "peso_kg": float(it.get("peso_kg") or 0.0),
+                                "preco_unitario": preco_unitario,
+                                "subtotal": subtotal,
+                                "taxa_iva": 0.0,
+                                "base_iva": subtotal,
+                                "valor_iva": 0.0,
+                            }
                         )
-                        if rp.scalar_one_or_none() is None:
-                            continue
-                        db.add(
-                            ItemDivida(
-                                divida_id=div_db.id,
-                                produto_id=prod_uuid,
-                                quantidade=float(it.get("quantidade") or 0),
-                                preco_unitario=float(it.get("preco_unitario") or 0),
-                                subtotal=float(it.get("subtotal") or 0),
-                                peso_kg=float(it.get("peso_kg") or 0.0),
-                            )
+
+                    # Itens do pedido num único INSERT executemany (Core)
+                    if itens_rows:
+                        await db.flush()
+                        await db.execute(insert(ItemVenda), itens_rows)
+
+                    # flush antes do sucesso: o RELEASE do SAVEPOINT não pode mais falhar depois
+                    # do evento já ter sido reportado como ok
+                    await db.flush()
+                    results.append({"outbox_id": int(ev.outbox_id), "ok": True, "error": None})
+                    continue
+
+                if entity == "cliente":
+                    cli_id = _parse_uuid(payload.get("id") or payload.get("uuid"))
+                    if cli_id is None:
+                        cli_id = uuid.uuid4()
+
+                    chave_evento = (clientes_map, cli_id)
+                    cli_db = await _carregar(clientes_map, Cliente, cli_id)
+
+                    if cli_db is None:
+                        cli_db = Cliente(
+                            id=cli_id,
+                            tenant_id=tenant_id,
+                            nome=str(payload.get("nome") or "").strip() or "Cliente",
+                            documento=payload.get("documento"),
+                            telefone=payload.get("telefone"),
+                            endereco=payload.get("endereco"),
+                            ativo=bool(payload.get("ativo", True)),
                         )
+                        db.add(cli_db)
+                        await db.flush()
+                        clientes_map[cli_id] = cli_db
+                    else:
+                        # Upsert simples (LWW fica por conta do client por enquanto)
+                        if payload.get("nome") is not None:
+                            cli_db.nome = str(payload.get("nome") or cli_db.nome)
+                        if payload.get("documento") is not None:
+                            cli_db.documento = payload.get("documento")
+                        if payload.get("telefone") is not None:
+                            cli_db.telefone = payload.get("telefone")
+                        if payload.get("endereco") is not None:
+                            cli_db.endereco = payload.get("endereco")
+                        if payload.get("ativo") is not None:
+                            cli_db.ativo = bool(payload.get("ativo"))
 
-                pagamentos = payload.get("pagamentos") or []
-                if isinstance(pagamentos, list):
-                    for pg in pagamentos:
-                        if not isinstance(pg, dict):
-                            continue
-                        db.add(
-                            PagamentoDivida(
-                                divida_id=div_db.id,
-                                valor=float(pg.get("valor") or 0),
-                                forma_pagamento=str(pg.get("forma_pagamento") or ""),
-                                usuario_id=_parse_uuid(pg.get("usuario_id")),
-                            )
+                    await db.flush()
+                    results.append({"outbox_id": int(ev.outbox_id), "ok": True, "error": None})
+                    continue
+
+                if entity == "divida":
+                    div_id = _parse_uuid(payload.get("id"))
+                    if div_id is None:
+                        div_id = uuid.uuid4()
+
+                    chave_evento = (dividas_map, div_id)
+                    div_db = await _carregar(dividas_map, Divida, div_id)
+
+                    cliente_id = _parse_uuid(payload.get("cliente_id"))
+                    usuario_id = _parse_uuid(payload.get("usuario_id"))
+
+                    if div_db is None:
+                        div_db = Divida(
+                            id=div_id,
+                            tenant_id=tenant_id,
+                            id_local=payload.get("id_local"),
+                            cliente_id=cliente_id,
+                            usuario_id=usuario_id,
+                            valor_total=float(payload.get("valor_total") or 0),
+                            valor_original=float(payload.get("valor_original") or 0),
+                            desconto_aplicado=float(payload.get("desconto_aplicado") or 0),
+                            percentual_desconto=float(payload.get("percentual_desconto") or 0),
+                            valor_pago=float(payload.get("valor_pago") or 0),
+                            status=str(payload.get("status") or "Pendente"),
+                            observacao=payload.get("observacao"),
                         )
+                        db.add(div_db)
+                        await db.flush()
+                        dividas_map[div_id] = div_db
+                    else:
+                        if payload.get("id_local") is not None:
+                            div_db.id_local = payload.get("id_local")
+                        if cliente_id is not None:
+                            div_db.cliente_id = cliente_id
+                        if usuario_id is not None:
+                            div_db.usuario_id = usuario_id
+                        if payload.get("valor_total") is not None:
+                            div_db.valor_total = float(payload.get("valor_total") or 0)
+                        if payload.get("valor_original") is not None:
+                            div_db.valor_original = float(payload.get("valor_original") or 0)
+                        if payload.get("desconto_aplicado") is not None:
+                            div_db.desconto_aplicado = float(payload.get("desconto_aplicado") or 0)
+                        if payload.get("percentual_desconto") is not None:
+                            div_db.percentual_desconto = float(payload.get("percentual_desconto") or 0)
+                        if payload.get("valor_pago") is not None:
+                            div_db.valor_pago = float(payload.get("valor_pago") or 0)
+                        if payload.get("status") is not None:
+                            div_db.status = str(payload.get("status") or div_db.status)
+                        if payload.get("observacao") is not None:
+                            div_db.observacao = payload.get("observacao")
+
+                    # Itens e pagamentos (best-effort; idempotência por (divida_id, produto_id, subtotal))
+                    itens = payload.get("itens") or []
+                    if isinstance(itens, list):
+                        for it in itens:
+                            if not isinstance(it, dict):
+                                continue
+                            prod_uuid = _parse_uuid(it.get("produto_id"))
+                            if prod_uuid is None:
+                                continue
+                            # validar produto no tenant (ids pré-carregados para o lote)
+                            if prod_uuid not in produtos_validos:
+                                continue
+                            db.add(
+                                ItemDivida(
+                                    divida_id=div_db.id,
+                                    produto_id=prod_uuid,
+                                    quantidade=float(it.get("quantidade") or 0),
+                                    preco_unitario=float(it.get("preco_unitario") or 0),
+                                    subtotal=float(it.get("subtotal") or 0),
+                                    peso_kg=float(it.get("peso_kg") or 0.0),
+                                )
+                            )
+
+                    pagamentos = payload.get("pagamentos") or []
+                    if isinstance(pagamentos, list):
+                        for pg in pagamentos:
+                            if not isinstance(pg, dict):
+                                continue
+                            db.add(
+                                PagamentoDivida(
+                                    divida_id=div_db.id,
+                                    valor=float(pg.get("valor") or 0),
+                                    forma_pagamento=str(pg.get("forma_pagamento") or ""),
+                                    usuario_id=_parse_uuid(pg.get("usuario_id")),
+                                )
+                            )
 
-                await db.commit()
+                    await db.flush()
+                    results.append({"outbox_id": int(ev.outbox_id), "ok": True, "error": None})
+                    continue
+
+                # Entidade desconhecida: não bloquear o outbox.
                 results.append({"outbox_id": int(ev.outbox_id), "ok": True, "error": None})
                 continue
 
-            # Entidade desconhecida: não bloquear o outbox.
-            results.append({"outbox_id": int(ev.outbox_id), "ok": True, "error": None})
-            continue
-
         except Exception as e:
-            try:
-                await db.rollback()
-            except Exception:
-                pass
+            # O SAVEPOINT do evento já foi desfeito; os eventos anteriores continuam na transação.
+            # O objeto do evento pode ter sido descartado/expirado: a próxima consulta o relê.
+            if chave_evento is not None:
+                chave_evento[0].pop(chave_evento[1], None)
             results.append({"outbox_id": int(ev.outbox_id), "ok": False, "error": str(e)})
 
+    try:
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        # Nada do lote foi gravado: nenhum evento pode ser confirmado ao outbox do cliente
+        results = [
+            {"outbox_id": r["outbox_id"], "ok": False, "error": r["error"] or str(e)} for r in results
+        ]
+
     return {"results": results}
 
 @router.get("/sync/pull")
@@ -429,13 +524,14 @@ async def pull_changes(
             except Exception:
                 continue
 
-    produtos_map: dict[str, dict] = {}
+    # Chave UUID (hash nativo), sem str() de cada id para indexar/consultar o mapa
+    produtos_map: dict[uuid.UUID, dict] = {}
     if produto_ids:
         res_p = await db.execute(
             select(Produto).where(Produto.id.in_(list(produto_ids)), Produto.tenant_id == tenant_id)
         )
         for p in res_p.scalars().all() or []:
-            produtos_map[str(p.id)] = {
+            produtos_map[p.id] = {
                 "codigo": getattr(p, "codigo", None),
                 "nome": getattr(p, "nome", None),
                 "preco_venda": float(getattr(p, "preco_venda", 0) or 0),
@@ -456,8 +552,8 @@ async def pull_changes(
 
         itens_out: list[dict] = []
         for it in (getattr(v, "itens", None) or []):
+            pm = produtos_map.get(it.produto_id) or {}
             pid = str(getattr(it, "produto_id", ""))
-            pm = produtos_map.get(pid) or {}
 
             item_uuid = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{v_id}:{pid}"))
 
@@ -573,13 +669,13 @@ async def pull_changes(
                 div_prod_ids.add(it.produto_id)
             except Exception:
                 continue
-    div_prod_map: dict[str, dict] = {}
+    div_prod_map: dict[uuid.UUID, dict] = {}
     if div_prod_ids:
         rp2 = await db.execute(
             select(Produto).where(Produto.id.in_(list(div_prod_ids)), Produto.tenant_id == tenant_id)
         )
         for p in rp2.scalars().all() or []:
-            div_prod_map[str(p.id)] = {
+            div_prod_map[p.id] = {
                 "codigo": getattr(p, "codigo", None),
                 "nome": getattr(p, "nome", None),
                 "preco_venda": float(getattr(p, "preco_venda", 0) or 0),
@@ -596,8 +692,8 @@ async def pull_changes(
 
         itens = []
         for it in (getattr(d, "itens", None) or []):
+            pm = div_prod_map.get(it.produto_id) or {}
             pid = str(getattr(it, "produto_id", ""))
-            pm = div_prod_map.get(pid) or {}
             itens.append(
                 {
                     "produto_id": pid,
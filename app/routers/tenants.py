@@ -8,6 +8,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 
 from app.core.deps import get_current_admin_user
+from app.core.menu_cache import menu_cache_invalidate
+from app.core.tenant_cache import tenant_cache_invalidate
 from app.db.database import get_db_session
 from app.db.models import Tenant
 
@@ -89,6 +91,8 @@ async def create_tenant(
     )
     db.add(tenant)
     await db.commit()
+    tenant_cache_invalidate(tid)
+    menu_cache_invalidate(tid)
     await db.refresh(tenant)
     return TenantResponse(
         id=str(tenant.id),
@@ -135,6 +139,8 @@ async def update_tenant(
 
     db.add(tenant)
     await db.commit()
+    tenant_cache_invalidate(tid)
+    menu_cache_invalidate(tid)
     await db.refresh(tenant)
     return TenantResponse(
         id=str(tenant.id),
@@ -186,6 +192,8 @@ async def delete_tenant(
     try:
         await db.execute(delete(Tenant).where(Tenant.id == tid))
         await db.commit()
+        tenant_cache_invalidate(tid)
+        menu_cache_invalidate(tid)
         return resp
     except IntegrityError:
         await db.rollback()
@@ -8,7 +8,7 @@ from datetime import datetime
 
 from ..db.database import get_db_session
 from sqlalchemy.exc import IntegrityError
-from app.db.models import Produto, Venda, ItemVenda, User
+from app.db.models import Produto, Venda, ItemVenda, User, normalizar_status_pedido
 from app.core.realtime import manager as realtime_manager
 from ..schemas.venda import VendaCreate, VendaUpdate, VendaResponse
 from ..core.deps import get_tenant_id, get_current_user
@@ -288,7 +288,7 @@ async def atualizar_venda(
         if getattr(venda, 'tipo_pedido', None) is not None:
             update_data[Venda.tipo_pedido] = venda.tipo_pedido
         if getattr(venda, 'status_pedido', None) is not None:
-            update_data[Venda.status_pedido] = venda.status_pedido
+            update_data[Venda.status_pedido] = normalizar_status_pedido(venda.status_pedido)
         if getattr(venda, 'mesa_id', None) is not None:
             update_data[Venda.mesa_id] = venda.mesa_id
         if getattr(venda, 'lugar_numero', None) is not None:
@@ -484,7 +484,7 @@ async def listar_vendas_periodo(
         stmt = stmt.where(
             or_(
                 Venda.status_pedido.is_(None),
-                func.lower(func.coalesce(Venda.status_pedido, "")) == "pago",
+                Venda.status_pedido == "pago",
             )
         )
 